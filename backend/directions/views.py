@@ -21,6 +21,9 @@ from decimal import Decimal # Decimal ile karşılaştırma için eklendi
 import networkx as nx # networkx import edildi
 import osmnx as ox # osmnx import edildi
 from geopy.distance import great_circle # Heuristic için eklendi
+from routing.geometry import GEOMETRY_FORMATS, format_geometry # Rota geometri formatları
+from routing.overlay import overlay_store # Canlı yol kapatma / hız katmanı
+from routing.metrics import SearchStats, record_search, record_search_run # Arama metrikleri
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -119,11 +122,20 @@ def distance_heuristic(u, v, graph, mode='driving'):
 WALKING_SPEED_MPS = 1.39 # Yaklaşık 5 km/h (metre/saniye)
 CYCLING_SPEED_MPS = 4.17 # Yaklaşık 15 km/h (metre/saniye)
 
-def calculate_travel_time(u, v, edge_data, mode='driving'):
+def calculate_travel_time(u, v, edge_data, mode='driving', overlay=None):
     """Kenar için seyahat süresini moda göre hesaplar."""
     length_meters = edge_data.get('length')
     if length_meters is None:
         return float('inf') # Uzunluk yoksa bu yolu kullanma
+
+    # Canlı katman: kapalı yollar kullanılamaz, hız geçersiz kılmaları sürüşte uygulanır
+    if overlay is not None and not overlay.is_empty:
+        osm_id = edge_data.get('osmid')
+        if overlay.is_closed(osm_id, u, v):
+            return float('inf')
+        override_kph = overlay.speed_for(osm_id, u, v) if mode == 'driving' else None
+        if override_kph:
+            return length_meters / (override_kph * 1000 / 3600)
     
     if mode == 'walking':
         # Uzunluk / yürüme hızı (m/s)
@@ -167,6 +179,8 @@ class DirectionsView(APIView):
         avoid_multiplier = 1.0  # Varsayılan
         area_preferences = [] # Alan tercihleri listesi
         road_preferences = {} # Yol ID'sine göre tercih tipi (hızlı erişim için dict)
+        search_stats = SearchStats() # Sorgu başına arama istatistikleri
+        search_stats.heap_peak = None # networkx öncelik kuyruğunu dışarı açmıyor
         
         try:
             # Extract coordinates from request
@@ -177,6 +191,9 @@ class DirectionsView(APIView):
             departure_time_str = request.data.get('departure_time') # İleride kullanılabilir
             # Başlangıçta seçilen mod önemli
             initial_transport_mode = request.data.get('transport_mode', 'driving') 
+            # Geometri çıktı formatı (geojson, polyline5, polyline6, simplified)
+            geometry_format = request.data.get('geometry_format', 'geojson')
+            zoom = request.data.get('zoom')
             
             # --- Parametre Kontrolleri --- 
             if not start_coords or not end_coords:
@@ -188,6 +205,13 @@ class DirectionsView(APIView):
                 return Response({"error": "Invalid start coordinate format"}, status=status.HTTP_400_BAD_REQUEST)
             if not isinstance(end_coords, dict) or 'lat' not in end_coords or 'lng' not in end_coords:
                  return Response({"error": "Invalid end coordinate format"}, status=status.HTTP_400_BAD_REQUEST)
+            if geometry_format not in GEOMETRY_FORMATS:
+                return Response({"error": f"Invalid geometry_format, expected one of {', '.join(GEOMETRY_FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+            if zoom is not None:
+                try:
+                    zoom = float(zoom)
+                except (TypeError, ValueError):
+                    return Response({"error": "Invalid zoom level"}, status=status.HTTP_400_BAD_REQUEST)
 
             logger.info(f"Route requested from {start_coords} to {end_coords} via {initial_transport_mode}")
 
@@ -222,11 +246,15 @@ class DirectionsView(APIView):
             # --- A* Rota Hesaplama Mantığı --- 
             # 1. Yol ağını yükle
             graph = load_graph_once() 
+            # Sorgu boyunca aynı katman sürümünü kullan (yeni güncellemeler sonraki sorgulara yansır)
+            overlay = overlay_store.current()
             if graph is None: return Response({"error": "Road network graph is not loaded. Please check server logs."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
             # 2. Başlangıç/Bitiş noktalarına en yakın graf düğümlerini bul
+            snap_start = time.perf_counter()
             start_node = ox.nearest_nodes(graph, start_coords['lng'], start_coords['lat'])
             end_node = ox.nearest_nodes(graph, end_coords['lng'], end_coords['lat'])
+            search_stats.snap_time = time.perf_counter() - snap_start
             logger.info(f"Nearest nodes found: Start={start_node}, End={end_node}")
             
             # ---- Tüm Modlar İçin Süre Hesaplama ----
@@ -236,14 +264,33 @@ class DirectionsView(APIView):
             
             for mode in relevant_modes:
                 logger.info(f"Calculating duration for mode: {mode}")
-                # 3. Güncellenmiş Ağırlık Fonksiyonu
+                # Her A* çalıştırması metriklere ayrı bir arama olarak kaydedilir
+                mode_stats = SearchStats()
+                mode_stats.heap_peak = None # networkx öncelik kuyruğunu dışarı açmıyor
+                # networkx her kuyruktan çıkan düğümün komşuları için ağırlık fonksiyonunu çağırır
+                expanded_nodes = set()
+                # networkx'in bilinen en iyi maliyetlerinin kopyası; astar.py gibi yalnızca maliyeti iyileşen kenarlar sayılır
+                tentative = {start_node: 0.0}
+
                 def weight_wrapper(u, v, edge_attr_dict):
+                    expanded_nodes.add(u)
+                    cost = edge_cost(u, v, edge_attr_dict)
+                    if cost is not None:
+                        new_cost = tentative[u] + cost
+                        if v not in tentative or new_cost < tentative[v]:
+                            tentative[v] = new_cost
+                            mode_stats.edges_relaxed += 1
+                    return cost
+
+                # 3. Güncellenmiş Ağırlık Fonksiyonu
+                def edge_cost(u, v, edge_attr_dict):
                     edge_data = edge_attr_dict[0] # Genellikle ilk kenar verisi kullanılır
-                    base_travel_time = calculate_travel_time(u, v, edge_data, mode=mode)
+                    base_travel_time = calculate_travel_time(u, v, edge_data, mode=mode, overlay=overlay)
                     
-                    # Başlangıçta maliyet sonsuzsa, daha fazla hesaplama yapma
+                    # Başlangıçta maliyet sonsuzsa (örn. kapalı yol), kenarı gizle
+                    # networkx None dönen kenarları arama sırasında yok sayar
                     if base_travel_time == float('inf'):
-                        return float('inf')
+                        return None
 
                     multiplier = 1.0
                     osm_id = edge_data.get('osmid')
@@ -309,11 +356,20 @@ class DirectionsView(APIView):
                 
                 # 4. Heuristic fonksiyonu (moda göre)
                 def heuristic_wrapper(u, v):
-                    return distance_heuristic(u, v, graph, mode=mode)
+                    h_start = time.perf_counter()
+                    estimate = distance_heuristic(u, v, graph, mode=mode)
+                    mode_stats.heuristic_time += time.perf_counter() - h_start
+                    return estimate
                 
                 try:
                     # 5. A* algoritmasını çalıştır
-                    path_nodes = nx.astar_path(graph, start_node, end_node, heuristic=heuristic_wrapper, weight=weight_wrapper)
+                    search_start = time.perf_counter()
+                    try:
+                        path_nodes = nx.astar_path(graph, start_node, end_node, heuristic=heuristic_wrapper, weight=weight_wrapper)
+                    finally:
+                        search_stats.search_time += time.perf_counter() - search_start
+                        mode_stats.nodes_popped = len(expanded_nodes)
+                        record_search_run(mode_stats, engine='networkx', stats=search_stats)
                     
                     # Başlangıç modu için rota düğümlerini sakla (geometri için)
                     if mode == initial_transport_mode:
@@ -325,7 +381,7 @@ class DirectionsView(APIView):
                     for u, v in zip(path_nodes[:-1], path_nodes[1:]):
                         edge_data = graph.get_edge_data(u, v, key=0)
                         if edge_data:
-                            duration += calculate_travel_time(u, v, edge_data, mode=mode) 
+                            duration += calculate_travel_time(u, v, edge_data, mode=mode, overlay=overlay)
                         else:
                             logger.warning(f"Edge data not found between nodes {u} and {v} for mode {mode}")
                             duration = float('inf') # Hata durumunda süreyi sonsuz yap
@@ -355,10 +411,9 @@ class DirectionsView(APIView):
                 return Response({"error": f"Could not calculate route for the selected mode ({initial_transport_mode})"}, status=status.HTTP_404_NOT_FOUND)
             
             # 6. Sonucu (geometri, süreler, mesafe) formatla
-            route_geometry = {
-                "type": "LineString",
-                "coordinates": [ [graph.nodes[node]['x'], graph.nodes[node]['y']] for node in route_nodes ]
-            }
+            post_start = time.perf_counter()
+            route_coords = [(graph.nodes[node]['y'], graph.nodes[node]['x']) for node in route_nodes]
+            route_geometry = format_geometry(route_coords, geometry_format, zoom=zoom)
             
             # Toplam mesafeyi hesapla (geometriyi oluşturan rotaya göre)
             total_distance = 0
@@ -405,7 +460,7 @@ class DirectionsView(APIView):
                     route_steps.append({
                         'instruction': instruction,
                         'distance': step_distance,
-                        'duration': calculate_travel_time(u, v, edge_data, mode=initial_transport_mode),
+                        'duration': calculate_travel_time(u, v, edge_data, mode=initial_transport_mode, overlay=overlay),
                         'maneuver': maneuver
                     })
 
@@ -420,16 +475,24 @@ class DirectionsView(APIView):
             route_response = {
                 "routes": [{
                     "geometry": route_geometry,
+                    "geometry_format": geometry_format,
                     "legs": [], # Legs şimdilik boş
                     "duration": all_durations.get(initial_transport_mode), 
                     "distance": total_distance,
                     "durations_by_mode": all_durations,
                     "steps": route_steps  # Adımları ekle
-                }]
+                }],
+                "graph_version": overlay.version # Türetilmiş önbellekler için graf sürümü
             }
             # ---------------------------------------------------
-
-            return Response(route_response, status=status.HTTP_200_OK)
+            search_stats.postprocess_time = time.perf_counter() - post_start
+            record_search(search_stats, engine='networkx')
+
+            response = Response(route_response, status=status.HTTP_200_OK)
+            # İstenirse sorgu istatistiklerini hata ayıklama başlığına ekle
+            if request.headers.get('X-Debug-Search-Stats'):
+                response['X-Search-Stats'] = search_stats.to_header()
+            return response
             
         except nx.NetworkXNoPath:
              logger.warning(f"No path found between requested points") # Düğüm ID'leri artık burada yok
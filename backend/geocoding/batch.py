@@ -0,0 +1,162 @@
+"""
+Batch geocoding of address lists (pharmacy ingestion, favorites imports).
+
+Addresses are normalized and deduplicated first, so every distinct address
+is resolved once however often it appears. Each distinct address is then
+tried against the local OSM address index (exact street and house number
+matches only) and the geocode cache, and only what is left goes to HERE.
+HERE calls run on a small thread pool and draw from a token bucket shared
+by all workers, so a batch cannot exceed the API's request rate. Results
+are yielded as they finish, not in input order; each one carries the
+index of the input address it answers.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import requests
+from django.conf import settings
+from routing.metrics import registry as metrics_registry
+from .cache import GeocodeCache, geocode_cache, normalize_query
+from .ratelimit import FileTokenBucket
+
+logger = logging.getLogger(__name__)
+
+HERE_BUCKET_FILE = os.environ.get(
+    'HERE_BUCKET_FILE',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'here_bucket.json')
+)
+# HERE requests per second across all workers, and the longest one batch item waits for a token
+HERE_RATE = float(os.environ.get('HERE_RATE', 5))
+HERE_MAX_WAIT = 30.0
+HERE_TIMEOUT = 10
+
+# Concurrent HERE calls per batch, and the most addresses accepted in one batch
+BATCH_WORKERS = 8
+MAX_BATCH_ADDRESSES = 500
+
+# Parameters of every batch request; part of the cache key, so batch and GeocodeView entries are separate
+BATCH_PARAMS = {'lang': 'tr', 'limit': 1, 'in': 'countryCode:TUR'}
+
+_batch_results = metrics_registry.counter(
+    'geocode_batch_results_total', 'Distinct batch geocoding addresses by where the answer came from')
+
+def _here_fetch(query: str) -> Tuple[int, Any]:
+    response = requests.get(
+        settings.HERE_API_BASE_URL,
+        params={**BATCH_PARAMS, 'q': query, 'apiKey': settings.HERE_API_KEY},
+        timeout=HERE_TIMEOUT
+    )
+    if response.status_code != 200:
+        return response.status_code, response.text
+    return response.status_code, response.json()
+
+class BatchGeocoder:
+    """
+    Resolves lists of addresses through the local index, the geocode cache
+    and rate-limited, concurrent HERE calls.
+
+    local is an OSMGeocoder (or None to skip the local index); fetch(query)
+    performs one HERE call and returns (status code, body).
+    """
+
+    def __init__(self, local=None, cache: GeocodeCache = geocode_cache, bucket: FileTokenBucket = None,
+                 fetch: Callable[[str], Tuple[int, Any]] = _here_fetch, workers: int = BATCH_WORKERS,
+                 max_wait: float = HERE_MAX_WAIT):
+        self.local = local
+        self.cache = cache
+        self.bucket = bucket or FileTokenBucket(HERE_BUCKET_FILE, HERE_RATE, capacity=HERE_RATE)
+        self.fetch = fetch
+        self.workers = workers
+        self.max_wait = max_wait
+
+    def _resolve_local(self, query: str) -> Optional[Dict]:
+        if self.local is None:
+            return None
+        results = self.local.search(query, 1)
+        # Only a matching street and house number is trusted; anything looser goes to HERE
+        if not results or results[0]['type'] != 'exact_address':
+            return None
+        best = results[0]
+        return {'status': 'ok', 'lat': best['lat'], 'lon': best['lon'], 'label': best['full_address'],
+                'source': 'local'}
+
+    def _resolve_remote(self, query: str) -> Dict:
+        def fetch() -> Tuple[int, Any]:
+            if not self.bucket.acquire(self.max_wait):
+                return 429, "Rate limit reached"
+            return self.fetch(query)
+
+        try:
+            status_code, body, source = self.cache.get_or_fetch(query, BATCH_PARAMS, fetch)
+        except Exception as e:
+            # Request errors quote the URL, API key included, so only the type goes to the client
+            logger.warning(f"Batch geocoding failed for {query!r}: {type(e).__name__}")
+            return {'status': 'error', 'error': f"HERE request failed ({type(e).__name__})", 'source': 'here'}
+        finally:
+            if self.cache.use_database:
+                # Pool threads outlive the request, so close their connection here
+                from django.db import connection
+                connection.close()
+        source = 'here' if source == 'upstream' else source
+        if status_code != 200:
+            return {'status': 'error', 'error': f"HERE API error {status_code}", 'source': source}
+        items = body.get('items') or []
+        position = items[0].get('position') if items else None
+        if not position:
+            return {'status': 'not_found', 'source': source}
+        return {'status': 'ok', 'lat': position['lat'], 'lon': position['lng'],
+                'label': items[0].get('address', {}).get('label') or items[0].get('title'), 'source': source}
+
+    def geocode(self, addresses: List[str]) -> Iterator[Dict]:
+        """
+        Yield one result per input address as soon as it is known:
+        {'index', 'query', 'status', 'source', and 'lat', 'lon', 'label' when
+        status is 'ok'}. status is 'ok', 'not_found', 'invalid' or 'error'.
+        """
+        groups: Dict[str, List[int]] = {}  # normalized address -> input indexes
+        for index, address in enumerate(addresses):
+            key = normalize_query(address) if isinstance(address, str) else ''
+            if not key:
+                yield {'index': index, 'query': address, 'status': 'invalid', 'source': None}
+                continue
+            groups.setdefault(key, []).append(index)
+
+        def expand(key: str, result: Dict) -> Iterator[Dict]:
+            _batch_results.inc(source=result['source'])
+            for index in groups[key]:
+                yield {'index': index, 'query': addresses[index], **result}
+
+        remote = []
+        for key, indexes in groups.items():
+            result = self._resolve_local(addresses[indexes[0]])
+            if result is not None:
+                yield from expand(key, result)
+            else:
+                remote.append(key)
+        if not remote:
+            return
+
+        executor = ThreadPoolExecutor(max_workers=min(self.workers, len(remote)))
+        try:
+            futures = {executor.submit(self._resolve_remote, addresses[groups[key][0]]): key for key in remote}
+            for future in as_completed(futures):
+                yield from expand(futures[future], future.result())
+        finally:
+            # A client that disconnects closes the generator; drop what has not started
+            executor.shutdown(wait=False, cancel_futures=True)
+
+def summarize(results: List[Dict], elapsed: float) -> Dict:
+    """Closing NDJSON line of a batch: counts per status and source."""
+    statuses: Dict[str, int] = {}
+    sources: Dict[str, int] = {}
+    for result in results:
+        statuses[result['status']] = statuses.get(result['status'], 0) + 1
+        if result['source']:
+            sources[result['source']] = sources.get(result['source'], 0) + 1
+    return {'done': True, 'count': len(results), 'statuses': statuses, 'sources': sources,
+            'seconds': round(elapsed, 3)}
+
+def geocode_addresses(addresses: List[str], local=None) -> List[Dict]:
+    """Geocode a list in one call; results come back in input order."""
+    return sorted(BatchGeocoder(local=local).geocode(addresses), key=lambda result: result['index'])
@@ -0,0 +1,163 @@
+"""
+Accuracy and latency benchmark for the geocoding engines.
+
+The corpus (benchmark_queries.json) is a curated list of Ankara queries in
+five categories (address, street, neighborhood, poi, typo), each with an
+expected location and a tolerance in meters. The expected locations are
+approximate, so the tolerances are generous for long streets and large
+neighborhoods. An engine is any function (query, limit) -> results with
+lat and lon; per engine the benchmark reports recall@k (share of queries
+with a result within tolerance among the top k), the mean distance of the
+top result from the expected location, and p50/p99 latency.
+
+HERE and Nominatim are replaced by StandInProvider, which answers corpus
+queries offline with a set latency, positional noise and miss rate. The
+federated numbers therefore measure merging and the deadline, not the
+accuracy of the real providers.
+
+Run it with: python manage.py benchmark_geocoders
+"""
+import json
+import math
+import os
+import random
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+from routing.astar import haversine_distance
+from .cache import normalize_query
+from .federated import FEDERATED_DEADLINE, UNSCORED_CONFIDENCE, FederatedGeocoder, local_provider
+
+CORPUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_queries.json')
+CATEGORIES = ('address', 'street', 'neighborhood', 'poi', 'typo')
+DEFAULT_K = (1, 5)
+
+# Stand-in latency (seconds), noise (meters) and miss rate, roughly what the real services show
+HERE_STAND_IN = {'latency': 0.15, 'noise': 30.0, 'miss_rate': 0.05}
+NOMINATIM_STAND_IN = {'latency': 0.4, 'noise': 80.0, 'miss_rate': 0.2}
+
+Engine = Callable[[str, int], List[Dict]]
+
+def load_corpus(path: str = CORPUS_FILE) -> List[Dict]:
+    """Corpus entries: query, category, lat, lon and tolerance (meters)."""
+    with open(path, encoding='utf-8') as f:
+        corpus = json.load(f)
+    if not isinstance(corpus, list) or not corpus:
+        raise ValueError("Corpus must be a non-empty list of queries")
+    for entry in corpus:
+        missing = {'query', 'category', 'lat', 'lon', 'tolerance'} - entry.keys()
+        if missing:
+            raise ValueError(f"Corpus entry {entry!r} is missing {', '.join(sorted(missing))}")
+    return corpus
+
+def percentile(values: Sequence[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile; None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+class StandInProvider:
+    """
+    Offline replacement for a remote geocoder. Answers a corpus query with
+    its expected location moved up to noise meters in a random direction,
+    after sleeping latency seconds; a miss_rate share of the queries gets no
+    answer. Randomness is seeded per query, so runs are repeatable.
+    """
+
+    def __init__(self, corpus: Iterable[Dict], latency: float = 0.0, noise: float = 0.0,
+                 miss_rate: float = 0.0, seed: int = 0):
+        self.answers = {normalize_query(entry['query']): entry for entry in corpus}
+        self.latency = latency
+        self.noise = noise
+        self.miss_rate = miss_rate
+        self.seed = seed
+
+    def __call__(self, query: str, limit: int) -> List[Dict]:
+        if self.latency:
+            time.sleep(self.latency)
+        entry = self.answers.get(normalize_query(query))
+        rng = random.Random(f"{self.seed}:{normalize_query(query)}")
+        if entry is None or rng.random() < self.miss_rate:
+            return []
+        distance, bearing = rng.uniform(0, self.noise), rng.uniform(0, 2 * math.pi)
+        lat = entry['lat'] + distance * math.cos(bearing) / 111_320
+        lon = entry['lon'] + distance * math.sin(bearing) / (111_320 * math.cos(math.radians(entry['lat'])))
+        return [{'name': entry['query'], 'lat': lat, 'lon': lon, 'type': 'stand-in',
+                 'confidence': UNSCORED_CONFIDENCE}]
+
+def benchmark_engine(engine: Engine, corpus: List[Dict], ks: Sequence[int] = DEFAULT_K,
+                     repeat: int = 1) -> Dict:
+    """Run every corpus query through one engine and summarize accuracy and latency."""
+    limit = max(ks)
+    latencies: List[float] = []
+    errors: List[float] = []
+    by_category: Dict[str, Dict] = {}
+    hits = {k: 0 for k in ks}
+    empty = 0
+
+    for entry in corpus:
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            results = engine(entry['query'], limit)
+            latencies.append(time.perf_counter() - start_time)
+
+        category = by_category.setdefault(entry['category'], {'queries': 0, **{f'recall@{k}': 0 for k in ks}})
+        category['queries'] += 1
+        distances = [haversine_distance(entry['lat'], entry['lon'], result['lat'], result['lon']) * 1000
+                     for result in results[:limit]]
+        if not distances:
+            empty += 1
+            continue
+        errors.append(distances[0])
+        for k in ks:
+            if any(distance <= entry['tolerance'] for distance in distances[:k]):
+                hits[k] += 1
+                category[f'recall@{k}'] += 1
+
+    for category in by_category.values():
+        for k in ks:
+            category[f'recall@{k}'] = round(category[f'recall@{k}'] / category['queries'], 3)
+    p50, p99 = percentile(latencies, 0.5), percentile(latencies, 0.99)
+    return {
+        'queries': len(corpus),
+        **{f'recall@{k}': round(hits[k] / len(corpus), 3) if corpus else None for k in ks},
+        'mean_error_m': round(sum(errors) / len(errors), 1) if errors else None,
+        'no_result': empty,
+        'p50_ms': round(p50 * 1000, 2) if p50 is not None else None,
+        'p99_ms': round(p99 * 1000, 2) if p99 is not None else None,
+        'by_category': by_category,
+    }
+
+def run_benchmark(engines: Dict[str, Engine], corpus: List[Dict], ks: Sequence[int] = DEFAULT_K,
+                  repeat: int = 1) -> Dict[str, Dict]:
+    return {name: benchmark_engine(engine, corpus, ks, repeat) for name, engine in engines.items()}
+
+def default_engines(geocoder, corpus: List[Dict], deadline: float = FEDERATED_DEADLINE) -> Dict[str, Engine]:
+    """The local index, autocomplete and federated search with stand-ins for HERE and Nominatim."""
+    federated = FederatedGeocoder(local_provider(geocoder), {
+        'here': StandInProvider(corpus, seed=1, **HERE_STAND_IN),
+        'nominatim': StandInProvider(corpus, seed=2, **NOMINATIM_STAND_IN),
+    })
+    return {
+        'local': lambda query, limit: geocoder.address_index.search(query, limit),
+        'autocomplete': geocoder.autocomplete,
+        'federated': lambda query, limit: federated.search(query, limit, deadline)['results'],
+    }
+
+def format_report(report: Dict[str, Dict], ks: Sequence[int] = DEFAULT_K) -> str:
+    """Plain-text table: one row per engine, then per-category recall."""
+    recall_columns = [f'recall@{k}' for k in ks]
+    columns = recall_columns + ['mean_error_m', 'no_result', 'p50_ms', 'p99_ms']
+    lines = ['engine'.ljust(14) + ''.join(column.rjust(14) for column in columns)]
+    for name, summary in report.items():
+        cells = ['-' if summary[column] is None else str(summary[column]) for column in columns]
+        lines.append(name.ljust(14) + ''.join(cell.rjust(14) for cell in cells))
+    lines.append('')
+    lines.append('engine'.ljust(14) + 'category'.ljust(14) + ''.join(column.rjust(14) for column in recall_columns))
+    for name, summary in report.items():
+        for category in CATEGORIES:
+            if category in summary['by_category']:
+                row = summary['by_category'][category]
+                lines.append(name.ljust(14) + category.ljust(14) +
+                             ''.join(str(row[column]).rjust(14) for column in recall_columns))
+    return '\n'.join(lines)
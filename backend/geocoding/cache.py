@@ -0,0 +1,230 @@
+"""
+Response cache and request coalescing for the HERE geocode proxy.
+
+Lookups go through three layers: a per-process LRU, the shared
+GeocodeCacheEntry table, and finally HERE itself. Identical misses that
+arrive while an upstream call is in flight wait for that call instead of
+starting their own. Hit ratio and upstream latency are exported through
+the routing metrics registry (/api/routing/metrics/).
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+from routing.metrics import registry as metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# Seconds a cached response stays valid, and entries kept per process
+GEOCODE_CACHE_TTL = int(os.environ.get('GEOCODE_CACHE_TTL', 7 * 24 * 3600))
+GEOCODE_CACHE_SIZE = int(os.environ.get('GEOCODE_CACHE_SIZE', 2048))
+# Seconds between deletions of expired GeocodeCacheEntry rows, per process
+GEOCODE_CACHE_PURGE_INTERVAL = int(os.environ.get('GEOCODE_CACHE_PURGE_INTERVAL', 3600))
+
+_cache_requests = metrics_registry.counter(
+    'geocode_cache_requests_total', 'HERE geocode lookups by the layer that answered them')
+_coalesced_requests = metrics_registry.counter(
+    'geocode_coalesced_requests_total', 'HERE geocode misses that waited for an identical in-flight call')
+_upstream_latency = metrics_registry.histogram(
+    'geocode_upstream_seconds', 'Latency of HERE geocode API calls')
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive form of a search text."""
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', query)).strip().lower()
+
+def cache_key(query: str, params: Dict[str, Any]) -> str:
+    """Hash of the normalized query and the other request parameters (the API key excluded)."""
+    options = {name: str(value) for name, value in params.items() if name not in ('q', 'apiKey')}
+    payload = json.dumps([normalize_query(query), options], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class LRUCache:
+    """Thread-safe least recently used cache whose entries expire after ttl seconds."""
+
+    def __init__(self, maxsize: int = GEOCODE_CACHE_SIZE, ttl: float = GEOCODE_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()  # key -> (expires, value)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: Any, ttl: float = None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Callers that arrive while a call
+    is running wait for it and get its result (or its exception).
+    """
+
+    class _Call:
+        __slots__ = ('done', 'result', 'error')
+
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error: Optional[BaseException] = None
+
+    def __init__(self):
+        self._calls: Dict[str, 'SingleFlight._Call'] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Return (result, shared); shared is True when another caller's call was reused."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+class GeocodeCache:
+    """Memory, database and upstream layers for HERE geocode responses."""
+
+    def __init__(self, ttl: float = GEOCODE_CACHE_TTL, maxsize: int = GEOCODE_CACHE_SIZE, use_database: bool = True):
+        self.ttl = ttl
+        self.memory = LRUCache(maxsize, ttl)
+        self.flights = SingleFlight()
+        self.use_database = use_database
+        # Monotonic time of the last purge of expired rows; the first write purges
+        self._purged_at: Optional[float] = None
+        self._purge_lock = threading.Lock()
+
+    def _load(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Unexpired (response, seconds left) from the shared table, if any."""
+        if not self.use_database:
+            return None
+        from django.db import DatabaseError
+        from django.utils import timezone
+        from .models import GeocodeCacheEntry
+        try:
+            entry = GeocodeCacheEntry.objects.filter(key=key, expires_at__gt=timezone.now()).first()
+        except DatabaseError as e:
+            logger.warning(f"Geocode cache table unavailable: {e}")
+            return None
+        if entry is None:
+            return None
+        return entry.response, (entry.expires_at - timezone.now()).total_seconds()
+
+    def _store(self, key: str, query: str, response: Any):
+        if not self.use_database:
+            return
+        from django.db import DatabaseError
+        from django.utils import timezone
+        from .models import GeocodeCacheEntry
+        try:
+            GeocodeCacheEntry.objects.update_or_create(key=key, defaults={
+                'query': normalize_query(query),
+                'response': response,
+                'expires_at': timezone.now() + timedelta(seconds=self.ttl),
+            })
+        except DatabaseError as e:
+            logger.warning(f"Could not store geocode cache entry: {e}")
+            return
+        # Expired rows are never read again, so writes clear them out now and then
+        with self._purge_lock:
+            now = time.monotonic()
+            due = self._purged_at is None or now - self._purged_at >= GEOCODE_CACHE_PURGE_INTERVAL
+            if due:
+                self._purged_at = now
+        if due:
+            self.purge_expired()
+
+    def purge_expired(self) -> int:
+        """Delete expired rows from the shared table and return how many went."""
+        if not self.use_database:
+            return 0
+        from django.db import DatabaseError
+        from django.utils import timezone
+        from .models import GeocodeCacheEntry
+        try:
+            deleted, _ = GeocodeCacheEntry.objects.filter(expires_at__lte=timezone.now()).delete()
+        except DatabaseError as e:
+            logger.warning(f"Could not purge expired geocode cache entries: {e}")
+            return 0
+        return deleted
+
+    def get_or_fetch(self, query: str, params: Dict[str, Any],
+                     fetch: Callable[[], Tuple[int, Any]]) -> Tuple[int, Any, str]:
+        """
+        Return (status code, body, source) for a geocode request. fetch()
+        performs the upstream call and returns its status code and body;
+        only 200 responses are cached. source is 'memory', 'database',
+        'coalesced' or 'upstream'.
+        """
+        key = cache_key(query, params)
+        response = self.memory.get(key)
+        if response is not None:
+            _cache_requests.inc(layer='memory')
+            return 200, response, 'memory'
+
+        def load_or_fetch() -> Tuple[int, Any, str]:
+            stored = self._load(key)
+            if stored is not None:
+                self.memory.set(key, stored[0], ttl=stored[1])
+                return 200, stored[0], 'database'
+
+            start_time = time.perf_counter()
+            try:
+                status_code, body = fetch()
+            finally:
+                _upstream_latency.observe(time.perf_counter() - start_time)
+            if status_code == 200:
+                self.memory.set(key, body)
+                self._store(key, query, body)
+            return status_code, body, 'upstream'
+
+        (status_code, body, source), shared = self.flights.do(key, load_or_fetch)
+        if shared:
+            _coalesced_requests.inc()
+            source = 'coalesced'
+        _cache_requests.inc(layer=source)
+        return status_code, body, source
+
+# Process-wide cache used by GeocodeView
+geocode_cache = GeocodeCache()
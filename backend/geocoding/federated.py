@@ -0,0 +1,196 @@
+"""
+Federated search over the local index, HERE and Nominatim.
+
+The remote providers are started on a shared thread pool, the local index
+is queried on the request thread meanwhile, and results are merged as each
+provider answers. Results closer than DEDUPE_DISTANCE are one place: the
+most confident one is kept, and it is marked as agreed on by every
+provider that found it. The search returns as soon as enough
+high-confidence results are in, or at the deadline, whichever comes first.
+Providers still running then keep going in the background and fill their
+caches for the next search.
+"""
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+import requests
+from django.conf import settings
+from routing.astar import haversine_distance
+from routing.metrics import registry as metrics_registry
+from .batch import HERE_BUCKET_FILE, HERE_RATE
+from .cache import geocode_cache
+from .nominatim import get_nominatim_client
+from .ratelimit import FileTokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Seconds a federated search waits for remote providers by default, and at most
+FEDERATED_DEADLINE = 1.5
+MAX_FEDERATED_DEADLINE = 5.0
+FEDERATED_WORKERS = 8
+MAX_FEDERATED_LIMIT = 20
+
+# Results closer than this (meters) are the same place
+DEDUPE_DISTANCE = 50.0
+# Confidence from which a result counts towards returning early, and how many such results are enough
+HIGH_CONFIDENCE = 0.9
+CONFIDENT_RESULTS = 3
+# Added to a result's confidence for every other provider that found it
+AGREEMENT_BONUS = 0.1
+
+# Confidence of results without a score of their own; Nominatim's lose a step per rank
+UNSCORED_CONFIDENCE = 0.8
+RANK_STEP = 0.05
+
+HERE_PARAMS = {'lang': 'tr', 'in': 'countryCode:TUR'}
+HERE_TIMEOUT = 3
+
+Provider = Callable[[str, int], List[Dict]]
+
+_search_latency = metrics_registry.histogram(
+    'federated_search_seconds', 'Latency of federated geocoding searches')
+_provider_outcomes = metrics_registry.counter(
+    'federated_provider_total', 'Federated search provider calls by outcome')
+
+_executor = ThreadPoolExecutor(max_workers=FEDERATED_WORKERS, thread_name_prefix='federated')
+# Built here rather than on first use so pool threads never race to create it; the file is only opened on acquire
+_here_bucket = FileTokenBucket(HERE_BUCKET_FILE, HERE_RATE, capacity=HERE_RATE)
+
+def local_provider(geocoder, near: Optional[Tuple[float, float]] = None, radius: Optional[float] = None) -> Provider:
+    """Provider over an OSMGeocoder, biased towards near=(lat, lon) and limited to radius meters when given."""
+    def search(query: str, limit: int) -> List[Dict]:
+        return [{
+            'name': result['full_address'] if result['type'] != 'poi' else f"{result['name']}, {result['full_address']}",
+            'lat': result['lat'],
+            'lon': result['lon'],
+            'type': result['type'],
+            'confidence': min(1.0, result['score']),
+        } for result in geocoder.search(query, limit, near=near, radius=radius)]
+    return search
+
+def here_search(query: str, limit: int) -> List[Dict]:
+    """HERE geocode through the shared response cache, drawing from the HERE rate limit."""
+    params = {**HERE_PARAMS, 'limit': limit}
+
+    def fetch():
+        if not _here_bucket.acquire(0):
+            return 429, "Rate limit reached"
+        response = requests.get(settings.HERE_API_BASE_URL,
+                                params={**params, 'q': query, 'apiKey': settings.HERE_API_KEY},
+                                timeout=HERE_TIMEOUT)
+        if response.status_code != 200:
+            return response.status_code, response.text
+        return response.status_code, response.json()
+
+    try:
+        status_code, body, _ = geocode_cache.get_or_fetch(query, params, fetch)
+    finally:
+        if geocode_cache.use_database:
+            # Pool threads outlive the request, so close their connection here
+            from django.db import connection
+            connection.close()
+    if status_code != 200:
+        raise RuntimeError(f"HERE API error {status_code}")
+    return [{
+        'name': item.get('address', {}).get('label') or item.get('title'),
+        'lat': item['position']['lat'],
+        'lon': item['position']['lng'],
+        'type': item.get('resultType'),
+        'confidence': item.get('scoring', {}).get('queryScore', UNSCORED_CONFIDENCE),
+    } for item in body.get('items', []) if item.get('position')]
+
+def nominatim_search(query: str, limit: int) -> List[Dict]:
+    """Nominatim through the shared, rate-limited client."""
+    results, _ = get_nominatim_client().search(query)
+    return [{
+        'name': result['name'],
+        'lat': result['lat'],
+        'lon': result['lon'],
+        'type': result['road_type'],
+        'confidence': max(0.0, UNSCORED_CONFIDENCE - rank * RANK_STEP),
+    } for rank, result in enumerate(results[:limit])]
+
+def merge_results(merged: List[Dict], results: List[Dict], provider: str):
+    """Add one provider's results to merged, folding in those within DEDUPE_DISTANCE of a kept one."""
+    for result in results:
+        result = {**result, 'sources': [provider]}
+        for i, kept in enumerate(merged):
+            if haversine_distance(kept['lat'], kept['lon'], result['lat'], result['lon']) * 1000 > DEDUPE_DISTANCE:
+                continue
+            sources = kept['sources'] + [source for source in result['sources'] if source not in kept['sources']]
+            best = kept if kept['confidence'] >= result['confidence'] else result
+            agreement = AGREEMENT_BONUS if provider not in kept['sources'] else 0.0
+            merged[i] = {**best, 'sources': sources,
+                         'confidence': min(1.0, max(kept['confidence'], result['confidence']) + agreement)}
+            break
+        else:
+            merged.append(result)
+
+class FederatedGeocoder:
+    """
+    Concurrent search over several providers. local runs on the calling
+    thread; remote providers (name -> provider) run on the executor. A
+    provider takes (query, limit) and returns dicts with name, lat, lon,
+    type and a confidence between 0 and 1.
+    """
+
+    def __init__(self, local: Optional[Provider], remote: Dict[str, Provider],
+                 executor: ThreadPoolExecutor = _executor):
+        self.local = local
+        self.remote = remote
+        self.executor = executor
+
+    @staticmethod
+    def _enough(merged: List[Dict], limit: int) -> bool:
+        confident = sum(1 for result in merged if result['confidence'] >= HIGH_CONFIDENCE)
+        return confident >= min(limit, CONFIDENT_RESULTS)
+
+    def search(self, query: str, limit: int = 10, deadline: float = FEDERATED_DEADLINE) -> Dict:
+        """
+        Return {'results', 'providers', 'partial'}: the merged results, best
+        first; per provider its status ('ok', 'error' or 'pending'), result
+        count and milliseconds taken; and whether any provider was still
+        running when the search returned.
+        """
+        start_time = time.perf_counter()
+        expires = start_time + deadline
+        merged: List[Dict] = []
+        providers: Dict[str, Dict] = {}
+
+        def timed(name: str, provider: Provider):
+            started = time.perf_counter()
+            try:
+                results = provider(query, limit)
+            except Exception as e:
+                # Request errors quote the URL, API key included, so only the type is logged
+                logger.warning(f"Federated provider {name} failed: {type(e).__name__}")
+                return name, None, time.perf_counter() - started
+            return name, results, time.perf_counter() - started
+
+        def record(name: str, results: Optional[List[Dict]], seconds: float):
+            status = 'error' if results is None else 'ok'
+            _provider_outcomes.inc(provider=name, status=status)
+            providers[name] = {'status': status, 'count': len(results or []), 'ms': round(seconds * 1000, 1)}
+            if results:
+                merge_results(merged, results, name)
+
+        pending = {self.executor.submit(timed, name, provider) for name, provider in self.remote.items()}
+        if self.local is not None:
+            record(*timed('local', self.local))
+
+        while pending and not self._enough(merged, limit):
+            remaining = expires - time.perf_counter()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                record(*future.result())
+
+        for name in self.remote:
+            if name not in providers:
+                _provider_outcomes.inc(provider=name, status='pending')
+                providers[name] = {'status': 'pending', 'count': 0, 'ms': None}
+        merged.sort(key=lambda result: result['confidence'], reverse=True)
+        _search_latency.observe(time.perf_counter() - start_time)
+        return {'results': merged[:limit], 'providers': providers, 'partial': bool(pending)}
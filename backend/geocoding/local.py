@@ -0,0 +1,74 @@
+"""
+Process-wide local geocoder built from the Ankara OSM extract.
+
+The geocoder is created on first use and shared by every view in the
+worker. The address index comes from its on-disk snapshot when the extract
+has not changed since it was saved (see search.persist).
+"""
+import logging
+import os
+import threading
+import time
+from typing import Mapping, Optional, Tuple
+from django.conf import settings
+from routing.ingest import ingest_osm
+from search.geocoder import AddressIndexer, OSMGeocoder
+from search.persist import load_address_index, save_address_index
+
+logger = logging.getLogger(__name__)
+
+OSM_FILE_PATH = os.environ.get('OSM_FILE_PATH', os.path.join(settings.BASE_DIR, 'data', 'ankara.osm'))
+
+# Largest search radius (meters) a request may ask for
+MAX_SEARCH_RADIUS = 50000
+
+GEOCODER: Optional[OSMGeocoder] = None
+_geocoder_lock = threading.Lock()
+
+def get_geocoder() -> Optional[OSMGeocoder]:
+    """Return the shared geocoder, loading it on first use; None if the extract is missing."""
+    global GEOCODER
+    if GEOCODER is not None:
+        return GEOCODER
+    with _geocoder_lock:
+        if GEOCODER is None:
+            if not os.path.exists(OSM_FILE_PATH):
+                logger.error(f"OSM extract not found at {OSM_FILE_PATH}. Local geocoding is unavailable.")
+                return None
+
+            start_time = time.time()
+            indexer = load_address_index(OSM_FILE_PATH)
+            if indexer is None:
+                logger.info(f"Building address index from {OSM_FILE_PATH}...")
+                indexer = AddressIndexer()
+                ingest_osm(OSM_FILE_PATH, [indexer])
+                save_address_index(indexer, OSM_FILE_PATH)
+            GEOCODER = OSMGeocoder.from_index(indexer.address_index, indexer=indexer)
+            logger.info(f"Address index with {len(indexer.address_index.addresses)} entries loaded "
+                        f"in {time.time() - start_time:.2f} seconds.")
+    return GEOCODER
+
+def parse_near(params: Mapping) -> Tuple[Optional[Tuple[float, float]], Optional[float]]:
+    """
+    Read the optional lat/lon/radius query parameters of a search.
+
+    Returns (near, radius) for OSMGeocoder.search, (None, None) when no
+    point is given. Raises ValueError on a partial or out-of-range point,
+    or on a radius without a point.
+    """
+    lat, lon, radius = params.get('lat'), params.get('lon'), params.get('radius')
+    if not lat and not lon:
+        if radius:
+            raise ValueError("radius requires lat and lon")
+        return None, None
+    if not lat or not lon:
+        raise ValueError("lat and lon must be given together")
+    near = (float(lat), float(lon))
+    if not (-90 <= near[0] <= 90 and -180 <= near[1] <= 180):
+        raise ValueError("lat/lon out of range")
+    if not radius:
+        return near, None
+    radius = float(radius)
+    if not 0 < radius <= MAX_SEARCH_RADIUS:
+        raise ValueError(f"radius must be between 0 and {MAX_SEARCH_RADIUS} meters")
+    return near, radius
@@ -0,0 +1,51 @@
+"""
+Management command to measure geocoder accuracy and latency on the Ankara query corpus.
+"""
+import json
+from django.core.management.base import BaseCommand, CommandError
+from geocoding.benchmark import CORPUS_FILE, DEFAULT_K, default_engines, format_report, load_corpus, run_benchmark
+from geocoding.federated import FEDERATED_DEADLINE
+from geocoding.local import get_geocoder
+
+class Command(BaseCommand):
+    help = ('Run the benchmark query corpus through the local index, autocomplete and federated '
+            'search (with offline stand-ins for HERE and Nominatim) and report recall@k, '
+            'error distance and latency')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=CORPUS_FILE,
+                            help='JSON list of queries with expected locations')
+        parser.add_argument('--engines', default='local,autocomplete,federated',
+                            help='Comma-separated engines to run')
+        parser.add_argument('-k', type=int, nargs='+', default=list(DEFAULT_K),
+                            help='Cutoffs for recall@k')
+        parser.add_argument('--repeat', type=int, default=1,
+                            help='Times each query is timed')
+        parser.add_argument('--deadline', type=float, default=FEDERATED_DEADLINE,
+                            help='Federated search deadline in seconds')
+        parser.add_argument('--json', action='store_true',
+                            help='Print the full report as JSON')
+
+    def handle(self, *args, **options):
+        try:
+            corpus = load_corpus(options['corpus'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Invalid corpus: {e}')
+        geocoder = get_geocoder()
+        if geocoder is None:
+            raise CommandError('Local address index is unavailable (OSM extract not found)')
+
+        engines = default_engines(geocoder, corpus, options['deadline'])
+        names = [name.strip() for name in options['engines'].split(',') if name.strip()]
+        unknown = [name for name in names if name not in engines]
+        if unknown:
+            raise CommandError(f"Unknown engines: {', '.join(unknown)} (choose from {', '.join(engines)})")
+
+        # Warm up: the autocomplete trie is built on first use
+        for name in names:
+            engines[name](corpus[0]['query'], 1)
+        report = run_benchmark({name: engines[name] for name in names}, corpus, options['k'], options['repeat'])
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+        else:
+            self.stdout.write(format_report(report, options['k']))
@@ -1,3 +1,16 @@
 from django.db import models
 
-# Create your models here.
+class GeocodeCacheEntry(models.Model):
+    """A cached HERE geocode response, shared by every worker until it expires."""
+    key = models.CharField(max_length=64, unique=True, verbose_name="Normalized Query Hash")
+    query = models.TextField(verbose_name="Normalized Query")
+    response = models.JSONField(verbose_name="HERE Response")
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Geocode Cache Entry"
+        verbose_name_plural = "Geocode Cache Entries"
+
+    def __str__(self):
+        return f"{self.query} (expires {self.expires_at:%Y-%m-%d %H:%M})"
@@ -0,0 +1,111 @@
+"""
+Shared, rate-limited access to the public Nominatim service.
+
+Nominatim's usage policy allows one request per second per application, so
+every worker draws from one token bucket kept in a lock-protected file.
+Identical queries in flight at the same time share one call, and results
+are cached per process. When no token frees up quickly enough or Nominatim
+fails, search() raises NominatimUnavailable, and the caller can fall back
+to the local address index.
+"""
+import os
+import threading
+from typing import Dict, List, Tuple
+from geopy.exc import GeocoderServiceError, GeocoderTimedOut
+from geopy.geocoders import Nominatim
+from routing.metrics import registry as metrics_registry
+from .cache import LRUCache, SingleFlight, normalize_query
+from .ratelimit import FileTokenBucket
+
+NOMINATIM_BUCKET_FILE = os.environ.get(
+    'NOMINATIM_BUCKET_FILE',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'nominatim_bucket.json')
+)
+NOMINATIM_USER_AGENT = "bil496_project_app"
+# Requests per second allowed by the usage policy, and the longest a request waits for one
+NOMINATIM_RATE = 1.0
+NOMINATIM_MAX_WAIT = 1.0
+NOMINATIM_TIMEOUT = 3
+NOMINATIM_CACHE_TTL = 24 * 3600
+
+# viewbox: [(güney_lat, batı_lon), (kuzey_lat, doğu_lon)]
+ANKARA_VIEWBOX = [(39.6, 32.5), (40.2, 33.2)]
+
+_nominatim_requests = metrics_registry.counter(
+    'nominatim_requests_total', 'Nominatim searches by where the answer came from')
+
+class NominatimUnavailable(Exception):
+    """No Nominatim answer within the time budget (rate limited, timed out or failed)."""
+
+class NominatimClient:
+    """Cached, deduplicated and rate-limited Nominatim searches around Ankara."""
+
+    def __init__(self, bucket: FileTokenBucket = None, geolocator=None):
+        self.bucket = bucket or FileTokenBucket(NOMINATIM_BUCKET_FILE, NOMINATIM_RATE)
+        self.geolocator = geolocator or Nominatim(user_agent=NOMINATIM_USER_AGENT)
+        self.cache = LRUCache(ttl=NOMINATIM_CACHE_TTL)
+        self.flights = SingleFlight()
+
+    @staticmethod
+    def _to_result(loc) -> Dict:
+        bbox = None
+        if loc.raw.get('boundingbox'):
+            bbox = [float(b) for b in loc.raw['boundingbox']]
+        return {
+            'id': loc.raw.get('place_id') or loc.raw.get('osm_id'),
+            'name': loc.address,
+            'lat': loc.latitude,
+            'lon': loc.longitude,
+            'bbox': bbox,
+            'osm_id': loc.raw.get('osm_id'),
+            'road_type': loc.raw.get('type') or loc.raw.get('class'),
+            'geometry': None
+        }
+
+    def _fetch(self, query: str) -> List[Dict]:
+        if not self.bucket.acquire(NOMINATIM_MAX_WAIT):
+            raise NominatimUnavailable("Nominatim rate limit reached")
+        try:
+            locations = self.geolocator.geocode(
+                query,
+                exactly_one=False,
+                limit=5,
+                country_codes='TR',
+                viewbox=ANKARA_VIEWBOX,
+                bounded=1,
+                timeout=NOMINATIM_TIMEOUT
+            )
+        except GeocoderTimedOut:
+            raise NominatimUnavailable("Nominatim timed out")
+        except GeocoderServiceError as e:
+            raise NominatimUnavailable(f"Nominatim error: {str(e)}")
+        return [self._to_result(loc) for loc in locations or []]
+
+    def search(self, query: str) -> Tuple[List[Dict], str]:
+        """Return (results, source); source is 'cache', 'coalesced' or 'nominatim'."""
+        key = normalize_query(query)
+        results = self.cache.get(key)
+        if results is not None:
+            _nominatim_requests.inc(source='cache')
+            return results, 'cache'
+
+        try:
+            results, shared = self.flights.do(key, lambda: self._fetch(query))
+        except NominatimUnavailable:
+            _nominatim_requests.inc(source='unavailable')
+            raise
+        self.cache.set(key, results)
+        source = 'coalesced' if shared else 'nominatim'
+        _nominatim_requests.inc(source=source)
+        return results, source
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_nominatim_client() -> NominatimClient:
+    """Process-wide client, created on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = NominatimClient()
+    return _client
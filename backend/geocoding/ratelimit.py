@@ -0,0 +1,61 @@
+"""
+Rate limiting shared by every worker process of the server.
+"""
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl  # Shares the bucket across worker processes (POSIX only)
+except ImportError:
+    fcntl = None
+
+class FileTokenBucket:
+    """
+    Token bucket whose state lives in a small JSON file, so every worker
+    process shares the same budget. Refills at rate tokens per second up to
+    capacity.
+    """
+
+    def __init__(self, path: str, rate: float, capacity: float = 1.0):
+        self.path = path
+        self.rate = rate
+        self.capacity = capacity
+        self._lock = threading.Lock()
+
+    def _take(self) -> float:
+        """Take a token if one is available; otherwise return the seconds until one is."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock, open(self.path, 'a+', encoding='utf-8') as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            try:
+                state = json.loads(f.read() or '{}')
+            except ValueError:
+                state = {}
+            # Wall clock, since monotonic clocks are not comparable across processes
+            now = time.time()
+            tokens = min(self.capacity, state.get('tokens', self.capacity) +
+                         (now - state.get('updated', now)) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps({'tokens': tokens, 'updated': now}))
+        return wait
+
+    def acquire(self, max_wait: float = 0.0) -> bool:
+        """Take a token, waiting up to max_wait seconds for one; False if none came in time."""
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self._take()
+            if wait == 0.0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
@@ -1,3 +1,326 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+import time
+import types
+import unittest
+from unittest import mock
+import django.conf
+from geopy.exc import GeocoderTimedOut
+from routing.astar import haversine_distance
+from search.geocoder import AddressIndex, OSMGeocoder
+from geocoding.cache import GeocodeCache, LRUCache, SingleFlight, cache_key
+from geocoding.nominatim import NominatimClient, NominatimUnavailable
+from geocoding.ratelimit import FileTokenBucket
+from geocoding.batch import BatchGeocoder, summarize
+from geocoding.federated import FederatedGeocoder, merge_results
+from geocoding.benchmark import (CATEGORIES, StandInProvider, benchmark_engine, format_report, load_corpus,
+                                 percentile)
 
-# Create your tests here.
+class TestGeocodeCache(unittest.TestCase):
+    """Test cases for the HERE geocode response cache."""
+
+    def test_lru_eviction_and_ttl(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+        cache.set('d', 4, ttl=0)
+        self.assertIsNone(cache.get('d'))
+
+    def test_normalized_keys(self):
+        params = {'q': 'x', 'apiKey': 'secret', 'lang': 'tr'}
+        self.assertEqual(cache_key('  Kızılay   Meydanı ', params), cache_key('kızılay meydanı', {'lang': 'tr'}))
+        self.assertNotEqual(cache_key('kızılay', {'lang': 'tr'}), cache_key('kızılay', {'lang': 'en'}))
+
+    def test_concurrent_misses_are_coalesced(self):
+        flights = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def slow_fetch():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'result'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flights.do('k', slow_fetch)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(flights.do('k', slow_fetch))) for _ in range(3)]
+        for thread in followers:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [('result', False)] + [('result', True)] * 3)
+
+    def test_only_successful_responses_are_cached(self):
+        cache = GeocodeCache(use_database=False)
+        responses = iter([(500, 'quota'), (200, {'items': [1]}), (200, {'items': [2]})])
+        fetch = lambda: next(responses)
+        self.assertEqual(cache.get_or_fetch('Ulus', {}, fetch), (500, 'quota', 'upstream'))
+        self.assertEqual(cache.get_or_fetch('Ulus', {}, fetch), (200, {'items': [1]}, 'upstream'))
+        self.assertEqual(cache.get_or_fetch('ulus ', {}, fetch), (200, {'items': [1]}, 'memory'))
+
+class TestNominatimClient(unittest.TestCase):
+    """Test cases for the shared Nominatim rate limiter and client."""
+
+    class FakeLocation:
+        def __init__(self, name):
+            self.address, self.latitude, self.longitude = name, 39.9, 32.85
+            self.raw = {'place_id': 1, 'osm_id': 2, 'type': 'road'}
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.bucket_file = os.path.join(self.tmp_dir.name, 'bucket.json')
+        self.calls = []
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def geocode(self, query, **kwargs):
+        self.calls.append(query)
+        if query == 'slow':
+            raise GeocoderTimedOut()
+        return [self.FakeLocation(query)]
+
+    def test_bucket_is_shared(self):
+        """Buckets on the same file share one budget."""
+        first = FileTokenBucket(self.bucket_file, rate=10, capacity=2)
+        second = FileTokenBucket(self.bucket_file, rate=10, capacity=2)
+        self.assertTrue(first.acquire())
+        self.assertTrue(second.acquire())
+        self.assertFalse(first.acquire())
+        self.assertTrue(second.acquire(max_wait=0.5))
+
+    def test_cache_and_unavailable(self):
+        client = NominatimClient(FileTokenBucket(self.bucket_file, rate=1000, capacity=1),
+                                 types.SimpleNamespace(geocode=self.geocode))
+        results, source = client.search('Kızılay')
+        self.assertEqual((results[0]['name'], source), ('Kızılay', 'nominatim'))
+        self.assertEqual(client.search(' kızılay ')[1], 'cache')
+        self.assertEqual(self.calls, ['Kızılay'])
+        with self.assertRaises(NominatimUnavailable):
+            client.search('slow')
+
+        client.bucket = FileTokenBucket(self.bucket_file, rate=0.01, capacity=1)
+        client.bucket.acquire()
+        with self.assertRaises(NominatimUnavailable):
+            client.search('Ulus')
+        self.assertNotIn('Ulus', self.calls)
+
+class TestBatchGeocoder(unittest.TestCase):
+    """Test cases for batch geocoding with dedupe and fan-out."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.bucket = FileTokenBucket(os.path.join(self.tmp_dir.name, 'bucket.json'), rate=1000, capacity=10)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def fetch(self, query):
+        with self.lock:
+            self.calls.append(query)
+        if query == 'broken':
+            return 500, 'upstream error'
+        if query == 'nowhere':
+            return 200, {'items': []}
+        return 200, {'items': [{'title': query, 'position': {'lat': 39.9, 'lng': 32.8}}]}
+
+    def make_local(self):
+        index = AddressIndex()
+        index.add_address(39.92, 32.85, {'addr:street': 'Atatürk Bulvarı', 'addr:housenumber': '12'})
+        return OSMGeocoder.from_index(index)
+
+    def test_dedupe_and_sources(self):
+        cache = GeocodeCache(use_database=False)
+        geocoder = BatchGeocoder(local=self.make_local(), cache=cache, bucket=self.bucket, fetch=self.fetch)
+        addresses = ['Kızılay', ' kızılay ', 'Atatürk Bulvarı 12', 'broken', 'nowhere', '', 'Ulus']
+        results = sorted(geocoder.geocode(addresses), key=lambda result: result['index'])
+
+        self.assertEqual([result['index'] for result in results], list(range(len(addresses))))
+        self.assertEqual(sorted(self.calls), ['Kızılay', 'Ulus', 'broken', 'nowhere'])
+        self.assertEqual([result['status'] for result in results],
+                         ['ok', 'ok', 'ok', 'error', 'not_found', 'invalid', 'ok'])
+        self.assertEqual(results[1]['query'], ' kızılay ')
+        self.assertEqual((results[1]['lat'], results[1]['lon']), (39.9, 32.8))
+        self.assertEqual(results[2]['source'], 'local')
+        self.assertEqual(results[2]['lat'], 39.92)
+
+        # The second batch is answered from the cache, except the failure
+        self.calls.clear()
+        results = list(geocoder.geocode(['Kızılay', 'Ulus', 'broken']))
+        self.assertEqual(self.calls, ['broken'])
+        self.assertEqual(sorted(result['source'] for result in results), ['here', 'memory', 'memory'])
+
+        summary = summarize(results, 0.5)
+        self.assertEqual(summary['count'], 3)
+        self.assertEqual(summary['statuses'], {'ok': 2, 'error': 1})
+
+    def test_rate_limited(self):
+        bucket = FileTokenBucket(os.path.join(self.tmp_dir.name, 'slow.json'), rate=0.001, capacity=1)
+        bucket.acquire()
+        geocoder = BatchGeocoder(cache=GeocodeCache(use_database=False), bucket=bucket, fetch=self.fetch,
+                                 max_wait=0.05)
+        results = list(geocoder.geocode(['Kızılay']))
+        self.assertEqual(results[0]['status'], 'error')
+        self.assertEqual(self.calls, [])
+
+class TestFederatedGeocoder(unittest.TestCase):
+    """Test cases for the federated search deadline and proximity dedupe."""
+
+    def setUp(self):
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+
+    @staticmethod
+    def provider(*results):
+        return lambda query, limit: [dict(result) for result in results]
+
+    def slow(self, query, limit):
+        self.release.wait(5)
+        return [{'name': 'Late', 'lat': 39.0, 'lon': 32.0, 'type': 'street', 'confidence': 1.0}]
+
+    def failing(self, query, limit):
+        raise RuntimeError("down")
+
+    def test_merge_results(self):
+        merged = []
+        merge_results(merged, [{'name': 'Kızılay', 'lat': 39.9208, 'lon': 32.8541, 'type': 'poi', 'confidence': 0.7},
+                               {'name': 'Ulus', 'lat': 39.9420, 'lon': 32.8543, 'type': 'poi', 'confidence': 0.6}],
+                      'local')
+        # 20 m from the first local result: folded into it, keeping the more confident name
+        merge_results(merged, [{'name': 'Kızılay Meydanı', 'lat': 39.9210, 'lon': 32.8540, 'type': 'place',
+                                'confidence': 0.8}], 'here')
+        self.assertEqual(len(merged), 2)
+        self.assertEqual(merged[0]['name'], 'Kızılay Meydanı')
+        self.assertEqual(merged[0]['sources'], ['local', 'here'])
+        self.assertAlmostEqual(merged[0]['confidence'], 0.9)
+        self.assertEqual(merged[1]['sources'], ['local'])
+
+    def test_returns_early_when_confident(self):
+        local = self.provider(*({'name': f'A {i}', 'lat': 39.90 + i * 0.01, 'lon': 32.85, 'type': 'exact_address',
+                                 'confidence': 1.0} for i in range(3)))
+        federated = FederatedGeocoder(local, {'slow': self.slow})
+        start_time = time.perf_counter()
+        response = federated.search('A', limit=5, deadline=2.0)
+        self.assertLess(time.perf_counter() - start_time, 0.5)
+        self.assertEqual(len(response['results']), 3)
+        self.assertEqual(response['providers']['slow']['status'], 'pending')
+        self.assertTrue(response['partial'])
+
+    def test_deadline(self):
+        fast = self.provider({'name': 'Kızılay', 'lat': 39.92, 'lon': 32.85, 'type': 'place', 'confidence': 0.5})
+        federated = FederatedGeocoder(None, {'fast': fast, 'slow': self.slow, 'failing': self.failing})
+        start_time = time.perf_counter()
+        with self.assertLogs('geocoding.federated', 'WARNING'):
+            response = federated.search('Kızılay', deadline=0.2)
+        self.assertLess(time.perf_counter() - start_time, 1.0)
+        self.assertEqual([result['name'] for result in response['results']], ['Kızılay'])
+        self.assertEqual({name: provider['status'] for name, provider in response['providers'].items()},
+                         {'fast': 'ok', 'slow': 'pending', 'failing': 'error'})
+
+class TestGeocoderBenchmark(unittest.TestCase):
+    """Test cases for the geocoder benchmark harness."""
+
+    CORPUS = [
+        {'query': 'Atatürk Bulvarı 12', 'category': 'address', 'lat': 39.9200, 'lon': 32.8500, 'tolerance': 100},
+        {'query': 'Kızılay', 'category': 'neighborhood', 'lat': 39.9208, 'lon': 32.8541, 'tolerance': 500},
+        {'query': 'Nowhere', 'category': 'poi', 'lat': 39.9, 'lon': 32.8, 'tolerance': 100},
+    ]
+
+    def test_bundled_corpus(self):
+        corpus = load_corpus()
+        self.assertGreaterEqual(len(corpus), 50)
+        self.assertEqual({entry['category'] for entry in corpus}, set(CATEGORIES))
+
+    def test_empty_corpus(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        path = os.path.join(tmp_dir.name, 'corpus.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('[]')
+        with self.assertRaises(ValueError):
+            load_corpus(path)
+
+    def test_percentile(self):
+        self.assertIsNone(percentile([], 0.5))
+        self.assertEqual(percentile([3, 1, 2, 4], 0.5), 2)
+        self.assertEqual(percentile(list(range(1, 101)), 0.99), 99)
+
+    def test_stand_in(self):
+        stand_in = StandInProvider(self.CORPUS, noise=50, seed=3)
+        first = stand_in(' kızılay ', 5)
+        self.assertEqual(first, stand_in('Kızılay', 5))
+        self.assertLessEqual(haversine_distance(39.9208, 32.8541, first[0]['lat'], first[0]['lon']) * 1000, 50.01)
+        self.assertEqual(stand_in('Elsewhere', 5), [])
+        self.assertEqual(StandInProvider(self.CORPUS, miss_rate=1.0)('Kızılay', 5), [])
+
+    def test_benchmark_engine(self):
+        answers = {
+            'Atatürk Bulvarı 12': [{'lat': 39.9300, 'lon': 32.8500}, {'lat': 39.9201, 'lon': 32.8500}],
+            'Kızılay': [{'lat': 39.9208, 'lon': 32.8541}],
+        }
+        report = benchmark_engine(lambda query, limit: answers.get(query, []), self.CORPUS, ks=(1, 5))
+        self.assertEqual(report['queries'], 3)
+        self.assertEqual(report['recall@1'], round(1 / 3, 3))
+        self.assertEqual(report['recall@5'], round(2 / 3, 3))
+        self.assertEqual(report['no_result'], 1)
+        # Top results are about 1112 m and 0 m away
+        self.assertAlmostEqual(report['mean_error_m'], 556, delta=2)
+        self.assertEqual(report['by_category']['address'], {'queries': 1, 'recall@1': 0.0, 'recall@5': 1.0})
+        self.assertIn('recall@5', format_report({'fake': report}))
+
+@unittest.skipUnless(django.conf.settings.configured, "needs the Django settings (run through manage.py test)")
+class TestLocationBias(unittest.TestCase):
+    """Test cases for the lat/lon/radius parameters of the search endpoints."""
+
+    def setUp(self):
+        from rest_framework.test import APIRequestFactory
+        self.factory = APIRequestFactory()
+        self.calls = []
+
+    def search(self, query, limit=10, near=None, radius=None):
+        self.calls.append((near, radius))
+        return [{'full_address': 'Konur Sokak 10, Çankaya', 'name': None, 'lat': 39.9265, 'lon': 32.8530,
+                 'type': 'exact_address', 'score': 1.0}]
+
+    def test_parse_near(self):
+        from geocoding.local import parse_near
+        self.assertEqual(parse_near({}), (None, None))
+        self.assertEqual(parse_near({'lat': '39.92', 'lon': '32.85'}), ((39.92, 32.85), None))
+        self.assertEqual(parse_near({'lat': '39.92', 'lon': '32.85', 'radius': '500'}), ((39.92, 32.85), 500.0))
+        for params in ({'lat': '39.92'}, {'radius': '500'}, {'lat': 'x', 'lon': '32.85'},
+                       {'lat': '95', 'lon': '32.85'}, {'lat': '39.92', 'lon': '32.85', 'radius': '-1'}):
+            with self.assertRaises(ValueError):
+                parse_near(params)
+
+    def test_federated_search(self):
+        from geocoding import views
+        geocoder = types.SimpleNamespace(search=self.search)
+        view = views.FederatedSearchView.as_view()
+        with mock.patch.object(views, 'get_geocoder', return_value=geocoder), \
+                mock.patch.object(views, 'here_search', return_value=[]), \
+                mock.patch.object(views, 'nominatim_search', return_value=[]):
+            response = view(self.factory.get('/api/geocoding/federated/',
+                                             {'q': 'Konur', 'lat': '39.92', 'lon': '32.85', 'radius': '800'}))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.calls, [((39.92, 32.85), 800.0)])
+            response = view(self.factory.get('/api/geocoding/federated/', {'q': 'Konur', 'lat': '39.92'}))
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(len(self.calls), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,10 @@
 from django.urls import path
-from .views import GeocodeView
+from .views import GeocodeView, ReverseGeocodeView, AutocompleteView, BatchGeocodeView, FederatedSearchView
 
 urlpatterns = [
     path('search/', GeocodeView.as_view(), name='geocode_search'),
+    path('reverse/', ReverseGeocodeView.as_view(), name='geocode_reverse'),
+    path('autocomplete/', AutocompleteView.as_view(), name='geocode_autocomplete'),
+    path('batch/', BatchGeocodeView.as_view(), name='geocode_batch'),
+    path('federated/', FederatedSearchView.as_view(), name='geocode_federated'),
 ] 
\ No newline at end of file
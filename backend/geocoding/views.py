@@ -1,13 +1,28 @@
+import json
+import time
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 import requests
 from django.conf import settings
+from search.autocomplete import TOP_K
+from .batch import MAX_BATCH_ADDRESSES, BatchGeocoder, summarize
+from .cache import geocode_cache
+from .federated import (FEDERATED_DEADLINE, MAX_FEDERATED_DEADLINE, MAX_FEDERATED_LIMIT, FederatedGeocoder,
+                        here_search, local_provider, nominatim_search)
+from .local import get_geocoder, parse_near
+
+# Upper bounds for reverse geocoding requests
+MAX_REVERSE_LIMIT = 50
+MAX_REVERSE_POINTS = 500
 
 class GeocodeView(APIView):
     """
-    HERE Geocoding API kullanarak adres/konum araması yapan view
+    HERE Geocoding API kullanarak adres/konum araması yapan view.
+    Yanıtlar önbelleğe alınır (bkz. geocoding/cache.py); aynı anda gelen
+    aynı sorgular tek bir HERE çağrısını paylaşır.
     """
     def get(self, request):
         try:
@@ -37,22 +52,182 @@ class GeocodeView(APIView):
             if country_code:
                 params['in'] = f'countryCode:{country_code}'
                 
-            response = requests.get(
-                settings.HERE_API_BASE_URL,
-                params=params
-            )
-            
-            if response.status_code != 200:
+            def fetch():
+                response = requests.get(
+                    settings.HERE_API_BASE_URL,
+                    params=params
+                )
+                if response.status_code != 200:
+                    return response.status_code, response.text
+                return response.status_code, response.json()
+
+            status_code, body, source = geocode_cache.get_or_fetch(query, params, fetch)
+            if status_code != 200:
                 return Response(
-                    {"error": "HERE API hatası", "details": response.text},
+                    {"error": "HERE API hatası", "details": body},
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
             
             # HERE API yanıtını doğrudan döndür
-            return Response(response.json())
+            return Response(body, headers={'X-Geocode-Cache': source})
             
         except Exception as e:
             return Response(
                 {"error": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+class ReverseGeocodeView(APIView):
+    """
+    Reverse geocoding against the local OSM address index, for map clicks
+    and route endpoints.
+
+    GET ?lat=&lon= returns the addresses and POIs nearest to one point.
+    POST {"points": [{"lat": .., "lon": ..}, ...]} returns one result list
+    per point, in input order. Both accept limit, radius (meters) and
+    category ('address', 'poi', a POI category such as 'amenity' or a type
+    such as 'pharmacy').
+    """
+
+    def _parse_options(self, data):
+        limit = int(data.get('limit') or 5)
+        if not 1 <= limit <= MAX_REVERSE_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_REVERSE_LIMIT}")
+        radius = data.get('radius')
+        radius = float(radius) if radius not in (None, '') else None
+        if radius is not None and radius <= 0:
+            raise ValueError("radius must be positive")
+        return {'limit': limit, 'radius': radius, 'category': data.get('category') or None}
+
+    def _parse_point(self, data):
+        lat, lon = float(data['lat']), float(data['lon'])
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError("lat/lon out of range")
+        return lat, lon
+
+    def get(self, request):
+        try:
+            lat, lon = self._parse_point(request.query_params)
+            options = self._parse_options(request.query_params)
+        except KeyError:
+            return Response({"error": "lat ve lon parametreleri gerekli"}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        geocoder = get_geocoder()
+        if geocoder is None:
+            return Response({"error": "Yerel adres indeksi kullanılamıyor"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({'results': geocoder.reverse(lat, lon, **options)})
+
+    def post(self, request):
+        points = request.data.get('points')
+        if not isinstance(points, list) or not points:
+            return Response({"error": "points listesi gerekli"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(points) > MAX_REVERSE_POINTS:
+            return Response({"error": f"En fazla {MAX_REVERSE_POINTS} nokta gönderilebilir"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            options = self._parse_options(request.data)
+            coordinates = [self._parse_point(point) for point in points]
+        except (KeyError, TypeError, ValueError) as e:
+            return Response({"error": f"Geçersiz istek: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        geocoder = get_geocoder()
+        if geocoder is None:
+            return Response({"error": "Yerel adres indeksi kullanılamıyor"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({'results': [geocoder.reverse(lat, lon, **options) for lat, lon in coordinates]})
+
+
+class AutocompleteView(APIView):
+    """
+    Per-keystroke completions for the search box from the local address
+    index: street, neighborhood and POI names starting with q, or with a
+    word starting with q, most important first. No external API is called.
+    """
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "Arama sorgusu gerekli (q parametresi)"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit') or TOP_K)
+        except ValueError:
+            return Response({"error": "limit bir sayı olmalı"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, TOP_K))
+
+        geocoder = get_geocoder()
+        if geocoder is None:
+            return Response({"error": "Yerel adres indeksi kullanılamıyor"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({'results': geocoder.autocomplete(query, limit)})
+
+
+class BatchGeocodeView(APIView):
+    """
+    Bulk geocoding for address lists (pharmacy ingestion, favorites imports).
+
+    POST {"addresses": ["...", ...]} deduplicates the addresses, answers what
+    it can from the local index and the geocode cache, and sends the rest to
+    HERE concurrently under the shared rate limit (see geocoding/batch.py).
+    The response is NDJSON: one line per address as soon as it is resolved,
+    in completion order and tagged with its input index, then a closing
+    summary line with "done": true. "use_local": false skips the local index.
+    """
+
+    def post(self, request):
+        addresses = request.data.get('addresses')
+        if not isinstance(addresses, list) or not addresses:
+            return Response({"error": "addresses listesi gerekli"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(addresses) > MAX_BATCH_ADDRESSES:
+            return Response({"error": f"En fazla {MAX_BATCH_ADDRESSES} adres gönderilebilir"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        local = get_geocoder() if request.data.get('use_local', True) else None
+        geocoder = BatchGeocoder(local=local)
+
+        def stream():
+            start_time = time.perf_counter()
+            results = []
+            for result in geocoder.geocode(addresses):
+                results.append(result)
+                yield json.dumps(result, ensure_ascii=False) + '\n'
+            yield json.dumps(summarize(results, time.perf_counter() - start_time), ensure_ascii=False) + '\n'
+
+        return StreamingHttpResponse(stream(), content_type='application/x-ndjson')
+
+
+class FederatedSearchView(APIView):
+    """
+    One search over the local address index, HERE and Nominatim.
+
+    The remote providers run concurrently while the local index answers
+    immediately; results are merged, deduplicated by proximity and ranked
+    by confidence (see geocoding/federated.py). The response comes back as
+    soon as enough confident results exist, and never later than the
+    deadline (seconds, default 1.5); providers that had not answered by
+    then are reported as 'pending'. Optional lat/lon (and radius in
+    meters) bias the local results towards a point.
+    """
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "Arama sorgusu gerekli (q parametresi)"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit') or 10)
+            deadline = float(request.query_params.get('deadline') or FEDERATED_DEADLINE)
+        except ValueError:
+            return Response({"error": "limit ve deadline sayı olmalı"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            near, radius = parse_near(request.query_params)
+        except ValueError as e:
+            return Response({"error": f"Geçersiz konum: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, MAX_FEDERATED_LIMIT))
+        deadline = max(0.0, min(deadline, MAX_FEDERATED_DEADLINE))
+
+        geocoder = get_geocoder()
+        federated = FederatedGeocoder(
+            local_provider(geocoder, near, radius) if geocoder is not None else None,
+            {'here': here_search, 'nominatim': nominatim_search}
+        )
+        return Response(federated.search(query, limit, deadline))
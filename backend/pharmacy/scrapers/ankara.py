@@ -16,9 +16,8 @@ from datetime import datetime, timedelta
 import re
 import json
 import logging  # Logging modülünü ekledik
-import requests
 from django.utils import timezone
-from django.conf import settings
+from geocoding.batch import geocode_addresses
 from pharmacy.models import Pharmacy
 
 # Log ayarları
@@ -397,50 +396,28 @@ def get_duty_pharmacies():
         
         logger.info(f"Tekrarlananlar kaldırıldıktan sonra {len(unique_data)} adet tekil eczane kaldı.")
         
-        # Geocoding API'si için konum bilgilerini ekleyelim
+        # Geocoding API'si için konum bilgilerini ekleyelim: adresler tek seferde,
+        # tekrarlar ayıklanıp paralel ve hız sınırı altında çözülür (bkz. geocoding/batch.py)
+        queries = [f"{eczane['Eczane Adı']} {eczane['Adres']} {eczane.get('Bölge', '')}" for eczane in unique_data]
+        logger.info(f"{len(queries)} eczane için konum bilgisi alınıyor...")
+        try:
+            results = geocode_addresses(queries)
+        except Exception as e:
+            # Geocoding çökerse eczaneler konumsuz kaydedilir; yalnızca hata türü yazılır (mesaj API anahtarı içerebilir)
+            logger.error(f"Geocoding başarısız ({type(e).__name__}), eczaneler konumsuz kaydedilecek")
+            results = [{'status': 'error', 'error': type(e).__name__}] * len(queries)
         geocoded_count = 0
-        for eczane in unique_data:
-            try:
-                # Eczane bilgilerini birleştirerek arama sorgusu oluşturalım
-                query = f"{eczane['Eczane Adı']} {eczane['Adres']} {eczane.get('Bölge', '')}"
-                
-                # Geocoding API'sine istek at
-                logger.info(f"Konum bilgisi alınıyor: {eczane['Eczane Adı']}")
-                try:
-                    response = requests.get(
-                        "https://geocode.search.hereapi.com/v1/geocode",
-                        params={
-                            "q": query,
-                            "apiKey": settings.HERE_API_KEY,
-                            "limit": 1
-                        }
-                    )
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        if data.get('items') and len(data['items']) > 0:
-                            position = data['items'][0].get('position')
-                            if position:
-                                # Eczane verisine konum bilgisini ekle
-                                eczane['latitude'] = position['lat']
-                                eczane['longitude'] = position['lng']
-                                geocoded_count += 1
-                                logger.info(f"Konum bulundu: {eczane['Eczane Adı']} - {position['lat']}, {position['lng']}")
-                            else:
-                                logger.warning(f"Konum bulunamadı: {eczane['Eczane Adı']}")
-                        else:
-                            logger.warning(f"Sonuç bulunamadı: {eczane['Eczane Adı']}")
-                    else:
-                        logger.warning(f"Geocoding API hatası: {response.status_code} - {eczane['Eczane Adı']}")
-                
-                except Exception as e:
-                    logger.error(f"Geocoding işlemi sırasında hata: {str(e)} - {eczane['Eczane Adı']}")
-                
-                # Her istekten sonra API'yi aşırı yüklememek için kısa bir bekletme
-                time.sleep(0.5)
-                
-            except Exception as e:
-                logger.error(f"Eczane konum güncellemesi sırasında hata: {str(e)}")
+        for eczane, result in zip(unique_data, results):
+            if result['status'] == 'ok':
+                # Eczane verisine konum bilgisini ekle
+                eczane['latitude'] = result['lat']
+                eczane['longitude'] = result['lon']
+                geocoded_count += 1
+                logger.info(f"Konum bulundu: {eczane['Eczane Adı']} - {result['lat']}, {result['lon']}")
+            elif result['status'] == 'not_found':
+                logger.warning(f"Sonuç bulunamadı: {eczane['Eczane Adı']}")
+            else:
+                logger.warning(f"Geocoding hatası: {result.get('error')} - {eczane['Eczane Adı']}")
         
         logger.info(f"Toplam {geocoded_count} eczaneye konum bilgisi eklendi.")
         
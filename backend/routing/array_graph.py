@@ -0,0 +1,229 @@
+"""
+Array layout of a RoutingGraph for route searches.
+
+OSM node ids say nothing about where a node is, and the dict-based
+RoutingGraph keeps one Node object and one attribute dict per edge, so a
+search hashes ids and chases pointers all over memory. ArrayGraph renumbers
+the nodes 0..n-1 along a Hilbert curve and keeps the adjacency in flat
+lists in that order (compressed sparse rows): the edges of node i are
+offsets[i]:offsets[i + 1] of the edge lists, and geographically close
+nodes sit close together. osm_ids maps a number back to its OSM id and
+index maps OSM ids to numbers, so searches take and return OSM ids.
+
+The arrays are a read-only snapshot. Diffs still edit the RoutingGraph,
+which is then laid out again; turn restrictions are translated to the new
+numbers, and overlays, which name nodes by OSM id, are checked through the
+original edge dicts.
+"""
+from datetime import datetime
+from heapq import heappop, heappush, heapify
+from math import atan2, cos, radians, sin, sqrt
+from time import perf_counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from .astar import MODE_SPEEDS, RoutingGraph, TrafficModel, UserPreferences
+from .overlay import EdgeOverlay
+from .metrics import SearchStats
+
+HILBERT_ORDER = 16  # 65536 x 65536 grid, well below a metre over a city
+
+EARTH_RADIUS = 6371  # km, as in haversine_distance
+
+def hilbert_index(x: int, y: int, order: int = HILBERT_ORDER) -> int:
+    """Distance of grid cell (x, y) along a Hilbert curve of the given order."""
+    n = 1 << order
+    index = 0
+    s = n >> 1
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        index += s * s * ((3 * rx) ^ ry)
+        # Rotate the quadrant so the curve stays continuous
+        if ry == 0:
+            if rx == 1:
+                x = n - 1 - x
+                y = n - 1 - y
+            x, y = y, x
+        s >>= 1
+    return index
+
+class HilbertKeys:
+    """
+    Hilbert curve positions of points inside a fixed bounding box. Points
+    outside it are clamped to its edge, so keys computed for one version of
+    the graph stay valid for the next.
+    """
+
+    def __init__(self, points: Iterable[Tuple[float, float]], order: int = HILBERT_ORDER):
+        points = list(points)
+        self.order = order
+        self.min_lat = min((lat for lat, _ in points), default=0.0)
+        self.min_lon = min((lon for _, lon in points), default=0.0)
+        self.lat_span = (max((lat for lat, _ in points), default=0.0) - self.min_lat) or 1.0
+        self.lon_span = (max((lon for _, lon in points), default=0.0) - self.min_lon) or 1.0
+
+    def key(self, lat: float, lon: float) -> int:
+        cells = (1 << self.order) - 1
+        x = min(cells, max(0, int((lon - self.min_lon) / self.lon_span * cells)))
+        y = min(cells, max(0, int((lat - self.min_lat) / self.lat_span * cells)))
+        return hilbert_index(x, y, self.order)
+
+class ArrayGraph:
+    """Hilbert-ordered array copy of a RoutingGraph; see the module docstring."""
+
+    def __init__(self, graph: RoutingGraph, previous: 'ArrayGraph' = None):
+        """
+        Lay out graph. Pass the layout of the graph it was copied from to
+        reuse the curve positions of nodes that have not moved.
+        """
+        self.graph = graph
+        if previous is not None:
+            self.curve = previous.curve
+            known = previous.keys
+        else:
+            self.curve = HilbertKeys((node.lat, node.lon) for node in graph.nodes.values())
+            known = {}
+        # OSM id -> (curve position, coordinates it was computed for)
+        keys: Dict[int, Tuple[int, Tuple[float, float]]] = {}
+        for node_id, node in graph.nodes.items():
+            key = known.get(node_id)
+            if key is None or key[1] != (node.lat, node.lon):
+                key = (self.curve.key(node.lat, node.lon), (node.lat, node.lon))
+            keys[node_id] = key
+        self.keys = keys
+
+        # Ties (nodes in the same cell) are broken by id so the layout is deterministic
+        self.osm_ids: List[int] = sorted(keys, key=lambda node_id: (keys[node_id][0], node_id))
+        self.index: Dict[int, int] = {node_id: i for i, node_id in enumerate(self.osm_ids)}
+        index = self.index
+
+        nodes = [graph.nodes[node_id] for node_id in self.osm_ids]
+        self.lat_rad = [radians(node.lat) for node in nodes]
+        self.lon_rad = [radians(node.lon) for node in nodes]
+        self.cos_lat = [cos(lat) for lat in self.lat_rad]
+
+        # Plain lists rather than array.array: indexing a list returns the
+        # stored object, an array would box a new int or float on every read
+        self.offsets: List[int] = [0]
+        self.targets: List[int] = []
+        self.hours: List[float] = []  # distance / speed limit
+        self.distances: List[float] = []
+        self.way_ids: List[Optional[int]] = []
+        self.edges: List[Dict] = []
+        for node in nodes:
+            for neighbor_id in sorted(node.adjacent, key=index.__getitem__):
+                edge = node.adjacent[neighbor_id]
+                self.targets.append(index[neighbor_id])
+                self.hours.append(edge['distance'] / edge['speed_limit'])
+                self.distances.append(edge['distance'])
+                self.way_ids.append(edge.get('way_id'))
+                self.edges.append(edge)
+            self.offsets.append(len(self.targets))
+
+        # (from, to) pairs through each node, by number; pairs naming ids that are
+        # not nodes (e.g. way ids) can never match a search step and are left out
+        self.restrictions: Dict[int, Dict[Tuple[int, int], bool]] = {}
+        for i, node in enumerate(nodes):
+            pairs = {(index[from_id], index[to_id]): allowed
+                     for (from_id, to_id), allowed in node.turn_restrictions.items()
+                     if from_id in index and to_id in index}
+            if pairs:
+                self.restrictions[i] = pairs
+
+    def __len__(self) -> int:
+        return len(self.osm_ids)
+
+    def astar(self, start_id: int, goal_id: int, current_time: datetime = None,
+              user_preferences: UserPreferences = None,
+              mode: str = 'driving',
+              overlay: EdgeOverlay = None,
+              stats: SearchStats = None,
+              start_costs: Dict[int, float] = None) -> Tuple[List[int], float]:
+        """
+        RoutingGraph.astar() over the arrays: same arguments, same costs,
+        and the path comes back as OSM node ids.
+        """
+        index = self.index
+        starts = {start_id: 0.0, **(start_costs or {})}
+        if goal_id not in index or any(node_id not in index for node_id in starts):
+            return [], 0
+
+        goal = index[goal_id]
+        mode_speed = MODE_SPEEDS.get(mode)
+        # Traffic only slows down motor vehicles
+        traffic_mult = TrafficModel.get_traffic_multiplier(current_time) if mode_speed is None else 1.0
+        max_speed = mode_speed or 130.0
+        # Without any preferred or avoided way every multiplier is 1.0
+        if user_preferences is not None and not (user_preferences.preferred_ways or user_preferences.avoided_ways):
+            user_preferences = None
+        if overlay is not None and overlay.is_empty:
+            overlay = None
+
+        offsets, targets, hours, distances, way_ids = self.offsets, self.targets, self.hours, self.distances, self.way_ids
+        lat_rad, lon_rad, cos_lat = self.lat_rad, self.lon_rad, self.cos_lat
+        restrictions = self.restrictions
+        goal_lat, goal_lon, goal_cos = lat_rad[goal], lon_rad[goal], cos_lat[goal]
+
+        # Priority queue of (f_score, node, prev_node), by number
+        open_set = [(cost, index[node_id], None) for node_id, cost in starts.items()]
+        heapify(open_set)
+        came_from: Dict[int, int] = {}
+        g_score: Dict[int, float] = {index[node_id]: cost for node_id, cost in starts.items()}
+
+        while open_set:
+            _, current, prev = heappop(open_set)
+            if stats is not None:
+                stats.nodes_popped += 1
+
+            if current == goal:
+                path = [current]
+                while current in came_from:
+                    current = came_from[current]
+                    path.append(current)
+                return [self.osm_ids[i] for i in reversed(path)], g_score[goal]
+
+            turns = restrictions.get(current) if prev is not None else None
+            current_g = g_score[current]
+            for e in range(offsets[current], offsets[current + 1]):
+                neighbor = targets[e]
+                if turns is not None and not turns.get((prev, neighbor), True):
+                    continue
+
+                if mode_speed is None:
+                    base = hours[e]
+                else:
+                    base = distances[e] / mode_speed
+                way_id = way_ids[e]
+                if overlay is not None:
+                    from_id, to_id = self.osm_ids[current], self.osm_ids[neighbor]
+                    if self.graph._edge_closed(overlay, way_id, from_id, to_id, self.edges[e]):
+                        continue
+                    if mode_speed is None:
+                        speed = self.graph._edge_speed_override(overlay, way_id, from_id, to_id, self.edges[e])
+                        if speed:
+                            base = distances[e] / speed
+
+                preference_mult = 1.0
+                if user_preferences is not None and way_id is not None:
+                    preference_mult = user_preferences.get_way_multiplier(way_id)
+
+                tentative_g = current_g + base * traffic_mult * preference_mult
+                if tentative_g < g_score.get(neighbor, float('inf')):
+                    came_from[neighbor] = current
+                    g_score[neighbor] = tentative_g
+
+                    if stats is not None:
+                        h_start = perf_counter()
+                    # haversine_distance() to the goal, on precomputed radians and cosines
+                    dlat = goal_lat - lat_rad[neighbor]
+                    dlon = goal_lon - lon_rad[neighbor]
+                    a = sin(dlat/2)**2 + cos_lat[neighbor] * goal_cos * sin(dlon/2)**2
+                    h_score = EARTH_RADIUS * (2 * atan2(sqrt(a), sqrt(1-a))) / max_speed
+
+                    heappush(open_set, (tentative_g + h_score, neighbor, current))
+
+                    if stats is not None:
+                        stats.heuristic_time += perf_counter() - h_start
+                        stats.edges_relaxed += 1
+                        stats.heap_peak = max(stats.heap_peak, len(open_set))
+
+        return [], 0
@@ -1,7 +1,10 @@
-from typing import Dict, List, Set, Tuple, Optional
+from typing import Dict, Iterable, List, Set, Tuple, Optional
 from math import radians, sin, cos, sqrt, atan2
 import heapq
 from datetime import datetime, time
+from time import perf_counter
+from .overlay import EdgeOverlay
+from .metrics import SearchStats
 
 class Node:
     def __init__(self, id: int, lat: float, lon: float):
@@ -42,6 +45,12 @@ def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     c = 2 * atan2(sqrt(a), sqrt(1-a))
     return R * c
 
+# Fixed travel speeds (km/h) for non-driving modes; driving uses the edge speed limit.
+MODE_SPEEDS = {
+    'walking': 5.0,
+    'cycling': 15.0,
+}
+
 class TrafficModel:
     """Simple traffic model based on time of day."""
     
@@ -104,6 +113,20 @@ class RoutingGraph:
     def add_node(self, id: int, lat: float, lon: float):
         self.nodes[id] = Node(id, lat, lon)
 
+    def copy(self) -> 'RoutingGraph':
+        """
+        Copy whose nodes, adjacency and restrictions can be changed without
+        touching this graph. Edge attribute dicts are shared: edges are only
+        ever replaced or removed, never modified in place.
+        """
+        graph = RoutingGraph()
+        for node_id, node in self.nodes.items():
+            copied = Node(node_id, node.lat, node.lon)
+            copied.adjacent = dict(node.adjacent)
+            copied.turn_restrictions = dict(node.turn_restrictions)
+            graph.nodes[node_id] = copied
+        return graph
+
     def add_edge(self, from_id: int, to_id: int, bidirectional: bool = True, 
                  speed_limit: float = 50.0, way_id: int = None):
         """Add edge with speed limit (km/h) and way_id."""
@@ -129,28 +152,51 @@ class RoutingGraph:
             self.nodes[node_id].add_turn_restriction(from_id, to_id, allowed)
 
     def astar(self, start_id: int, goal_id: int, current_time: datetime = None, 
-              user_preferences: UserPreferences = None) -> Tuple[List[int], float]:
-        """A* path finding algorithm with turn restrictions, traffic, and user preferences."""
-        if start_id not in self.nodes or goal_id not in self.nodes:
+              user_preferences: UserPreferences = None,
+              mode: str = 'driving',
+              overlay: EdgeOverlay = None,
+              stats: SearchStats = None,
+              start_costs: Dict[int, float] = None) -> Tuple[List[int], float]:
+        """
+        A* path finding algorithm with turn restrictions, traffic, user preferences and live edge overrides.
+
+        If stats is given, nodes popped, edges relaxed, peak open set size and
+        heuristic time are accumulated into it. start_costs maps further
+        start nodes to the time (hours) it takes to reach them, e.g. both
+        ends of the edge a trip starts on; the path begins at whichever
+        start gives the cheapest route.
+        """
+        starts = {start_id: 0.0, **(start_costs or {})}
+        if goal_id not in self.nodes or any(node_id not in self.nodes for node_id in starts):
             return [], 0
 
         goal_node = self.nodes[goal_id]
-        traffic_mult = TrafficModel.get_traffic_multiplier(current_time)
+        mode_speed = MODE_SPEEDS.get(mode)
+        # Traffic only slows down motor vehicles
+        traffic_mult = TrafficModel.get_traffic_multiplier(current_time) if mode_speed is None else 1.0
+        # Use distance/max_speed as optimistic time estimate
+        max_speed = mode_speed or 130.0  # km/h, maximum possible speed
         
         # Use empty preferences if none provided
         if user_preferences is None:
             user_preferences = UserPreferences()
+        # Skip overlay lookups entirely when nothing is closed or overridden
+        if overlay is not None and overlay.is_empty:
+            overlay = None
         
         # Priority queue of (f_score, node_id, prev_node_id)
-        open_set = [(0, start_id, None)]
+        open_set = [(cost, node_id, None) for node_id, cost in starts.items()]
+        heapq.heapify(open_set)
         # Keep track of where we came from
         came_from: Dict[int, Tuple[int, int]] = {}  # current -> (prev, prev_prev)
         
         # g_score[n] is the time cost of the cheapest path from start to n currently known
-        g_score: Dict[int, float] = {start_id: 0}
+        g_score: Dict[int, float] = dict(starts)
         
         while open_set:
             current_f, current_id, prev_id = heapq.heappop(open_set)
+            if stats is not None:
+                stats.nodes_popped += 1
             
             if current_id == goal_id:
                 # Reconstruct path
@@ -160,7 +206,7 @@ class RoutingGraph:
                 while current in came_from:
                     path.append(current)
                     current, _ = came_from[current]
-                path.append(start_id)
+                path.append(current)
                 return path[::-1], total_time
 
             current_node = self.nodes[current_id]
@@ -173,8 +219,15 @@ class RoutingGraph:
 
                 # Calculate time cost based on distance, speed limit, traffic, and user preferences
                 distance = edge_data['distance']
-                speed = edge_data['speed_limit']
+                speed = mode_speed or edge_data['speed_limit']
                 way_id = edge_data.get('way_id')
+
+                # Apply live closures and speed overrides
+                if overlay is not None:
+                    if self._edge_closed(overlay, way_id, current_id, neighbor_id, edge_data):
+                        continue
+                    if mode_speed is None:
+                        speed = self._edge_speed_override(overlay, way_id, current_id, neighbor_id, edge_data) or speed
                 
                 # Apply user preference multiplier if way_id is available
                 preference_mult = 1.0
@@ -193,8 +246,8 @@ class RoutingGraph:
                     g_score[neighbor_id] = tentative_g
                     
                     # f_score = g_score + heuristic
-                    # Use distance/max_speed as optimistic time estimate
-                    max_speed = 130.0  # km/h, maximum possible speed
+                    if stats is not None:
+                        h_start = perf_counter()
                     h_score = haversine_distance(
                         self.nodes[neighbor_id].lat,
                         self.nodes[neighbor_id].lon,
@@ -204,13 +257,113 @@ class RoutingGraph:
                     
                     f_score = tentative_g + h_score
                     heapq.heappush(open_set, (f_score, neighbor_id, current_id))
+
+                    if stats is not None:
+                        stats.heuristic_time += perf_counter() - h_start
+                        stats.edges_relaxed += 1
+                        stats.heap_peak = max(stats.heap_peak, len(open_set))
         
         return [], 0  # No path found
 
+    @staticmethod
+    def _edge_hops(from_id: int, to_id: int, edge_data: Dict) -> List[Tuple[int, int]]:
+        """Original (from, to) node pairs covered by an edge, including contracted ones."""
+        via = edge_data.get('via')
+        if not via:
+            return [(from_id, to_id)]
+        chain = [from_id] + via + [to_id]
+        return list(zip(chain, chain[1:]))
+
+    def _edge_closed(self, overlay: EdgeOverlay, way_id: int, from_id: int, to_id: int, edge_data: Dict) -> bool:
+        return any(overlay.is_closed(way_id, u, v) for u, v in self._edge_hops(from_id, to_id, edge_data))
+
+    def _edge_speed_override(self, overlay: EdgeOverlay, way_id: int, from_id: int, to_id: int,
+                             edge_data: Dict) -> Optional[float]:
+        # A compound edge takes the slowest override of any of its original pieces
+        speeds = [speed for speed in (overlay.speed_for(way_id, u, v)
+                                      for u, v in self._edge_hops(from_id, to_id, edge_data))
+                  if speed is not None]
+        return min(speeds) if speeds else None
+
+    def contract_degree2(self, candidates: Iterable[int] = None) -> int:
+        """
+        Collapse chains of degree-2 shape nodes into compound edges.
+
+        A node is removed when it only connects two neighbours along a single
+        way, either as a two-way pass-through or as a one-way chain. The
+        compound edge keeps the summed distance, the speed that gives the
+        same travel time, the removed node ids ('via') and their coordinates
+        ('shape'), so route costs and geometry are unchanged. Nodes involved
+        in turn restrictions are kept. candidates limits the nodes considered,
+        e.g. after an incremental update. Returns the number of nodes removed.
+        """
+        incoming: Dict[int, Set[int]] = {node_id: set() for node_id in self.nodes}
+        protected: Set[int] = set()
+        for node_id, node in self.nodes.items():
+            for neighbor_id in node.adjacent:
+                incoming[neighbor_id].add(node_id)
+            if node.turn_restrictions:
+                protected.add(node_id)
+        # Restrictions between neighbouring nodes name the nodes next to the
+        # via node, so those are kept as well; ids that are not neighbours
+        # (e.g. the way ids of OSM restrictions) are not nodes to protect
+        for node_id in list(protected):
+            neighbors = incoming[node_id].union(self.nodes[node_id].adjacent)
+            for from_id, to_id in self.nodes[node_id].turn_restrictions:
+                protected.update(neighbors.intersection((from_id, to_id)))
+
+        removed = 0
+        for node_id in list(self.nodes if candidates is None else candidates):
+            if node_id in protected or node_id not in self.nodes:
+                continue
+            node = self.nodes[node_id]
+            outgoing = set(node.adjacent)
+            neighbors = outgoing | incoming[node_id]
+            if len(neighbors) != 2 or node_id in neighbors:
+                continue
+
+            a, b = neighbors
+            pairs = [(x, y) for x, y in ((a, b), (b, a)) if x in incoming[node_id] and y in outgoing]
+            # Every edge in and out of the node must be part of a pass-through
+            if not pairs or len(pairs) != len(outgoing) or len(pairs) != len(incoming[node_id]):
+                continue
+            way_ids = {node.adjacent[y]['way_id'] for y in outgoing}
+            way_ids.update(self.nodes[x].adjacent[node_id]['way_id'] for x in incoming[node_id])
+            if len(way_ids) != 1:
+                continue
+            # The adjacency dict cannot hold parallel edges
+            if any(y in self.nodes[x].adjacent for x, y in pairs):
+                continue
+
+            for x, y in pairs:
+                first = self.nodes[x].adjacent.pop(node_id)
+                self.nodes[x].adjacent[y] = self._merge_edges(first, node, node.adjacent[y])
+                incoming[y].discard(node_id)
+                incoming[y].add(x)
+            del self.nodes[node_id]
+            removed += 1
+        return removed
+
+    @staticmethod
+    def _merge_edges(first: Dict, via: Node, second: Dict) -> Dict:
+        distance = first['distance'] + second['distance']
+        hours = first['distance'] / first['speed_limit'] + second['distance'] / second['speed_limit']
+        return {
+            'distance': distance,
+            'speed_limit': distance / hours if hours else first['speed_limit'],
+            'way_id': first['way_id'],
+            'via': first.get('via', []) + [via.id] + second.get('via', []),
+            'shape': first.get('shape', []) + [(via.lat, via.lon)] + second.get('shape', []),
+        }
+
     def get_route_geometry(self, path: List[int]) -> List[Tuple[float, float]]:
-        """Convert path of node IDs to list of coordinates."""
-        return [(self.nodes[node_id].lat, self.nodes[node_id].lon) 
-                for node_id in path]
+        """Convert path of node IDs to list of coordinates, expanding contracted edges."""
+        geometry = []
+        for i, node_id in enumerate(path):
+            if i > 0:
+                geometry.extend(self.nodes[path[i - 1]].adjacent[node_id].get('shape', ()))
+            geometry.append((self.nodes[node_id].lat, self.nodes[node_id].lon))
+        return geometry
                 
     def get_route_ways(self, path: List[int]) -> List[int]:
         """Get list of way IDs used in the route."""
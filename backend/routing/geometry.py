@@ -0,0 +1,141 @@
+from typing import Dict, List, Sequence, Tuple, Union
+from math import cos, radians
+import numpy as np
+
+# Output formats accepted for route geometries
+GEOMETRY_FORMATS = ('geojson', 'polyline5', 'polyline6', 'simplified')
+
+# Zoom level used when a simplified geometry is requested without one
+DEFAULT_SIMPLIFY_ZOOM = 15
+
+# Ground resolution (meters per pixel) of a 256px Web Mercator tile at zoom 0 on the equator
+_METERS_PER_PIXEL_Z0 = 156543.03392
+
+# An int64 delta needs at most 13 five-bit chunks
+_MAX_CHUNKS = 13
+
+def encode_polyline(coords: Union[Sequence[Tuple[float, float]], np.ndarray], precision: int = 5) -> str:
+    """
+    Encode (lat, lon) coordinates with the Google encoded polyline algorithm.
+
+    The whole coordinate array is processed with vectorized NumPy operations,
+    so long routes are encoded without a Python-level loop per point.
+    """
+    points = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if len(points) == 0:
+        return ''
+
+    scaled = np.round(points * (10 ** precision)).astype(np.int64)
+    deltas = np.diff(scaled, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    # Zig-zag encode so small negative deltas also become small numbers
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    shifts = np.arange(_MAX_CHUNKS, dtype=np.int64) * 5
+    remaining = values[:, None] >> shifts
+    chunks = remaining & 0x1f
+    has_more = (remaining >> 5) > 0
+    # Always emit the first chunk, then every chunk that still carries bits
+    used = np.concatenate([np.ones((len(values), 1), dtype=bool), has_more[:, :-1]], axis=1)
+
+    chars = (chunks | np.where(has_more, 0x20, 0)) + 63
+    return chars[used].astype(np.uint8).tobytes().decode('ascii')
+
+def decode_polyline(encoded: str, precision: int = 5) -> List[Tuple[float, float]]:
+    """Decode a Google encoded polyline into (lat, lon) coordinates."""
+    values = []
+    value = shift = 0
+    for char in encoded:
+        byte = ord(char) - 63
+        value |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+
+    factor = 10 ** precision
+    deltas = np.array(values, dtype=np.int64).reshape(-1, 2)
+    return [(lat / factor, lon / factor) for lat, lon in np.cumsum(deltas, axis=0).tolist()]
+
+def zoom_tolerance(zoom: float, latitude: float) -> float:
+    """Return the simplification tolerance in meters: one map pixel at the given zoom."""
+    return _METERS_PER_PIXEL_Z0 * cos(radians(latitude)) / (2 ** zoom)
+
+def simplify(coords: Union[Sequence[Tuple[float, float]], np.ndarray], tolerance: float) -> np.ndarray:
+    """
+    Simplify a (lat, lon) line with the Douglas-Peucker algorithm.
+
+    Args:
+        coords: Line coordinates as (lat, lon) pairs
+        tolerance: Maximum allowed deviation in meters
+
+    Returns:
+        The retained coordinates as an (n, 2) array, always keeping both ends.
+    """
+    points = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if len(points) < 3:
+        return points
+
+    # Project to a local equirectangular plane in meters
+    lat0 = radians(points[:, 0].mean())
+    xy = np.empty_like(points)
+    xy[:, 0] = np.radians(points[:, 1]) * cos(lat0) * 6371000.0
+    xy[:, 1] = np.radians(points[:, 0]) * 6371000.0
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+
+        start = xy[first]
+        segment = xy[last] - start
+        offsets = xy[first + 1:last] - start
+        length = np.hypot(segment[0], segment[1])
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            split = first + 1 + index
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+
+    return points[keep]
+
+def format_geometry(coords: Union[Sequence[Tuple[float, float]], np.ndarray],
+                    geometry_format: str = 'geojson',
+                    zoom: float = None) -> Union[Dict, str]:
+    """
+    Convert route coordinates to the requested output format.
+
+    Args:
+        coords: Route coordinates as (lat, lon) pairs
+        geometry_format: One of GEOMETRY_FORMATS
+        zoom: Map zoom level used to pick the tolerance for 'simplified'
+
+    Returns:
+        A GeoJSON LineString dict for 'geojson' and 'simplified', or an
+        encoded polyline string for 'polyline5' and 'polyline6'.
+    """
+    if geometry_format not in GEOMETRY_FORMATS:
+        raise ValueError(f"Unknown geometry format: {geometry_format}")
+
+    points = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if geometry_format == 'polyline5':
+        return encode_polyline(points, precision=5)
+    if geometry_format == 'polyline6':
+        return encode_polyline(points, precision=6)
+    if geometry_format == 'simplified' and len(points):
+        if zoom is None:
+            zoom = DEFAULT_SIMPLIFY_ZOOM
+        points = simplify(points, zoom_tolerance(zoom, float(points[:, 0].mean())))
+
+    return {
+        "type": "LineString",
+        "coordinates": points[:, ::-1].tolist()
+    }
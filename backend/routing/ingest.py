@@ -0,0 +1,128 @@
+"""
+One-pass OSM ingestion shared by the routing graph and the address index.
+
+The extract is read once; every node's coordinates go into a single
+compact CoordinateStore and each element is dispatched to the registered
+consumers. Consumers look coordinates up in the shared store instead of
+keeping their own copy.
+"""
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+from .osm_reader import iter_osm_elements
+from .pbf import Element
+
+class CoordinateStore:
+    """
+    Node id -> (lat, lon) store backed by flat arrays (24 bytes per node).
+
+    OSM extracts list nodes by ascending id, so lookups are a binary search
+    over the id array. If ids ever arrive out of order the store switches
+    to a dict index.
+    """
+
+    def __init__(self):
+        self.ids = array('q')
+        self.lats = array('d')
+        self.lons = array('d')
+        self._index: Optional[Dict[int, int]] = None  # only used for unsorted input
+
+    def add(self, node_id: int, lat: float, lon: float):
+        if self._index is None and self.ids and node_id <= self.ids[-1]:
+            self._index = {existing: i for i, existing in enumerate(self.ids)}
+        if self._index is not None:
+            self._index[node_id] = len(self.ids)
+        self.ids.append(node_id)
+        self.lats.append(lat)
+        self.lons.append(lon)
+
+    def _position(self, node_id: int) -> int:
+        if self._index is not None:
+            return self._index.get(node_id, -1)
+        i = bisect_left(self.ids, node_id)
+        if i < len(self.ids) and self.ids[i] == node_id:
+            return i
+        return -1
+
+    def get(self, node_id: int) -> Optional[Tuple[float, float]]:
+        i = self._position(node_id)
+        if i < 0:
+            return None
+        return self.lats[i], self.lons[i]
+
+    def __contains__(self, node_id: int) -> bool:
+        return self._position(node_id) >= 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_arrays(cls, ids: array, lats: array, lons: array) -> 'CoordinateStore':
+        """Store over existing columns; ids must be sorted ascending."""
+        store = cls()
+        store.ids, store.lats, store.lons = ids, lats, lons
+        return store
+
+class OSMConsumer:
+    """
+    Base class for ingestion consumers. Override the callbacks you need;
+    self.coords is the shared CoordinateStore and is bound before the first
+    callback.
+    """
+    coords: CoordinateStore = None
+
+    def node(self, node_id: int, lat: float, lon: float, tags: Dict[str, str]):
+        pass
+
+    def way(self, way_id: int, refs: List[int], tags: Dict[str, str]):
+        pass
+
+    def relation(self, relation_id: int, members: List[Tuple[str, int, str]], tags: Dict[str, str]):
+        pass
+
+    def finish(self):
+        """Called once after the last element."""
+        pass
+
+def ingest_osm(filename: str, consumers: Iterable[OSMConsumer], workers: int = None,
+               coords: CoordinateStore = None) -> CoordinateStore:
+    """
+    Read an .osm, .osm.pbf or Overpass .json file once and feed every element
+    to the consumers.
+
+    Returns the shared CoordinateStore so callers can reuse it or drop it.
+    """
+    return ingest_elements(iter_osm_elements(filename, workers=workers), consumers, coords)
+
+def ingest_elements(elements: Iterable[Element], consumers: Iterable[OSMConsumer],
+                    coords: CoordinateStore = None) -> CoordinateStore:
+    """Feed a stream of element tuples to the consumers (see ingest_osm)."""
+    consumers = list(consumers)
+    if coords is None:
+        coords = CoordinateStore()
+    for consumer in consumers:
+        consumer.coords = coords
+
+    node_handlers = [consumer.node for consumer in consumers]
+    way_handlers = [consumer.way for consumer in consumers]
+    relation_handlers = [consumer.relation for consumer in consumers]
+
+    for element in elements:
+        kind = element[0]
+        if kind == 'node':
+            _, node_id, lat, lon, tags = element
+            coords.add(node_id, lat, lon)
+            for handler in node_handlers:
+                handler(node_id, lat, lon, tags)
+        elif kind == 'way':
+            _, way_id, refs, tags = element
+            for handler in way_handlers:
+                handler(way_id, refs, tags)
+        else:
+            _, relation_id, members, tags = element
+            for handler in relation_handlers:
+                handler(relation_id, members, tags)
+
+    for consumer in consumers:
+        consumer.finish()
+    return coords
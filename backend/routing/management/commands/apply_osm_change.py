@@ -0,0 +1,39 @@
+"""
+Management command to publish an osmChange diff to the running routing graph and address index.
+"""
+from collections import Counter
+from django.core.management.base import BaseCommand, CommandError
+from routing.osc import change_log, iter_osc_changes
+
+class Command(BaseCommand):
+    help = ('Apply an .osc/.osc.gz diff to the loaded routing graph and address index '
+            'without rebuilding them from a full extract')
+
+    def add_arguments(self, parser):
+        parser.add_argument('osc_file', nargs='?',
+                            help='osmChange file to publish')
+        parser.add_argument('--clear', action='store_true',
+                            help='Remove all published diffs after the base extract was refreshed '
+                                 '(restart the workers afterwards)')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            removed = change_log.clear()
+            self.stdout.write(self.style.SUCCESS(f'Removed {removed} published diffs'))
+            return
+        if not options['osc_file']:
+            raise CommandError('Give an .osc file to apply, or --clear')
+
+        # Parse the whole diff first so a broken file is never published
+        counts = Counter()
+        try:
+            for action, element in iter_osc_changes(options['osc_file']):
+                counts[(action, element[0])] += 1
+        except (OSError, ValueError, SyntaxError) as e:
+            raise CommandError(f'Invalid osmChange file: {e}')
+
+        sequence = change_log.publish(options['osc_file'])
+        for (action, kind), count in sorted(counts.items()):
+            self.stdout.write(f'{action} {kind}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Published diff #{sequence}, graph version {change_log.store.version}'))
@@ -0,0 +1,52 @@
+"""
+Management command to apply live edge closures and speed overrides.
+"""
+import json
+from django.core.management.base import BaseCommand, CommandError
+from routing.overlay import overlay_store
+
+class Command(BaseCommand):
+    help = 'Close/reopen roads and override speeds on the in-memory routing graphs without reloading them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--close-way', type=int, action='append', default=[], metavar='WAY_ID',
+                            help='Close every edge of an OSM way')
+        parser.add_argument('--reopen-way', type=int, action='append', default=[], metavar='WAY_ID',
+                            help='Reopen a closed OSM way')
+        parser.add_argument('--close-edge', type=int, nargs=2, action='append', default=[], metavar=('FROM', 'TO'),
+                            help='Close a single directed edge between two OSM nodes')
+        parser.add_argument('--reopen-edge', type=int, nargs=2, action='append', default=[], metavar=('FROM', 'TO'),
+                            help='Reopen a closed directed edge')
+        parser.add_argument('--way-speed', nargs=2, action='append', default=[], metavar=('WAY_ID', 'KMH'),
+                            help='Override the speed of an OSM way (use "none" to remove the override)')
+        parser.add_argument('--edge-speed', nargs=3, action='append', default=[], metavar=('FROM', 'TO', 'KMH'),
+                            help='Override the speed of a directed edge (use "none" to remove the override)')
+        parser.add_argument('--clear', action='store_true',
+                            help='Remove all closures and speed overrides')
+
+    def handle(self, *args, **options):
+        try:
+            if options['clear']:
+                overlay = overlay_store.clear()
+            elif any(options[key] for key in ('close_way', 'reopen_way', 'close_edge', 'reopen_edge',
+                                              'way_speed', 'edge_speed')):
+                overlay = overlay_store.apply(
+                    close_ways=options['close_way'],
+                    reopen_ways=options['reopen_way'],
+                    close_edges=[tuple(edge) for edge in options['close_edge']],
+                    reopen_edges=[tuple(edge) for edge in options['reopen_edge']],
+                    way_speeds={int(way_id): self._parse_speed(speed) for way_id, speed in options['way_speed']},
+                    edge_speeds={(int(u), int(v)): self._parse_speed(speed) for u, v, speed in options['edge_speed']},
+                )
+            else:
+                # Nothing to change, just show the current overlay
+                overlay = overlay_store.current()
+        except ValueError as e:
+            raise CommandError(f'Invalid overlay update: {e}')
+
+        self.stdout.write(json.dumps(overlay.to_dict(), indent=2))
+        self.stdout.write(self.style.SUCCESS(f'Graph version: {overlay.version}'))
+
+    @staticmethod
+    def _parse_speed(value: str):
+        return None if value.lower() == 'none' else float(value)
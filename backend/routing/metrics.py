@@ -0,0 +1,179 @@
+import bisect
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Default histogram buckets for timings (seconds) and search sizes (counts)
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000, 500000, 1000000)
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ''
+    escaped = (k + '="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+               for k, v in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonically increasing counter, optionally split by labels."""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(key)} {_format_value(value)}')
+        return lines
+
+class Histogram:
+    """Cumulative bucket histogram, optionally split by labels."""
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = TIME_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[Tuple[str, str], ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(sorted(labels.items())))
+        return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = (('le', _format_value(bound)),)
+                    lines.append(f'{self.name}_bucket{_format_labels(key, le)} {cumulative}')
+                lines.append(f'{self.name}_sum{_format_labels(key)} {_format_value(total)}')
+                lines.append(f'{self.name}_count{_format_labels(key)} {count}')
+        return lines
+
+class MetricsRegistry:
+    """Process-wide collection of metrics rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, name: str, factory):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._get_or_create(name, lambda: Counter(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float] = TIME_BUCKETS) -> Histogram:
+        return self._get_or_create(name, lambda: Histogram(name, help_text, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+
+class SearchStats:
+    """Counters and timings (seconds) collected for a single route query."""
+
+    __slots__ = ('nodes_popped', 'edges_relaxed', 'heap_peak', 'heuristic_time',
+                 'snap_time', 'search_time', 'postprocess_time')
+
+    def __init__(self):
+        self.nodes_popped = 0
+        self.edges_relaxed = 0
+        # None when the engine cannot observe its priority queue
+        self.heap_peak: Optional[int] = 0
+        self.heuristic_time = 0.0
+        self.snap_time = 0.0
+        self.search_time = 0.0
+        self.postprocess_time = 0.0
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def to_header(self) -> str:
+        """Compact single-line form for a debug response header."""
+        parts = []
+        for name, value in self.to_dict().items():
+            if value is None:
+                continue
+            parts.append(f'{name}={value:.6f}' if isinstance(value, float) else f'{name}={value}')
+        return ';'.join(parts)
+
+# Recorded once per graph search (A* run); a query may run several, e.g. one per transport mode
+_SEARCH_COUNTS = {
+    'nodes_popped': 'Nodes popped from the open set per route search',
+    'edges_relaxed': 'Edges relaxed (tentative cost improved) per route search',
+    'heap_peak': 'Peak open set size per route search',
+}
+_SEARCH_RUN_TIMES = {
+    'heuristic_time': 'Time spent evaluating the A* heuristic per route search',
+}
+# Recorded once per route query
+_SEARCH_TIMES = {
+    'snap_time': 'Time spent snapping coordinates to graph nodes per route query',
+    'search_time': 'Time spent in the graph search per route query',
+    'postprocess_time': 'Time spent building the route response per route query',
+}
+
+def record_search_run(search: SearchStats, engine: str, stats: SearchStats = None):
+    """
+    Aggregate the counters of one graph search into the routing search
+    histograms, and add them to the query's stats if given.
+    """
+    for name, help_text in _SEARCH_COUNTS.items():
+        value = getattr(search, name)
+        if value is not None:
+            registry.histogram(f'routing_search_{name}', help_text, COUNT_BUCKETS).observe(value, engine=engine)
+    for name, help_text in _SEARCH_RUN_TIMES.items():
+        registry.histogram(f'routing_search_{name}_seconds', help_text).observe(getattr(search, name), engine=engine)
+    if stats is not None:
+        stats.nodes_popped += search.nodes_popped
+        stats.edges_relaxed += search.edges_relaxed
+        stats.heap_peak = None if None in (stats.heap_peak, search.heap_peak) else max(stats.heap_peak, search.heap_peak)
+        stats.heuristic_time += search.heuristic_time
+
+def record_search(stats: SearchStats, engine: str):
+    """Aggregate one query's timings into the routing search histograms; searches go through record_search_run()."""
+    for name, help_text in _SEARCH_TIMES.items():
+        registry.histogram(f'routing_search_{name}_seconds', help_text).observe(getattr(stats, name), engine=engine)
@@ -0,0 +1,125 @@
+"""
+osmChange (.osc) diffs and the log that distributes them to running workers.
+
+A diff is applied in place to the loaded routing graph and address index
+instead of rebuilding them from a fresh extract. The apply_osm_change
+command publishes a diff into the change log and bumps the graph version;
+every worker notices the new version on its next request and applies the
+diffs it has not seen yet, in order.
+"""
+import gzip
+import os
+import shutil
+import threading
+import xml.etree.ElementTree as ET
+from typing import Iterator, List, Tuple
+from .overlay import OverlayStore, overlay_store
+from .pbf import ALL_KINDS, Element
+
+try:
+    import fcntl  # Serializes publishers across processes (POSIX only)
+except ImportError:
+    fcntl = None
+
+DEFAULT_CHANGES_DIR = os.environ.get(
+    'OSM_CHANGES_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'osm_changes')
+)
+
+CHANGE_ACTIONS = ('create', 'modify', 'delete')
+
+# (action, element); deleted elements may carry no coordinates, refs or tags
+Change = Tuple[str, Element]
+
+def _open_osc(filename: str):
+    return gzip.open(filename, 'rb') if str(filename).lower().endswith('.gz') else open(filename, 'rb')
+
+def iter_osc_changes(filename: str) -> Iterator[Change]:
+    """Stream (action, element) pairs from an .osc or .osc.gz file in file order."""
+    with _open_osc(filename) as f:
+        context = ET.iterparse(f, events=('start', 'end'))
+        _, root = next(context)
+        if root.tag != 'osmChange':
+            raise ValueError(f"Not an osmChange file: root element is <{root.tag}>")
+
+        action = action_elem = None
+        for event, elem in context:
+            if elem.tag in CHANGE_ACTIONS:
+                action, action_elem = (elem.tag, elem) if event == 'start' else (None, None)
+                if event == 'end':
+                    root.clear()
+                continue
+            if event != 'end' or elem.tag not in ALL_KINDS or action is None:
+                continue
+
+            tags = {tag.get('k'): tag.get('v') for tag in elem.iter('tag')}
+            element_id = int(elem.get('id'))
+            if elem.tag == 'node':
+                lat, lon = elem.get('lat'), elem.get('lon')
+                change = ('node', element_id, float(lat) if lat else None, float(lon) if lon else None, tags)
+            elif elem.tag == 'way':
+                change = ('way', element_id, [int(nd.get('ref')) for nd in elem.iter('nd')], tags)
+            else:
+                members = [(member.get('type'), int(member.get('ref')), member.get('role', ''))
+                           for member in elem.iter('member')]
+                change = ('relation', element_id, members, tags)
+            # Drop the parsed element so large <create>/<modify> blocks stay small
+            action_elem.clear()
+            yield action, change
+
+class ChangeLog:
+    """
+    Directory of published diffs named by sequence number (00000001.osc, ...).
+
+    Publishing copies the diff in and then bumps the graph version, so a
+    worker that sees the new version always finds the file.
+    """
+
+    def __init__(self, path: str = DEFAULT_CHANGES_DIR, store: OverlayStore = overlay_store):
+        self.path = path
+        self.store = store
+        self._lock = threading.Lock()
+
+    def _entries(self) -> List[Tuple[int, str]]:
+        if not os.path.isdir(self.path):
+            return []
+        entries = []
+        for name in os.listdir(self.path):
+            sequence, _, suffix = name.partition('.')
+            if sequence.isdigit() and suffix in ('osc', 'osc.gz'):
+                entries.append((int(sequence), os.path.join(self.path, name)))
+        return sorted(entries)
+
+    def last_sequence(self) -> int:
+        entries = self._entries()
+        return entries[-1][0] if entries else 0
+
+    def pending(self, after: int) -> List[Tuple[int, str]]:
+        """Diffs published after the given sequence number, oldest first."""
+        return [(sequence, path) for sequence, path in self._entries() if sequence > after]
+
+    def publish(self, osc_file: str) -> int:
+        """Copy a diff into the log, bump the graph version and return its sequence number."""
+        suffix = 'osc.gz' if osc_file.lower().endswith('.gz') else 'osc'
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock, open(os.path.join(self.path, '.lock'), 'w') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            sequence = self.last_sequence() + 1
+            target = os.path.join(self.path, f'{sequence:08d}.{suffix}')
+            tmp_path = f'{target}.{os.getpid()}.tmp'
+            shutil.copyfile(osc_file, tmp_path)
+            os.replace(tmp_path, target)
+            self.store.bump_version()
+        return sequence
+
+    def clear(self) -> int:
+        """Remove every published diff, e.g. after the base extract was refreshed; returns how many."""
+        entries = self._entries()
+        for _, path in entries:
+            os.remove(path)
+        return len(entries)
+
+# Process-wide log followed by the routing service and the geocoder
+change_log = ChangeLog()
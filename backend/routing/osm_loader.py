@@ -1,8 +1,15 @@
-import xml.etree.ElementTree as ET
-from typing import Dict, Set, Tuple, List
+from array import array
+from typing import Dict, Iterable, Set, Tuple, List, Optional
 from .astar import RoutingGraph
+from .osm_reader import iter_osm_elements
+from .ingest import CoordinateStore, OSMConsumer
+
+class OSMLoader(OSMConsumer):
+    """
+    Builds a RoutingGraph from OSM data, either standalone via load_osm()
+    or as a consumer of the shared one-pass ingest_osm() pipeline.
+    """
 
-class OSMLoader:
     def __init__(self):
         self.graph = RoutingGraph()
         self.way_nodes: Set[int] = set()
@@ -22,67 +29,175 @@ class OSMLoader:
         }
         self.node_ways: Dict[int, List[int]] = {}  # node_id -> list of way_ids
         self.way_tags: Dict[int, Dict] = {}  # way_id -> tags
+        self.way_refs: Dict[int, array] = {}  # way_id -> node refs, routable ways only
+        self.restrictions: List[Tuple[int, int, int, bool]] = []  # (via_node, from_way, to_way, allowed)
+
+    def load_osm(self, filename: str, workers: int = None):
+        """
+        Load an OSM XML (.osm) or PBF (.osm.pbf) file and build routing graph.
 
-    def load_osm(self, filename: str):
-        """Load OSM XML file and build routing graph."""
-        tree = ET.parse(filename)
-        root = tree.getroot()
-
-        # First pass: collect all nodes that are part of ways and their ways
-        for way in root.findall('.//way'):
-            way_id = int(way.get('id'))
-            if self._is_routable_way(way):
-                # Store way tags
-                self.way_tags[way_id] = {
-                    tag.get('k'): tag.get('v')
-                    for tag in way.findall('tag')
-                }
-                
-                for nd in way.findall('nd'):
-                    node_id = int(nd.get('ref'))
-                    self.way_nodes.add(node_id)
-                    
-                    if node_id not in self.node_ways:
-                        self.node_ways[node_id] = []
-                    self.node_ways[node_id].append(way_id)
-
-        # Second pass: add nodes to graph
-        for node in root.findall('.//node'):
-            node_id = int(node.get('id'))
+        The file is streamed twice and nothing but the routable ways' node
+        refs and coordinates is kept, so memory stays bounded on large
+        extracts. workers sets the number of PBF block decoding processes.
+        """
+        # First pass: collect routable ways, the nodes they use and turn restrictions
+        for element in iter_osm_elements(filename, ('way', 'relation'), workers=workers):
+            if element[0] == 'way':
+                self.way(*element[1:])
+            else:
+                self.relation(*element[1:])
+
+        # Second pass: add coordinates of the nodes used by routable ways
+        self.coords = CoordinateStore()
+        for _, node_id, lat, lon, _ in iter_osm_elements(filename, ('node',), workers=workers):
             if node_id in self.way_nodes:
-                self.graph.add_node(
-                    node_id,
-                    float(node.get('lat')),
-                    float(node.get('lon'))
-                )
-
-        # Third pass: add edges and detect turn restrictions
-        for way in root.findall('.//way'):
-            way_id = int(way.get('id'))
-            if way_id in self.way_tags:
-                nodes = [int(nd.get('ref')) for nd in way.findall('nd')]
-                speed_limit = self._get_speed_limit(way_id)
-                oneway = self._is_oneway(way_id)
-                
-                for i in range(len(nodes) - 1):
-                    self.graph.add_edge(
-                        nodes[i],
-                        nodes[i + 1],
-                        bidirectional=not oneway,
-                        speed_limit=speed_limit
-                    )
-
-        # Fourth pass: process turn restrictions
-        for relation in root.findall('.//relation'):
-            if self._is_turn_restriction(relation):
-                self._process_turn_restriction(relation)
-
-    def _is_routable_way(self, way) -> bool:
+                self.coords.add(node_id, lat, lon)
+                self.graph.add_node(node_id, lat, lon)
+
+        self._build_edges()
+
+    def way(self, way_id: int, refs: List[int], tags: Dict[str, str]):
+        """Collect a routable way and the nodes it uses."""
+        if not self._is_routable_way(tags):
+            return
+        self._register_way(way_id, array('q', refs), tags)
+
+    def _register_way(self, way_id: int, refs: array, tags: Dict[str, str]):
+        # Store way tags
+        self.way_tags[way_id] = tags
+        self.way_refs[way_id] = refs
+
+        for node_id in refs:
+            self.way_nodes.add(node_id)
+
+            if node_id not in self.node_ways:
+                self.node_ways[node_id] = []
+            self.node_ways[node_id].append(way_id)
+
+    def relation(self, relation_id: int, members: List[Tuple[str, int, str]], tags: Dict[str, str]):
+        """Collect a turn restriction relation."""
+        if self._is_turn_restriction(tags):
+            restriction = self._process_turn_restriction(members, tags)
+            if restriction:
+                self.restrictions.append(restriction)
+
+    def finish(self):
+        """Build the graph from the shared coordinate store after ingest_osm()."""
+        for node_id in self.way_nodes:
+            coord = self.coords.get(node_id)
+            if coord:
+                self.graph.add_node(node_id, *coord)
+        self._build_edges()
+
+    def _build_edges(self):
+        """Add edges from the stored way node refs and apply turn restrictions."""
+        for way_id in self.way_refs:
+            self._add_way_edges(way_id)
+
+        # Apply turn restrictions now that their via nodes exist
+        for via_node, from_way, to_way, allowed in self.restrictions:
+            self.graph.add_turn_restriction(via_node, from_way, to_way, allowed)
+
+    def _add_way_edges(self, way_id: int):
+        nodes = self.way_refs[way_id]
+        speed_limit = self._get_speed_limit(way_id)
+        oneway = self._is_oneway(way_id)
+
+        for i in range(len(nodes) - 1):
+            self.graph.add_edge(
+                nodes[i],
+                nodes[i + 1],
+                bidirectional=not oneway,
+                speed_limit=speed_limit,
+                way_id=way_id
+            )
+
+    def _remove_way(self, way_id: int) -> Tuple[array, Dict]:
+        """Drop a way's edges (plain or contracted) and bookkeeping; returns its refs and tags."""
+        refs = self.way_refs.pop(way_id)
+        tags = self.way_tags.pop(way_id)
+        for node_id in set(refs):
+            node = self.graph.nodes.get(node_id)
+            if node is not None:
+                for neighbor_id in [n for n, edge in node.adjacent.items() if edge['way_id'] == way_id]:
+                    del node.adjacent[neighbor_id]
+            ways = self.node_ways.get(node_id)
+            if ways is not None:
+                ways[:] = [w for w in ways if w != way_id]
+        return refs, tags
+
+    def apply_changes(self, changes: Iterable[Tuple[str, tuple]], contract: bool = False) -> Set[int]:
+        """
+        Apply an osmChange stream (see routing.osc) to the loaded graph.
+
+        Only the ways that changed, or that use a moved node, are rebuilt;
+        nodes no routable way uses any more are dropped. If the graph was
+        contracted, the rebuilt ways are contracted again. Turn restriction
+        relations in the diff are ignored. Returns the ids of rebuilt ways.
+        """
+        if self.coords is None:
+            raise ValueError("Changes can only be applied to a graph built by this loader")
+
+        moved_nodes: Set[int] = set()
+        way_changes: Dict[int, Tuple[List[int], Dict]] = {}
+        for action, element in changes:
+            if element[0] == 'node':
+                _, node_id, lat, lon, _ = element
+                if action != 'delete':
+                    self.coords.add(node_id, lat, lon)
+                    moved_nodes.add(node_id)
+            elif element[0] == 'way':
+                _, way_id, refs, tags = element
+                way_changes[way_id] = None if action == 'delete' else (refs, tags)
+
+        affected = set(way_changes)
+        for node_id in moved_nodes:
+            affected.update(self.node_ways.get(node_id, ()))
+        # A changed way that reaches a node folded into a compound edge needs that
+        # node back as a junction, so the ways through it are rebuilt as well
+        for refs, _ in filter(None, way_changes.values()):
+            for node_id in refs:
+                if node_id not in self.graph.nodes:
+                    affected.update(self.node_ways.get(node_id, ()))
+
+        touched: Set[int] = set()
+        for way_id in affected:
+            old = self._remove_way(way_id) if way_id in self.way_refs else None
+            if old is not None:
+                touched.update(old[0])
+            if way_id in way_changes:
+                if way_changes[way_id] is not None:
+                    self.way(way_id, *way_changes[way_id])
+            elif old is not None:
+                # Only a node moved; keep the way as it was stored
+                self._register_way(way_id, *old)
+
+        rebuilt = {way_id for way_id in affected if way_id in self.way_refs}
+        for way_id in rebuilt:
+            for node_id in self.way_refs[way_id]:
+                touched.add(node_id)
+                coord = self.coords.get(node_id)
+                node = self.graph.nodes.get(node_id)
+                if node is None and coord is not None:
+                    self.graph.add_node(node_id, *coord)
+                elif node is not None and coord is not None:
+                    node.lat, node.lon = coord
+            self._add_way_edges(way_id)
+
+        # Nodes left without a routable way disappear from the graph
+        for node_id in touched:
+            if not self.node_ways.get(node_id):
+                self.node_ways.pop(node_id, None)
+                self.way_nodes.discard(node_id)
+                self.graph.nodes.pop(node_id, None)
+
+        if contract:
+            self.graph.contract_degree2(touched)
+        return rebuilt
+
+    def _is_routable_way(self, tags: Dict[str, str]) -> bool:
         """Check if way is routable (has acceptable highway tag)."""
-        for tag in way.findall('tag'):
-            if tag.get('k') == 'highway' and tag.get('v') in self.highway_types:
-                return True
-        return False
+        return tags.get('highway') in self.highway_types
 
     def _is_oneway(self, way_id: int) -> bool:
         """Check if way is one-way."""
@@ -107,38 +222,30 @@ class OSMLoader:
         highway_type = tags.get('highway')
         return self.highway_types.get(highway_type, 50.0)
 
-    def _is_turn_restriction(self, relation) -> bool:
+    def _is_turn_restriction(self, tags: Dict[str, str]) -> bool:
         """Check if relation is a turn restriction."""
-        for tag in relation.findall('tag'):
-            if (tag.get('k') == 'type' and 
-                tag.get('v') == 'restriction'):
-                return True
-        return False
-
-    def _process_turn_restriction(self, relation):
-        """Process turn restriction relation."""
+        return tags.get('type') == 'restriction'
+
+    def _process_turn_restriction(self, members: List[Tuple[str, int, str]],
+                                  tags: Dict[str, str]) -> Optional[Tuple[int, int, int, bool]]:
+        """Parse turn restriction relation into (via_node, from_way, to_way, allowed); None if incomplete."""
         from_way = to_way = via_node = None
-        restriction_type = None
-        
-        # Get restriction details
-        for tag in relation.findall('tag'):
-            if tag.get('k') == 'restriction':
-                restriction_type = tag.get('v')
+        restriction_type = tags.get('restriction')
         
         # Get members
-        for member in relation.findall('member'):
-            role = member.get('role')
+        for _, ref, role in members:
             if role == 'from':
-                from_way = int(member.get('ref'))
+                from_way = ref
             elif role == 'to':
-                to_way = int(member.get('ref'))
+                to_way = ref
             elif role == 'via':
-                via_node = int(member.get('ref'))
+                via_node = ref
         
-        if from_way and to_way and via_node:
+        if from_way and to_way and via_node and restriction_type:
             # Determine if turn is allowed based on restriction type
             allowed = restriction_type.startswith('only_')
-            self.graph.add_turn_restriction(via_node, from_way, to_way, allowed)
+            return via_node, from_way, to_way, allowed
+        return None
 
     def get_graph(self) -> RoutingGraph:
         return self.graph 
\ No newline at end of file
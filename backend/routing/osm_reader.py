@@ -0,0 +1,91 @@
+"""
+Format-independent streaming access to OSM extracts.
+
+Both the routing graph loader and the address geocoder consume OSM data as
+a stream of element tuples (see routing.pbf for the layout), regardless of
+whether the source is .osm XML, .osm.pbf or a cached Overpass JSON response.
+"""
+import json
+import xml.etree.ElementTree as ET
+from typing import Iterable, Iterator
+from .pbf import ALL_KINDS, Element, PBFReader
+
+def is_pbf(filename: str) -> bool:
+    return str(filename).lower().endswith('.pbf')
+
+def iter_xml_elements(filename: str, kinds: Iterable[str] = ALL_KINDS) -> Iterator[Element]:
+    """
+    Stream elements from an OSM XML file with iterparse.
+
+    Each top-level element is converted to a tuple and then cleared, so the
+    XML tree never holds more than the element being read.
+    """
+    kinds = frozenset(kinds)
+    context = ET.iterparse(filename, events=('start', 'end'))
+    _, root = next(context)
+    for event, elem in context:
+        if event != 'end' or elem.tag not in ALL_KINDS:
+            continue
+
+        if elem.tag in kinds:
+            tags = {tag.get('k'): tag.get('v') for tag in elem.iter('tag')}
+            if elem.tag == 'node':
+                yield ('node', int(elem.get('id')), float(elem.get('lat')), float(elem.get('lon')), tags)
+            elif elem.tag == 'way':
+                yield ('way', int(elem.get('id')), [int(nd.get('ref')) for nd in elem.iter('nd')], tags)
+            else:
+                members = [(member.get('type'), int(member.get('ref')), member.get('role', ''))
+                           for member in elem.iter('member')]
+                yield ('relation', int(elem.get('id')), members, tags)
+
+        # Drop everything parsed so far under <osm>
+        root.clear()
+
+def is_overpass_json(filename: str) -> bool:
+    return str(filename).lower().endswith('.json')
+
+def iter_overpass_elements(filenames: Iterable[str], kinds: Iterable[str] = ALL_KINDS) -> Iterator[Element]:
+    """
+    Stream elements from Overpass JSON responses (e.g. the osmnx cache).
+
+    Files are read one at a time. Neighbouring queries overlap, so elements
+    already seen in an earlier file are skipped. Files that are not Overpass
+    responses are ignored.
+    """
+    kinds = frozenset(kinds)
+    seen = {kind: set() for kind in ALL_KINDS}
+    for filename in filenames:
+        with open(filename, encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or 'elements' not in data:
+            continue
+
+        for element in data['elements']:
+            kind = element.get('type')
+            if kind not in kinds or element['id'] in seen[kind]:
+                continue
+            seen[kind].add(element['id'])
+            tags = element.get('tags', {})
+            if kind == 'node':
+                yield ('node', element['id'], element['lat'], element['lon'], tags)
+            elif kind == 'way':
+                yield ('way', element['id'], element.get('nodes', []), tags)
+            else:
+                members = [(member['type'], member['ref'], member.get('role', ''))
+                           for member in element.get('members', [])]
+                yield ('relation', element['id'], members, tags)
+        # Drop the parsed response before reading the next one
+        del data
+
+def iter_osm_elements(filename: str, kinds: Iterable[str] = ALL_KINDS, workers: int = None) -> Iterator[Element]:
+    """
+    Stream elements of the given kinds ('node', 'way', 'relation') from an
+    .osm, .osm.pbf or Overpass .json file, in file order. workers sets the
+    number of PBF decoding processes (defaults to the CPU count); XML and
+    JSON are always parsed in-process.
+    """
+    if is_overpass_json(filename):
+        return iter_overpass_elements([filename], kinds)
+    if is_pbf(filename):
+        return PBFReader(filename, workers=workers).iter_elements(kinds)
+    return iter_xml_elements(filename, kinds)
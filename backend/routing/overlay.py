@@ -0,0 +1,204 @@
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, FrozenSet, Iterable, Mapping, Optional, Tuple, Union
+
+try:
+    import fcntl  # Serializes writers across worker processes (POSIX only)
+except ImportError:
+    fcntl = None
+
+# Overlay file shared by all workers and the edge_overlay management command
+DEFAULT_OVERLAY_PATH = os.environ.get(
+    'EDGE_OVERLAY_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'edge_overlay.json')
+)
+
+EdgeKey = Tuple[int, int]
+WayId = Union[int, Iterable[int], None]
+
+class EdgeOverlay:
+    """
+    Immutable snapshot of live edge closures and speed overrides.
+
+    A query grabs one snapshot when it starts and uses it until it ends, so
+    updates published in the meantime never change the weights under an
+    in-flight search. Edges are keyed by OSM way id (all edges of the way) or
+    by directed (from_node, to_node) OSM node id pairs.
+    """
+
+    __slots__ = ('version', 'updated_at', 'closed_ways', 'closed_edges', 'way_speeds', 'edge_speeds')
+
+    def __init__(self, version: int = 0, updated_at: str = None,
+                 closed_ways: FrozenSet[int] = frozenset(),
+                 closed_edges: FrozenSet[EdgeKey] = frozenset(),
+                 way_speeds: Mapping[int, float] = None,
+                 edge_speeds: Mapping[EdgeKey, float] = None):
+        self.version = version
+        self.updated_at = updated_at
+        self.closed_ways = frozenset(closed_ways)
+        self.closed_edges = frozenset(closed_edges)
+        self.way_speeds: Dict[int, float] = dict(way_speeds or {})
+        self.edge_speeds: Dict[EdgeKey, float] = dict(edge_speeds or {})
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.closed_ways or self.closed_edges or self.way_speeds or self.edge_speeds)
+
+    def is_closed(self, way_id: WayId, from_id: int = None, to_id: int = None) -> bool:
+        """Check if an edge is closed. way_id may be a list for merged osmnx edges."""
+        if (from_id, to_id) in self.closed_edges:
+            return True
+        if not self.closed_ways or way_id is None:
+            return False
+        if isinstance(way_id, (list, tuple, set)):
+            return any(w in self.closed_ways for w in way_id)
+        return way_id in self.closed_ways
+
+    def speed_for(self, way_id: WayId, from_id: int = None, to_id: int = None) -> Optional[float]:
+        """Return the overridden speed (km/h) of an edge, or None if it has no override."""
+        speed = self.edge_speeds.get((from_id, to_id))
+        if speed is not None or not self.way_speeds or way_id is None:
+            return speed
+        if isinstance(way_id, (list, tuple, set)):
+            speeds = [self.way_speeds[w] for w in way_id if w in self.way_speeds]
+            return min(speeds) if speeds else None
+        return self.way_speeds.get(way_id)
+
+    def to_dict(self) -> Dict:
+        return {
+            'version': self.version,
+            'updated_at': self.updated_at,
+            'closed_ways': sorted(self.closed_ways),
+            'closed_edges': [list(edge) for edge in sorted(self.closed_edges)],
+            'way_speeds': {str(way_id): speed for way_id, speed in sorted(self.way_speeds.items())},
+            'edge_speeds': [[u, v, speed] for (u, v), speed in sorted(self.edge_speeds.items())],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'EdgeOverlay':
+        return cls(
+            version=data.get('version', 0),
+            updated_at=data.get('updated_at'),
+            closed_ways={int(way_id) for way_id in data.get('closed_ways', [])},
+            closed_edges={(int(u), int(v)) for u, v in data.get('closed_edges', [])},
+            way_speeds={int(way_id): float(speed) for way_id, speed in data.get('way_speeds', {}).items()},
+            edge_speeds={(int(u), int(v)): float(speed) for u, v, speed in data.get('edge_speeds', [])},
+        )
+
+class OverlayStore:
+    """
+    Versioned, file-backed store of EdgeOverlay snapshots.
+
+    Every update writes a new copy of the overlay with a higher version and
+    atomically replaces the file; readers notice the change with a single
+    stat() call and swap in the new snapshot. The version doubles as the
+    graph version, so anything derived from the graph can cache against it.
+    """
+
+    def __init__(self, path: str = DEFAULT_OVERLAY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._snapshot = EdgeOverlay()
+        self._stamp = None
+
+    def current(self) -> EdgeOverlay:
+        """Return the latest published overlay snapshot."""
+        try:
+            stat = os.stat(self.path)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            stamp = None
+
+        if stamp != self._stamp:
+            with self._lock:
+                if stamp != self._stamp:
+                    self._snapshot = self._read() if stamp else EdgeOverlay()
+                    self._stamp = stamp
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self.current().version
+
+    def apply(self,
+              close_ways: Iterable[int] = (),
+              reopen_ways: Iterable[int] = (),
+              close_edges: Iterable[EdgeKey] = (),
+              reopen_edges: Iterable[EdgeKey] = (),
+              way_speeds: Mapping[int, Optional[float]] = None,
+              edge_speeds: Mapping[EdgeKey, Optional[float]] = None) -> EdgeOverlay:
+        """
+        Publish a new overlay version with the given changes applied.
+
+        A speed of None removes the override for that way or edge.
+        """
+        def update(overlay: EdgeOverlay) -> EdgeOverlay:
+            closed_ways = (set(overlay.closed_ways) | {int(w) for w in close_ways}) - {int(w) for w in reopen_ways}
+            closed_edges = ((set(overlay.closed_edges) | {(int(u), int(v)) for u, v in close_edges})
+                            - {(int(u), int(v)) for u, v in reopen_edges})
+
+            new_way_speeds = dict(overlay.way_speeds)
+            for way_id, speed in (way_speeds or {}).items():
+                if speed is None:
+                    new_way_speeds.pop(int(way_id), None)
+                else:
+                    new_way_speeds[int(way_id)] = self._validate_speed(speed)
+
+            new_edge_speeds = dict(overlay.edge_speeds)
+            for (u, v), speed in (edge_speeds or {}).items():
+                if speed is None:
+                    new_edge_speeds.pop((int(u), int(v)), None)
+                else:
+                    new_edge_speeds[(int(u), int(v))] = self._validate_speed(speed)
+
+            return EdgeOverlay(closed_ways=closed_ways, closed_edges=closed_edges,
+                               way_speeds=new_way_speeds, edge_speeds=new_edge_speeds)
+
+        return self._publish(update)
+
+    def clear(self) -> EdgeOverlay:
+        """Publish a new, empty overlay version."""
+        return self._publish(lambda overlay: EdgeOverlay())
+
+    def bump_version(self) -> EdgeOverlay:
+        """Publish the same overlay under a new version, e.g. after the base graph changed."""
+        return self._publish(lambda overlay: EdgeOverlay(
+            closed_ways=overlay.closed_ways, closed_edges=overlay.closed_edges,
+            way_speeds=overlay.way_speeds, edge_speeds=overlay.edge_speeds))
+
+    @staticmethod
+    def _validate_speed(speed) -> float:
+        speed = float(speed)
+        if speed <= 0:
+            raise ValueError("Speed override must be positive; close the edge instead")
+        return speed
+
+    def _read(self) -> EdgeOverlay:
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return EdgeOverlay.from_dict(json.load(f))
+
+    def _publish(self, update) -> EdgeOverlay:
+        """Read-modify-write the overlay file under an exclusive lock."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self._lock, open(self.path + '.lock', 'w') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            current = self._read() if os.path.exists(self.path) else EdgeOverlay()
+            overlay = update(current)
+            overlay.version = current.version + 1
+            overlay.updated_at = datetime.now().isoformat(timespec='seconds')
+
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(overlay.to_dict(), f, indent=2)
+            os.replace(tmp_path, self.path)
+
+            # Force the next current() call to pick up the new file
+            self._stamp = None
+        return overlay
+
+# Process-wide store used by the routing engines
+overlay_store = OverlayStore()
@@ -0,0 +1,115 @@
+"""
+Build a RoutingGraph straight from cached Overpass JSON responses.
+
+The osmnx cache (backend/cache/*.json) already holds the raw node and way
+elements of the drive network, so the graph can be built without going
+through osmnx, networkx and a GraphML file. Speeds follow the rules of
+ox.add_edge_speeds: parse maxspeed where it is tagged, otherwise use the
+mean tagged speed of the same highway type, otherwise the mean of all
+tagged speeds. Travel time is length / speed, as in ox.add_edge_travel_times.
+"""
+import glob
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Union
+from .astar import RoutingGraph
+from .ingest import ingest_elements
+from .osm_loader import OSMLoader
+from .osm_reader import iter_overpass_elements
+
+OVERPASS_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache')
+
+MPH_TO_KPH = 1.609344
+_MAXSPEED_PATTERN = re.compile(r'^([0-9][\.,0-9]*?)(?:[ ]?(?:km/h|kmh|kph|mph))?$')
+
+# oneway values osmnx treats as one-way, and the ones that reverse the way direction
+ONEWAY_VALUES = ('yes', 'true', '1', '-1', 'reverse', 'T', 'F')
+REVERSED_ONEWAY_VALUES = ('-1', 'reverse', 'T')
+
+def parse_maxspeed(value: Optional[str]) -> Optional[float]:
+    """
+    Convert a maxspeed tag to km/h. Multiple values ("50;70", "50|70") are
+    averaged; symbolic values such as "TR:urban" or "none" give None.
+    """
+    if not value:
+        return None
+    speeds = []
+    for part in re.split(r'[;|]', value):
+        match = _MAXSPEED_PATTERN.match(part.strip())
+        if match is None:
+            return None
+        speed = float(match.group(1).replace(',', '.'))
+        if 'mph' in part.lower():
+            speed *= MPH_TO_KPH
+        speeds.append(speed)
+    return sum(speeds) / len(speeds)
+
+class OverpassGraphLoader(OSMLoader):
+    """
+    OSMLoader variant for Overpass responses of the osmnx drive network.
+
+    The Overpass query has already applied the network filter, so every way
+    with a highway tag is routable, and one-way handling and speeds follow
+    osmnx instead of the fixed per-type table of OSMLoader.
+    """
+
+    def __init__(self):
+        super().__init__()
+        # Mean tagged speed per highway type and overall, set before edges are built
+        self.type_speeds: Dict[str, float] = {}
+        self.mean_speed: Optional[float] = None
+
+    def _is_routable_way(self, tags: Dict[str, str]) -> bool:
+        return 'highway' in tags
+
+    def way(self, way_id: int, refs: List[int], tags: Dict[str, str]):
+        # A reversed one-way is stored in travel direction
+        if tags.get('oneway') in REVERSED_ONEWAY_VALUES:
+            refs = refs[::-1]
+        super().way(way_id, refs, tags)
+
+    def _is_oneway(self, way_id: int) -> bool:
+        tags = self.way_tags[way_id]
+        return tags.get('oneway') in ONEWAY_VALUES or tags.get('junction') == 'roundabout'
+
+    def _build_edges(self):
+        self._compute_mean_speeds()
+        super()._build_edges()
+
+    def _compute_mean_speeds(self):
+        tagged: Dict[str, List[float]] = {}
+        for tags in self.way_tags.values():
+            speed = parse_maxspeed(tags.get('maxspeed'))
+            if speed is not None:
+                tagged.setdefault(tags['highway'], []).append(speed)
+
+        self.type_speeds = {highway: sum(speeds) / len(speeds) for highway, speeds in tagged.items()}
+        all_speeds = [speed for speeds in tagged.values() for speed in speeds]
+        self.mean_speed = sum(all_speeds) / len(all_speeds) if all_speeds else None
+
+    def _get_speed_limit(self, way_id: int) -> float:
+        """Speed in km/h the way ox.add_edge_speeds assigns it."""
+        tags = self.way_tags[way_id]
+        speed = parse_maxspeed(tags.get('maxspeed'))
+        if speed is None:
+            highway = tags['highway']
+            speed = self.type_speeds.get(highway, self.mean_speed)
+            if speed is None:
+                # Nothing in the data is tagged at all; use the OSMLoader defaults
+                speed = self.highway_types.get(highway, 50.0)
+        # osmnx rounds speeds to one decimal
+        return round(speed, 1)
+
+def overpass_cache_files(cache_dir: str = OVERPASS_CACHE_DIR) -> List[str]:
+    return sorted(glob.glob(os.path.join(cache_dir, '*.json')))
+
+def load_overpass_graph(sources: Union[str, Iterable[str]] = OVERPASS_CACHE_DIR) -> RoutingGraph:
+    """
+    Build a RoutingGraph from Overpass JSON files. sources is a cache
+    directory, a single file or a list of files.
+    """
+    if isinstance(sources, str):
+        sources = overpass_cache_files(sources) if os.path.isdir(sources) else [sources]
+    loader = OverpassGraphLoader()
+    ingest_elements(iter_overpass_elements(sources, ('node', 'way')), [loader])
+    return loader.get_graph()
@@ -0,0 +1,280 @@
+"""
+Reader for the OpenStreetMap PBF format.
+
+A .osm.pbf file is a sequence of length-prefixed blobs. Each blob holds a
+zlib-compressed protobuf PrimitiveBlock of nodes (plain or dense), ways and
+relations. The blobs are independent, so the main process only scans the
+blob headers and worker processes inflate and decode the blocks in
+parallel. Only the protobuf wire format subset that OSM uses is
+implemented, so no protobuf dependency is needed.
+"""
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Tuple
+
+# Elements are plain tuples so they pickle cheaply between processes:
+#   ('node', id, lat, lon, tags)
+#   ('way', id, refs, tags)
+#   ('relation', id, [(member_type, ref, role), ...], tags)
+Element = Tuple
+
+MEMBER_TYPES = ('node', 'way', 'relation')
+ALL_KINDS = frozenset(MEMBER_TYPES)
+
+def _read_varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+def _zigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+def _signed64(value: int) -> int:
+    # Negative int32/int64 values are encoded as 10-byte two's complement varints
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def _iter_fields(buf: bytes) -> Iterator[Tuple[int, int]]:
+    """Yield (field_number, value) pairs; length-delimited values are bytes."""
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        field, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value, pos = _read_varint(buf, pos)
+        elif wire_type == 2:
+            length, pos = _read_varint(buf, pos)
+            value = buf[pos:pos + length]
+            pos += length
+        elif wire_type == 1:
+            value = struct.unpack_from('<q', buf, pos)[0]
+            pos += 8
+        elif wire_type == 5:
+            value = struct.unpack_from('<i', buf, pos)[0]
+            pos += 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        yield field, value
+
+def _packed(buf: bytes) -> List[int]:
+    values = []
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        value, pos = _read_varint(buf, pos)
+        values.append(value)
+    return values
+
+def _packed_sint(buf: bytes) -> List[int]:
+    return [_zigzag(value) for value in _packed(buf)]
+
+def _delta_decode(values: List[int]) -> List[int]:
+    total = 0
+    decoded = []
+    for value in values:
+        total += value
+        decoded.append(total)
+    return decoded
+
+def _tags(keys: List[int], vals: List[int], strings: List[str]) -> Dict[str, str]:
+    return {strings[k]: strings[v] for k, v in zip(keys, vals)}
+
+def _decode_blob(data: bytes) -> bytes:
+    raw = zlib_data = None
+    for field, value in _iter_fields(data):
+        if field == 1:
+            raw = value
+        elif field == 3:
+            zlib_data = value
+        elif field in (4, 5, 6, 7):
+            raise ValueError("Only raw and zlib compressed PBF blobs are supported")
+    if raw is not None:
+        return raw
+    if zlib_data is not None:
+        return zlib.decompress(zlib_data)
+    return b''
+
+def _decode_primitive_block(block: bytes, kinds: FrozenSet[str]) -> List[Element]:
+    strings: List[str] = []
+    groups = []
+    granularity = 100
+    lat_offset = lon_offset = 0
+
+    for field, value in _iter_fields(block):
+        if field == 1:
+            strings = [s.decode('utf-8') for f, s in _iter_fields(value) if f == 1]
+        elif field == 2:
+            groups.append(value)
+        elif field == 17:
+            granularity = value
+        elif field == 19:
+            lat_offset = _signed64(value)
+        elif field == 20:
+            lon_offset = _signed64(value)
+
+    def coord(offset: int, value: int) -> float:
+        return (offset + granularity * value) / 1e9
+
+    elements: List[Element] = []
+    for group in groups:
+        for field, value in _iter_fields(group):
+            if field == 2 and 'node' in kinds:
+                elements.extend(_decode_dense_nodes(value, strings, coord, lat_offset, lon_offset))
+            elif field == 1 and 'node' in kinds:
+                elements.append(_decode_node(value, strings, coord, lat_offset, lon_offset))
+            elif field == 3 and 'way' in kinds:
+                elements.append(_decode_way(value, strings))
+            elif field == 4 and 'relation' in kinds:
+                elements.append(_decode_relation(value, strings))
+    return elements
+
+def _decode_node(buf: bytes, strings, coord, lat_offset, lon_offset) -> Element:
+    node_id = lat = lon = 0
+    keys: List[int] = []
+    vals: List[int] = []
+    for field, value in _iter_fields(buf):
+        if field == 1:
+            node_id = _zigzag(value)
+        elif field == 2:
+            keys = _packed(value)
+        elif field == 3:
+            vals = _packed(value)
+        elif field == 8:
+            lat = _zigzag(value)
+        elif field == 9:
+            lon = _zigzag(value)
+    return ('node', node_id, coord(lat_offset, lat), coord(lon_offset, lon), _tags(keys, vals, strings))
+
+def _decode_dense_nodes(buf: bytes, strings, coord, lat_offset, lon_offset) -> List[Element]:
+    ids: List[int] = []
+    lats: List[int] = []
+    lons: List[int] = []
+    keys_vals: List[int] = []
+    for field, value in _iter_fields(buf):
+        if field == 1:
+            ids = _delta_decode(_packed_sint(value))
+        elif field == 8:
+            lats = _delta_decode(_packed_sint(value))
+        elif field == 9:
+            lons = _delta_decode(_packed_sint(value))
+        elif field == 10:
+            keys_vals = _packed(value)
+
+    nodes = []
+    kv_pos = 0
+    for node_id, lat, lon in zip(ids, lats, lons):
+        tags = {}
+        # keys_vals holds key/value string ids per node, each node terminated by 0
+        while kv_pos < len(keys_vals) and keys_vals[kv_pos] != 0:
+            tags[strings[keys_vals[kv_pos]]] = strings[keys_vals[kv_pos + 1]]
+            kv_pos += 2
+        kv_pos += 1
+        nodes.append(('node', node_id, coord(lat_offset, lat), coord(lon_offset, lon), tags))
+    return nodes
+
+def _decode_way(buf: bytes, strings) -> Element:
+    way_id = 0
+    keys: List[int] = []
+    vals: List[int] = []
+    refs: List[int] = []
+    for field, value in _iter_fields(buf):
+        if field == 1:
+            way_id = _signed64(value)
+        elif field == 2:
+            keys = _packed(value)
+        elif field == 3:
+            vals = _packed(value)
+        elif field == 8:
+            refs = _delta_decode(_packed_sint(value))
+    return ('way', way_id, refs, _tags(keys, vals, strings))
+
+def _decode_relation(buf: bytes, strings) -> Element:
+    relation_id = 0
+    keys: List[int] = []
+    vals: List[int] = []
+    roles: List[int] = []
+    member_ids: List[int] = []
+    types: List[int] = []
+    for field, value in _iter_fields(buf):
+        if field == 1:
+            relation_id = _signed64(value)
+        elif field == 2:
+            keys = _packed(value)
+        elif field == 3:
+            vals = _packed(value)
+        elif field == 8:
+            roles = [_signed64(v) for v in _packed(value)]
+        elif field == 9:
+            member_ids = _delta_decode(_packed_sint(value))
+        elif field == 10:
+            types = _packed(value)
+    members = [(MEMBER_TYPES[t], ref, strings[role]) for t, ref, role in zip(types, member_ids, roles)]
+    return ('relation', relation_id, members, _tags(keys, vals, strings))
+
+def _decode_data_blob(task: Tuple[str, int, int, FrozenSet[str]]) -> List[Element]:
+    """Read, inflate and decode one OSMData blob (runs in a worker process)."""
+    filename, offset, size, kinds = task
+    with open(filename, 'rb') as f:
+        f.seek(offset)
+        data = f.read(size)
+    return _decode_primitive_block(_decode_blob(data), kinds)
+
+class PBFReader:
+    """Stream elements from an .osm.pbf file, decoding blocks across a process pool."""
+
+    def __init__(self, filename: str, workers: int = None):
+        self.filename = filename
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+
+    def _blob_offsets(self) -> Iterator[Tuple[int, int]]:
+        """Yield (offset, size) of every OSMData blob without decoding them."""
+        with open(self.filename, 'rb') as f:
+            while True:
+                prefix = f.read(4)
+                if not prefix:
+                    return
+                if len(prefix) < 4:
+                    raise ValueError("Truncated PBF blob header")
+                header_size = struct.unpack('>I', prefix)[0]
+                blob_type = None
+                data_size = 0
+                for field, value in _iter_fields(f.read(header_size)):
+                    if field == 1:
+                        blob_type = value.decode('utf-8')
+                    elif field == 3:
+                        data_size = value
+
+                offset = f.tell()
+                f.seek(data_size, os.SEEK_CUR)
+                # OSMHeader blobs only describe the file; unknown blob types must be skipped
+                if blob_type == 'OSMData':
+                    yield offset, data_size
+
+    def iter_elements(self, kinds: Iterable[str] = ALL_KINDS) -> Iterator[Element]:
+        """Yield elements of the given kinds in file order."""
+        kinds = frozenset(kinds)
+        tasks = ((self.filename, offset, size, kinds) for offset, size in self._blob_offsets())
+
+        if self.workers <= 1:
+            for task in tasks:
+                yield from _decode_data_blob(task)
+            return
+
+        # Keep a bounded window of blocks in flight so memory does not grow
+        # with the file size, and yield them in order so nodes come before ways.
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            for task in tasks:
+                pending.append(executor.submit(_decode_data_blob, task))
+                if len(pending) >= self.workers * 2:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
@@ -0,0 +1,138 @@
+"""
+Road-name index over the loaded osmnx drive graph, for GraphMLSearchView.
+
+The index is built once from the graph DirectionsView already keeps in
+memory: one entry per (road name, OSM way id), carrying its highway type
+and the geometry of its longest edge as GeoJSON. Lookups go through a
+trigram index on the normalized names. The index is rebuilt when the graph
+object or the graph version (overlay_store.version) changes.
+"""
+import ast
+import threading
+from typing import Dict, List, Optional, Tuple
+from unidecode import unidecode
+from search.ngram import TrigramIndex
+from .overlay import overlay_store
+
+def _normalize(text: str) -> str:
+    return ' '.join(unidecode(text).lower().split())
+
+def _first(value):
+    """osmnx keeps merged attributes as lists (or their string form after a GraphML round trip)."""
+    if isinstance(value, str) and value.startswith('['):
+        try:
+            value = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            return value
+    if isinstance(value, (list, tuple)):
+        return value[0] if value else None
+    return value
+
+def _names(value) -> List[str]:
+    if isinstance(value, str) and value.startswith('['):
+        try:
+            value = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            pass
+    if isinstance(value, (list, tuple)):
+        return [name for name in value if isinstance(name, str) and name]
+    return [value] if isinstance(value, str) and value else []
+
+class RoadNameIndex:
+    """Deduplicated road names of a networkx graph with trigram lookup."""
+
+    def __init__(self, graph):
+        self.entries: Dict[Tuple[str, object], Dict] = {}  # (name, osm id) -> result
+        self.lengths: Dict[Tuple[str, object], float] = {}  # length of the edge chosen as geometry
+        self.by_name: Dict[str, List[Tuple[str, object]]] = {}  # normalized name -> entry keys
+        self.node_entries: Dict[str, List[Dict]] = {}  # normalized node name -> results
+        self.grams = TrigramIndex()
+        self.node_grams = TrigramIndex()
+
+        for u, v, data in graph.edges(data=True):
+            osm_id = _first(data.get('osmid'))
+            length = float(data.get('length') or 0)
+            for name in _names(data.get('name')):
+                key = (name, osm_id)
+                if key in self.entries and self.lengths[key] >= length:
+                    continue
+                if key not in self.entries:
+                    normalized = _normalize(name)
+                    self.by_name.setdefault(normalized, []).append(key)
+                    self.grams.add(normalized)
+                self.lengths[key] = length
+                self.entries[key] = {
+                    'id': f"{u}-{v}",
+                    'osm_id': osm_id,
+                    'name': name,
+                    'road_type': _first(data.get('highway')),
+                    'geometry': self._edge_geometry(graph, u, v, data),
+                }
+
+        for node, data in graph.nodes(data=True):
+            for name in _names(data.get('name')):
+                normalized = _normalize(name)
+                self.node_grams.add(normalized)
+                self.node_entries.setdefault(normalized, []).append({
+                    'id': node,
+                    'osm_id': data.get('osmid'),
+                    'name': name,
+                    'road_type': 'node',
+                    'geometry': None,
+                })
+
+    @staticmethod
+    def _edge_geometry(graph, u, v, data) -> Optional[Dict]:
+        geometry = data.get('geometry')
+        if geometry is not None and hasattr(geometry, 'coords'):
+            coordinates = [[x, y] for x, y in geometry.coords]
+        else:
+            start, end = graph.nodes[u], graph.nodes[v]
+            if 'x' not in start or 'x' not in end:
+                return None
+            coordinates = [[float(start['x']), float(start['y'])], [float(end['x']), float(end['y'])]]
+        return {'type': 'LineString', 'coordinates': coordinates}
+
+    @staticmethod
+    def _rank(query: str, name: str) -> Tuple[int, int, str]:
+        """Names starting with the query first, then ones with a word starting with it."""
+        if name.startswith(query):
+            position = 0
+        elif f' {query}' in name:
+            position = 1
+        else:
+            position = 2
+        return position, len(name), name
+
+    def search(self, query: str, limit: int = 10) -> List[Dict]:
+        query = _normalize(query)
+        names = sorted(self.grams.containing(query), key=lambda name: self._rank(query, name))
+        results = []
+        for name in names:
+            for key in self.by_name[name]:
+                results.append(self.entries[key])
+                if len(results) >= limit:
+                    return results
+        if not results:
+            # Named nodes only matter when no road matched
+            for name in sorted(self.node_grams.containing(query), key=lambda name: self._rank(query, name)):
+                results.extend(self.node_entries[name][:limit - len(results)])
+                if len(results) >= limit:
+                    break
+        return results
+
+_road_index: Optional[RoadNameIndex] = None
+_road_index_graph = None
+_road_index_version = None
+_road_index_lock = threading.Lock()
+
+def get_road_index(graph) -> RoadNameIndex:
+    """Shared index for the graph, rebuilt when the graph or its version changes."""
+    global _road_index, _road_index_graph, _road_index_version
+    version = overlay_store.version
+    with _road_index_lock:
+        if _road_index is None or _road_index_graph is not graph or _road_index_version != version:
+            _road_index = RoadNameIndex(graph)
+            _road_index_graph = graph
+            _road_index_version = version
+        return _road_index
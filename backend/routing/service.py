@@ -1,71 +1,406 @@
-from typing import List, Tuple, Dict
+import multiprocessing
+import threading
+from datetime import datetime
+from time import perf_counter
+from typing import List, Tuple, Dict, Optional, Sequence
 from .osm_loader import OSMLoader
-from .astar import RoutingGraph, haversine_distance
+from .astar import MODE_SPEEDS, RoutingGraph, TrafficModel, haversine_distance
+from .array_graph import ArrayGraph
+from .overlay import EdgeOverlay, overlay_store
+from .metrics import SearchStats, record_search, record_search_run
+from .osc import change_log, iter_osc_changes
+
+# Spatial index cell size in degrees (about 1km), and how many rings of
+# cells around a point are searched for something to snap to
+SNAP_GRID_SIZE = 0.01
+SNAP_MAX_RINGS = 5
+
+# Service of a route_many() worker process, set by the pool initializer.
+# The pool forks, so the service reaches the workers without pickling and
+# they share the read-only graph through copy-on-write pages.
+_POOL_SERVICE: Optional['RoutingService'] = None
+
+def _init_pool_worker(service: 'RoutingService'):
+    global _POOL_SERVICE
+    # The parent applies map diffs and replaces the pool when the graph
+    # changes, so workers never sync on their own
+    service.loader = None
+    _POOL_SERVICE = service
+
+def _route_pool_worker(task: Tuple[int, Tuple[float, float, float, float], str, datetime, EdgeOverlay]) -> Tuple[int, Dict]:
+    """Answer a single route_many() query inside a pool worker."""
+    index, pair, mode, current_time, overlay = task
+    return index, _POOL_SERVICE._route_one(pair, mode, current_time, overlay)
 
 class RoutingService:
-    def __init__(self, osm_file: str):
-        loader = OSMLoader()
-        loader.load_osm(osm_file)
-        self.graph = loader.get_graph()
-        self._build_spatial_index()
-
-    def _build_spatial_index(self):
-        """Build a simple spatial index for faster nearest node lookup."""
-        self.spatial_index: Dict[Tuple[int, int], List[int]] = {}
-        grid_size = 0.01  # About 1km grid cells
-
-        for node_id, node in self.graph.nodes.items():
-            grid_x = int(node.lon / grid_size)
-            grid_y = int(node.lat / grid_size)
-            key = (grid_x, grid_y)
-            
-            if key not in self.spatial_index:
-                self.spatial_index[key] = []
-            self.spatial_index[key].append(node_id)
-
-    def _find_nearest_node(self, lat: float, lon: float) -> int:
-        """Find the nearest node to given coordinates."""
-        grid_size = 0.01
-        grid_x = int(lon / grid_size)
-        grid_y = int(lat / grid_size)
-        
-        # Search in current and adjacent grid cells
-        nearest_node = None
+    def __init__(self, osm_file: str, simplify: bool = True):
+        self.loader = OSMLoader()
+        self.loader.load_osm(osm_file)
+        graph = self.loader.get_graph()
+        self._prepare_graph(graph, simplify)
+        self.overlay_store = overlay_store
+        self._init_changes()
+        self._routing = self._build_routing(graph)
+
+    @classmethod
+    def from_graph(cls, graph: RoutingGraph, simplify: bool = True, loader: OSMLoader = None) -> 'RoutingService':
+        """
+        Create a service around an already built routing graph (contracted in
+        place if simplify). Pass the loader that built it to follow map diffs.
+        """
+        service = cls.__new__(cls)
+        service.loader = loader
+        service._prepare_graph(graph, simplify)
+        service.overlay_store = overlay_store
+        service._init_changes()
+        service._routing = service._build_routing(graph)
+        return service
+
+    @property
+    def graph(self) -> RoutingGraph:
+        return self._routing[0]
+
+    @property
+    def spatial_index(self) -> Dict[Tuple[int, int], List[int]]:
+        return self._routing[1]
+
+    def _build_routing(self, graph: RoutingGraph, previous: ArrayGraph = None) -> Tuple:
+        """
+        (graph, spatial index, array layout) for a graph; searches run on the
+        Hilbert-ordered array layout (see routing/array_graph.py).
+        """
+        return graph, self._build_spatial_index(graph), ArrayGraph(graph, previous)
+
+    def _prepare_graph(self, graph: RoutingGraph, simplify: bool):
+        """Contract shape nodes into compound edges if simplify."""
+        self.simplified = simplify
+        if simplify:
+            graph.contract_degree2()
+
+    def _init_changes(self):
+        # Every published diff applies on top of the extract, so start from the first one
+        self.change_log = change_log
+        self._change_sequence = 0
+        self._synced_version = None
+        self._sync_lock = threading.Lock()
+        # route_many() worker pool, with the graph and worker count it was forked with
+        self._pool = None
+        self._pool_key = None
+        self._pool_lock = threading.Lock()
+
+    def sync_changes(self) -> int:
+        """
+        Apply map diffs published since the last call and return how many
+        were applied. Only a stat() of the overlay file is paid while the
+        graph version is unchanged.
+
+        Diffs are applied to a copy of the graph, which then replaces the
+        graph, its spatial index and array layout in one assignment; queries already
+        running keep the graph they started with.
+        """
+        if self.loader is None or self.overlay_store.version == self._synced_version:
+            return 0
+        with self._sync_lock:
+            version = self.overlay_store.version
+            if version == self._synced_version:
+                return 0
+            pending = list(self.change_log.pending(self._change_sequence))
+            if pending:
+                graph = self.graph.copy()
+                self.loader.graph = graph
+                for sequence, path in pending:
+                    self.loader.apply_changes(iter_osc_changes(path), contract=self.simplified)
+                    self._change_sequence = sequence
+                self._routing = self._build_routing(graph, previous=self._routing[2])
+            self._synced_version = version
+        return len(pending)
+
+    @staticmethod
+    def _build_spatial_index(graph: RoutingGraph) -> Dict[Tuple[int, int], List[Tuple]]:
+        """
+        Build a simple spatial index for faster nearest point lookup.
+
+        Cells hold (lat, lon, node_id, None, None) for graph nodes and
+        (lat, lon, from_id, to_id, i) for the i-th shape point of a compound
+        edge, so points along contracted chains can still be snapped to.
+        A two-way chain is indexed once, from its lower node id.
+        """
+        spatial_index: Dict[Tuple[int, int], List[Tuple]] = {}
+
+        def add(lat: float, lon: float, *item):
+            key = (int(lon / SNAP_GRID_SIZE), int(lat / SNAP_GRID_SIZE))
+            spatial_index.setdefault(key, []).append((lat, lon, *item))
+
+        for node_id, node in graph.nodes.items():
+            add(node.lat, node.lon, node_id, None, None)
+            for neighbor_id, edge in node.adjacent.items():
+                shape = edge.get('shape')
+                if not shape:
+                    continue
+                if neighbor_id < node_id and RoutingService._reverse_edge(graph, node_id, neighbor_id):
+                    continue
+                for i, (lat, lon) in enumerate(shape):
+                    add(lat, lon, node_id, neighbor_id, i)
+        return spatial_index
+
+    @staticmethod
+    def _reverse_edge(graph: RoutingGraph, from_id: int, to_id: int) -> Optional[Dict]:
+        """The edge back from to_id to from_id over the same shape points, if there is one."""
+        edge = graph.nodes[to_id].adjacent.get(from_id)
+        if edge is None or edge.get('shape', []) != graph.nodes[from_id].adjacent[to_id].get('shape', [])[::-1]:
+            return None
+        return edge
+
+    def _find_nearest(self, lat: float, lon: float, routing: Tuple = None) -> Optional[Tuple]:
+        """
+        Find the spatial index entry nearest to given coordinates, in
+        routing=(graph, spatial index, ...) or the current graph. Rings of grid
+        cells around the point are searched until one has entries, up to
+        SNAP_MAX_RINGS.
+        """
+        spatial_index = (routing or self._routing)[1]
+        grid_x = int(lon / SNAP_GRID_SIZE)
+        grid_y = int(lat / SNAP_GRID_SIZE)
+
+        nearest = None
         min_distance = float('inf')
-        
-        for dx in [-1, 0, 1]:
-            for dy in [-1, 0, 1]:
-                key = (grid_x + dx, grid_y + dy)
-                if key in self.spatial_index:
-                    for node_id in self.spatial_index[key]:
-                        node = self.graph.nodes[node_id]
-                        dist = haversine_distance(lat, lon, node.lat, node.lon)
+        for ring in range(1, SNAP_MAX_RINGS + 1):
+            for dx in range(-ring, ring + 1):
+                for dy in range(-ring, ring + 1):
+                    # Inner cells were searched in the previous ring
+                    if ring > 1 and max(abs(dx), abs(dy)) < ring:
+                        continue
+                    for item in spatial_index.get((grid_x + dx, grid_y + dy), ()):
+                        dist = haversine_distance(lat, lon, item[0], item[1])
                         if dist < min_distance:
                             min_distance = dist
-                            nearest_node = node_id
-        
-        return nearest_node
+                            nearest = item
+            if nearest is not None:
+                break
+        return nearest
+
+    @staticmethod
+    def _edge_share(graph: RoutingGraph, from_id: int, to_id: int, i: int) -> float:
+        """Share of a compound edge's distance from from_id to its i-th shape point, by the shape's length."""
+        shape = graph.nodes[from_id].adjacent[to_id]['shape']
+        chain = [(graph.nodes[from_id].lat, graph.nodes[from_id].lon)] + shape + \
+                [(graph.nodes[to_id].lat, graph.nodes[to_id].lon)]
+        hops = [haversine_distance(*a, *b) for a, b in zip(chain, chain[1:])]
+        return sum(hops[:i + 1]) / sum(hops) if sum(hops) else 0.5
+
+    def _snap(self, item: Tuple, graph: RoutingGraph, departing: bool) -> List[Tuple[int, float, float, List]]:
+        """
+        Graph nodes a trip can start from (departing) or end at, for a
+        spatial index entry. Each is (node_id, km along the edge between the
+        point and the node, speed limit of that edge, shape points between
+        them in travel order). A point on a compound edge gives its end
+        nodes, one per direction the edge can be driven in.
+        """
+        _, _, from_id, to_id, i = item
+        if to_id is None:
+            return [(from_id, 0.0, 0.0, [])]
+
+        edge = graph.nodes[from_id].adjacent[to_id]
+        shape = edge['shape']
+        share = self._edge_share(graph, from_id, to_id, i)
+        before, after = edge['distance'] * share, edge['distance'] * (1 - share)
+
+        candidates = []
+        if departing:
+            candidates.append((to_id, after, edge['speed_limit'], shape[i:]))
+        else:
+            candidates.append((from_id, before, edge['speed_limit'], shape[:i + 1]))
+        reverse = self._reverse_edge(graph, from_id, to_id)
+        if reverse is not None:
+            if departing:
+                candidates.append((from_id, before, reverse['speed_limit'], shape[:i + 1][::-1]))
+            else:
+                candidates.append((to_id, after, reverse['speed_limit'], shape[i:][::-1]))
+        return candidates
+
+    def _along_edge(self, start: Tuple, end: Tuple, graph: RoutingGraph) -> Optional[Tuple[float, float, List]]:
+        """
+        (km, speed limit, geometry) of the trip between two shape points of
+        the same compound edge, if the edge can be driven from one to the other.
+        """
+        _, _, from_id, to_id, i = start
+        if to_id is None or end[2:4] != (from_id, to_id):
+            return None
+        j = end[4]
+        edge = graph.nodes[from_id].adjacent[to_id]
+        distance = abs(self._edge_share(graph, from_id, to_id, j) - self._edge_share(graph, from_id, to_id, i)) * edge['distance']
+        if i <= j:
+            return distance, edge['speed_limit'], edge['shape'][i:j + 1]
+        reverse = self._reverse_edge(graph, from_id, to_id)
+        if reverse is None:
+            return None
+        return distance, reverse['speed_limit'], edge['shape'][j:i + 1][::-1]
 
     def calculate_route(self, 
                        start_lat: float, 
                        start_lon: float,
                        end_lat: float,
-                       end_lon: float) -> Tuple[List[Tuple[float, float]], float]:
-        """Calculate route between two points."""
-        # Find nearest nodes to start and end points
-        start_node = self._find_nearest_node(start_lat, start_lon)
-        end_node = self._find_nearest_node(end_lat, end_lon)
+                       end_lon: float,
+                       current_time: datetime = None,
+                       mode: str = 'driving',
+                       overlay: EdgeOverlay = None,
+                       stats: SearchStats = None) -> Tuple[List[Tuple[float, float]], float]:
+        """
+        Calculate route between two points.
+
+        Search statistics are recorded into the routing metrics; pass a
+        SearchStats instance to also get them back for this query.
+        """
+        if stats is None:
+            stats = SearchStats()
+        self.sync_changes()
+        # The whole query runs on one graph, even if a diff swaps in a new one meanwhile
+        routing = self._routing
+        graph = routing[0]
+
+        # Find the nodes a trip from and to the given points can use
+        snap_start = perf_counter()
+        start_item = self._find_nearest(start_lat, start_lon, routing)
+        end_item = self._find_nearest(end_lat, end_lon, routing)
+        stats.snap_time = perf_counter() - snap_start
         
-        if not start_node or not end_node:
+        if not start_item or not end_item:
             return [], 0
-            
-        # Calculate route using A*
-        path, distance = self.graph.astar(start_node, end_node)
+        starts = self._snap(start_item, graph, departing=True)
+        ends = self._snap(end_item, graph, departing=False)
+
+        # The part of an edge before the first node or after the last one is timed like astar() does
+        mode_speed = MODE_SPEEDS.get(mode)
+        traffic_mult = TrafficModel.get_traffic_multiplier(current_time) if mode_speed is None else 1.0
+
+        def access_time(distance: float, speed_limit: float) -> float:
+            return distance / (mode_speed or speed_limit) * traffic_mult if distance else 0.0
+
+        # Both points on the same contracted chain, in a direction it can be driven
+        along = self._along_edge(start_item, end_item, graph)
+        if along is not None:
+            distance, speed_limit, geometry = along
+            record_search(stats, engine='astar')
+            return geometry, access_time(distance, speed_limit)
+
+        # Calculate route using A* against the overlay version current at query start,
+        # from every start node at once and to each end node in turn
+        if overlay is None:
+            overlay = self.overlay_store.current()
+        start_costs = {candidate[0]: access_time(*candidate[1:3]) for candidate in starts}
+        search_start = perf_counter()
+        best = None
+        for end in ends:
+            search = SearchStats()
+            path, duration = routing[2].astar(starts[0][0], end[0], current_time=current_time,
+                                              mode=mode, overlay=overlay, stats=search, start_costs=start_costs)
+            record_search_run(search, engine='astar', stats=stats)
+            duration += access_time(*end[1:3])
+            if path and (best is None or duration < best[1]):
+                best = (path, duration, end)
+        stats.search_time = perf_counter() - search_start
         
-        if not path:
+        if best is None:
+            record_search(stats, engine='astar')
             return [], 0
+        path, distance, end = best
+        start = next(candidate for candidate in starts if candidate[0] == path[0])
             
         # Convert node IDs to coordinates
-        route_geometry = self.graph.get_route_geometry(path)
+        post_start = perf_counter()
+        route_geometry = start[3] + graph.get_route_geometry(path) + end[3]
+        stats.postprocess_time = perf_counter() - post_start
+        record_search(stats, engine='astar')
         
-        return route_geometry, distance 
\ No newline at end of file
+        return route_geometry, distance
+
+    def _route_one(self, pair: Tuple[float, float, float, float], mode: str,
+                   current_time: datetime = None, overlay: EdgeOverlay = None) -> Dict:
+        """Calculate one route_many() query, reporting failures instead of raising."""
+        try:
+            start_lat, start_lon, end_lat, end_lon = pair
+            geometry, duration = self.calculate_route(
+                start_lat, start_lon, end_lat, end_lon,
+                current_time=current_time, mode=mode, overlay=overlay
+            )
+        except Exception as e:
+            return {'geometry': [], 'duration': 0, 'error': str(e)}
+
+        if not geometry:
+            return {'geometry': [], 'duration': 0, 'error': 'No route found'}
+        return {'geometry': geometry, 'duration': duration, 'error': None}
+
+    def route_many(self,
+                   pairs: Sequence[Tuple[float, float, float, float]],
+                   mode: str = 'driving',
+                   workers: int = None,
+                   current_time: datetime = None) -> List[Dict]:
+        """
+        Calculate many routes, fanning the queries out to a process pool.
+
+        Args:
+            pairs: Sequence of (start_lat, start_lon, end_lat, end_lon) tuples
+            mode: Transport mode used for every query
+            workers: Number of worker processes (defaults to the CPU count)
+            current_time: Time used for the traffic model (defaults to now)
+
+        Returns:
+            One dict per pair, in input order, with 'geometry', 'duration'
+            (hours) and 'error' (None on success).
+        """
+        pairs = list(pairs)
+        if current_time is None:
+            # Pin the time so every query sees the same traffic conditions
+            current_time = datetime.now()
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        workers = min(workers, len(pairs))
+        # Bring the graph up to date before workers fork from it
+        self.sync_changes()
+        # The whole batch is answered against a single overlay version
+        overlay = self.overlay_store.current()
+
+        # Without fork the graph would have to be pickled into every worker,
+        # which costs more than it saves; answer the queries in-process instead.
+        if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            return [self._route_one(pair, mode, current_time, overlay) for pair in pairs]
+
+        tasks = [(i, pair, mode, current_time, overlay) for i, pair in enumerate(pairs)]
+        results: List[Optional[Dict]] = [None] * len(pairs)
+        chunksize = max(1, len(tasks) // (workers * 4))
+
+        # One batch at a time uses the pool, so it is never replaced under a running batch
+        with self._pool_lock:
+            pool = self._get_pool(workers)
+            for index, result in pool.imap_unordered(_route_pool_worker, tasks, chunksize):
+                results[index] = result
+
+        return results
+
+    def _get_pool(self, workers: int):
+        """
+        The worker pool for route_many(), forked once and reused. It is
+        replaced when the graph has been swapped since the fork (the workers
+        would route on the old one) or a different worker count is asked for.
+        Call with _pool_lock held.
+        """
+        graph = self.graph
+        if self._pool is not None and self._pool_key[0] is graph and self._pool_key[1] == workers:
+            return self._pool
+        self._close_pool()
+        self._pool = multiprocessing.get_context('fork').Pool(
+            workers, initializer=_init_pool_worker, initargs=(self,))
+        self._pool_key = (graph, workers)
+        return self._pool
+
+    def _close_pool(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+            self._pool_key = None
+
+    def close(self):
+        """Shut down the route_many() worker pool, if one was started."""
+        with self._pool_lock:
+            self._close_pool()
@@ -1,6 +1,27 @@
+import json
+import os
+import struct
+import tempfile
+import threading
+import types
 import unittest
+import zlib
+from unittest import mock
 from datetime import datetime
-from routing.astar import RoutingGraph, UserPreferences, Node
+import django.conf
+from routing.astar import RoutingGraph, UserPreferences, Node, haversine_distance
+from routing.service import RoutingService
+from routing.array_graph import ArrayGraph
+from routing.osm_loader import OSMLoader
+from routing.osm_reader import iter_osm_elements
+from routing.ingest import CoordinateStore, OSMConsumer, ingest_osm
+from routing.overlay import OverlayStore
+from routing.metrics import MetricsRegistry, SearchStats
+from routing.geometry import encode_polyline, decode_polyline, simplify, format_geometry
+from routing.overpass import load_overpass_graph, parse_maxspeed
+from routing.osc import ChangeLog, iter_osc_changes
+from routing.road_index import RoadNameIndex, get_road_index
+from search.geocoder import AddressIndexer, OSMGeocoder
 
 class TestPreferenceBasedRouting(unittest.TestCase):
     """Test cases for preference-based routing algorithm."""
@@ -85,5 +106,652 @@ class TestPreferenceBasedRouting(unittest.TestCase):
         # Should take the preferred path: 1-3-4-5
         self.assertEqual(path_combined, [1, 3, 4, 5])
 
+class TestBatchRouting(unittest.TestCase):
+    """Test cases for RoutingService.route_many."""
+
+    def setUp(self):
+        """Set up a small grid graph wrapped in a service."""
+        graph = RoutingGraph()
+        for i in range(4):
+            for j in range(4):
+                graph.add_node(i * 4 + j + 1, 39.9 + i * 0.005, 32.8 + j * 0.005)
+        for i in range(4):
+            for j in range(4):
+                node_id = i * 4 + j + 1
+                if j < 3:
+                    graph.add_edge(node_id, node_id + 1, True, 50.0, 200 + node_id)
+                if i < 3:
+                    graph.add_edge(node_id, node_id + 4, True, 50.0, 300 + node_id)
+        self.service = RoutingService.from_graph(graph)
+        self.addCleanup(self.service.close)
+        self.pairs = [
+            (39.9, 32.8, 39.915, 32.815),
+            (39.915, 32.815, 39.9, 32.8),
+            (39.905, 32.8, 39.905, 32.815),
+        ]
+
+    def test_results_in_input_order(self):
+        """Pool results match serial results and keep input order."""
+        now = datetime(2025, 4, 18, 12, 0)
+        serial = self.service.route_many(self.pairs, workers=1, current_time=now)
+        parallel = self.service.route_many(self.pairs, workers=2, current_time=now)
+        self.assertEqual(serial, parallel)
+        for pair, result in zip(self.pairs, parallel):
+            self.assertIsNone(result['error'])
+            self.assertEqual(result['geometry'][0], (pair[0], pair[1]))
+            self.assertEqual(result['geometry'][-1], (pair[2], pair[3]))
+
+    def test_pool_is_reused(self):
+        """Batches share one pool until the graph is swapped."""
+        now = datetime(2025, 4, 18, 12, 0)
+        first = self.service.route_many(self.pairs, workers=2, current_time=now)
+        pool = self.service._pool
+        self.assertEqual(self.service.route_many(self.pairs, workers=2, current_time=now), first)
+        self.assertIs(self.service._pool, pool)
+
+        graph = self.service.graph.copy()
+        graph.nodes[1].adjacent.clear()
+        self.service._routing = self.service._build_routing(graph)
+        results = self.service.route_many(self.pairs, workers=2, current_time=now)
+        self.assertIsNot(self.service._pool, pool)
+        self.assertEqual(results[0]['error'], 'No route found')
+
+    def test_per_query_errors(self):
+        """A bad query reports an error without failing the batch."""
+        results = self.service.route_many(
+            [self.pairs[0], (None, 32.8, 39.9, 32.8), (10.0, 10.0, 11.0, 11.0)],
+            workers=2
+        )
+        self.assertIsNone(results[0]['error'])
+        self.assertIsNotNone(results[1]['error'])
+        self.assertEqual(results[2]['error'], 'No route found')
+
+    def test_walking_mode_is_slower(self):
+        """Walking uses a fixed speed instead of the road speed limit."""
+        driving = self.service.route_many(self.pairs[:1], workers=1)[0]
+        walking = self.service.route_many(self.pairs[:1], mode='walking', workers=1)[0]
+        self.assertGreater(walking['duration'], driving['duration'])
+
+class TestGeometryFormats(unittest.TestCase):
+    """Test cases for route geometry output formats."""
+
+    def setUp(self):
+        self.coords = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+
+    def test_encode_polyline(self):
+        """Encoding matches the reference example of the algorithm."""
+        self.assertEqual(encode_polyline(self.coords), '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+
+    def test_polyline_round_trip(self):
+        """Decoding an encoded polyline returns the original coordinates."""
+        decoded = decode_polyline(encode_polyline(self.coords, precision=6), precision=6)
+        for (lat, lon), (dec_lat, dec_lon) in zip(self.coords, decoded):
+            self.assertAlmostEqual(lat, dec_lat, places=6)
+            self.assertAlmostEqual(lon, dec_lon, places=6)
+
+    def test_simplify_drops_collinear_points(self):
+        """Douglas-Peucker removes points lying on a straight line."""
+        line = [(39.9, 32.8 + i * 0.001) for i in range(50)] + [(39.95, 32.849)]
+        simplified = simplify(line, tolerance=1.0)
+        self.assertEqual(simplified.tolist(), [list(line[0]), list(line[-2]), list(line[-1])])
+
+    def test_format_geometry(self):
+        """GeoJSON output uses [lon, lat] order and unknown formats are rejected."""
+        geojson = format_geometry(self.coords)
+        self.assertEqual(geojson['coordinates'][0], [-120.2, 38.5])
+        self.assertIsInstance(format_geometry(self.coords, 'polyline6'), str)
+        with self.assertRaises(ValueError):
+            format_geometry(self.coords, 'wkt')
+
+class TestEdgeOverlay(unittest.TestCase):
+    """Test cases for live edge closures and speed overrides."""
+
+    def setUp(self):
+        """Set up the preference test graph and a temporary overlay store."""
+        TestPreferenceBasedRouting.setUp(self)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = OverlayStore(os.path.join(self.tmp_dir.name, 'overlay.json'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_closed_way_is_avoided(self):
+        """Closing a way forces the search around it."""
+        overlay = self.store.apply(close_ways=[102])
+        path, _ = self.graph.astar(1, 5, overlay=overlay)
+        self.assertEqual(path, [1, 3, 4, 5])
+
+    def test_closed_edge_is_directional(self):
+        """Closing one direction of an edge leaves the other open."""
+        overlay = self.store.apply(close_edges=[(2, 5)])
+        self.assertEqual(self.graph.astar(1, 5, overlay=overlay)[0], [1, 3, 4, 5])
+        self.assertEqual(self.graph.astar(5, 1, overlay=overlay)[0], [5, 2, 1])
+
+    def test_speed_override(self):
+        """A speed override changes the travel time without touching the graph."""
+        _, base_time = self.graph.astar(1, 5, current_time=datetime(2025, 4, 18, 12, 0))
+        overlay = self.store.apply(way_speeds={way_id: 25.0 for way_id in range(101, 106)})
+        _, slow_time = self.graph.astar(1, 5, current_time=datetime(2025, 4, 18, 12, 0), overlay=overlay)
+        self.assertAlmostEqual(slow_time, base_time * 2)
+        self.assertEqual(self.graph.nodes[1].adjacent[2]['speed_limit'], 50.0)
+
+    def test_versions_are_snapshots(self):
+        """Each update is a new version and older snapshots stay unchanged."""
+        first = self.store.apply(close_ways=[101])
+        second = self.store.apply(reopen_ways=[101], way_speeds={103: 30.0})
+        self.assertEqual(second.version, first.version + 1)
+        self.assertIn(101, first.closed_ways)
+        self.assertNotIn(101, second.closed_ways)
+        self.assertEqual(self.store.current().version, second.version)
+        # Another process sees the same version through the shared file
+        self.assertEqual(OverlayStore(self.store.path).current().to_dict(), second.to_dict())
+        self.assertEqual(self.store.clear().version, second.version + 1)
+
+class TestSearchMetrics(unittest.TestCase):
+    """Test cases for per-query search instrumentation."""
+
+    def setUp(self):
+        TestPreferenceBasedRouting.setUp(self)
+
+    def test_astar_records_stats(self):
+        """A* fills in the search counters when stats are requested."""
+        stats = SearchStats()
+        path, _ = self.graph.astar(1, 5, stats=stats)
+        self.assertEqual(path, [1, 2, 5])
+        self.assertGreaterEqual(stats.nodes_popped, len(path))
+        self.assertGreaterEqual(stats.edges_relaxed, len(path) - 1)
+        self.assertGreater(stats.heap_peak, 0)
+        self.assertGreater(stats.heuristic_time, 0)
+
+    def test_prometheus_rendering(self):
+        """Histograms render cumulative buckets, sum and count."""
+        registry = MetricsRegistry()
+        histogram = registry.histogram('test_seconds', 'Test timings', buckets=(0.1, 1.0))
+        histogram.observe(0.05, engine='astar')
+        histogram.observe(0.5, engine='astar')
+        registry.counter('test_total', 'Test counter').inc(3)
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE test_seconds histogram', lines)
+        self.assertIn('test_seconds_bucket{engine="astar",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{engine="astar",le="+Inf"} 2', lines)
+        self.assertIn('test_seconds_count{engine="astar"} 2', lines)
+        self.assertIn('test_total 3', lines)
+
+class TestGraphContraction(unittest.TestCase):
+    """Test cases for degree-2 node contraction."""
+
+    def setUp(self):
+        """Set up a two-way road 1..5 with a one-way spur 3 -> 6 -> 7."""
+        self.graph = RoutingGraph()
+        for i in range(1, 6):
+            self.graph.add_node(i, 39.9, 32.8 + i * 0.001)
+        self.graph.add_node(6, 39.901, 32.803)
+        self.graph.add_node(7, 39.902, 32.803)
+        for i in range(1, 5):
+            self.graph.add_edge(i, i + 1, True, 50.0 if i < 3 else 30.0, 101)
+        self.graph.add_edge(3, 6, False, 40.0, 102)
+        self.graph.add_edge(6, 7, False, 40.0, 102)
+        self.now = datetime(2025, 4, 18, 12, 0)
+
+    def test_chains_are_contracted(self):
+        """Shape nodes disappear while costs and geometry are preserved."""
+        geometry = self.graph.get_route_geometry([1, 2, 3, 4, 5])
+        _, base_time = self.graph.astar(1, 5, current_time=self.now)
+
+        self.assertEqual(self.graph.contract_degree2(), 3)
+        self.assertEqual(set(self.graph.nodes), {1, 3, 5, 7})
+        path, total_time = self.graph.astar(1, 5, current_time=self.now)
+        self.assertEqual(path, [1, 3, 5])
+        self.assertAlmostEqual(total_time, base_time)
+        self.assertEqual(self.graph.get_route_geometry(path), geometry)
+        self.assertEqual(self.graph.astar(3, 7)[0], [3, 7])
+        self.assertEqual(self.graph.astar(7, 3)[0], [])
+
+    def test_restricted_nodes_are_kept(self):
+        """Nodes next to a turn restriction keep their edges."""
+        self.graph.add_turn_restriction(3, 2, 6)
+        self.graph.contract_degree2()
+        self.assertIn(2, self.graph.nodes)
+        self.assertEqual(self.graph.astar(1, 7)[0], [])
+
+    def test_restriction_way_ids_are_not_nodes(self):
+        """Only the via node and its neighbours are kept for a restriction."""
+        # OSM restrictions name ways; way 101 is not node 101, and 4 is not next to 3
+        self.graph.add_turn_restriction(3, 101, 4)
+        self.graph.add_node(101, 39.95, 32.85)
+        self.graph.contract_degree2()
+        self.assertIn(4, self.graph.nodes)
+        self.assertNotIn(2, self.graph.nodes)
+
+    def test_snap_inside_contracted_chain(self):
+        """A point in the middle of a long chain snaps onto the chain, not to a far junction."""
+        graph = RoutingGraph()
+        for i in range(1, 21):
+            graph.add_node(i, 39.9, 32.8 + i * 0.002)
+        for i in range(1, 20):
+            graph.add_edge(i, i + 1, True, 50.0, 101)
+        plain = RoutingService.from_graph(graph.copy(), simplify=False)
+        service = RoutingService.from_graph(graph)
+        self.assertEqual(set(service.graph.nodes), {1, 20})
+
+        for pair in ((39.9001, 32.82, 39.9, 32.84), (39.9001, 32.82, 39.9, 32.802), (39.9, 32.804, 39.9, 32.836)):
+            geometry, duration = service.calculate_route(*pair, current_time=self.now)
+            expected, expected_duration = plain.calculate_route(*pair, current_time=self.now)
+            self.assertEqual(geometry, expected)
+            self.assertAlmostEqual(duration, expected_duration)
+
+    def test_overlay_closure_on_contracted_edge(self):
+        """Closing an original edge still closes the compound edge over it."""
+        self.graph.contract_degree2()
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        overlay = OverlayStore(os.path.join(tmp_dir.name, 'overlay.json')).apply(close_edges=[(4, 5)])
+        self.assertEqual(self.graph.astar(1, 5, overlay=overlay)[0], [])
+        self.assertEqual(self.graph.astar(5, 1, overlay=overlay)[0], [5, 3, 1])
+
+class TestArrayGraph(unittest.TestCase):
+    """Test cases for the Hilbert-ordered array layout searches run on."""
+
+    def setUp(self):
+        """Set up a 6x6 grid with scattered OSM-like ids and mixed speeds."""
+        self.graph = RoutingGraph()
+        self.ids = [7000000000 + (i * 7919) % 1000003 for i in range(36)]
+        for k, node_id in enumerate(self.ids):
+            self.graph.add_node(node_id, 39.9 + (k // 6) * 0.002, 32.8 + (k % 6) * 0.002)
+        for k, node_id in enumerate(self.ids):
+            if k % 6 < 5:
+                self.graph.add_edge(node_id, self.ids[k + 1], True, (30.0, 50.0, 70.0)[k % 3], 100 + k)
+            if k < 30:
+                self.graph.add_edge(node_id, self.ids[k + 6], k % 2 == 0, (50.0, 30.0)[k % 2], 200 + k)
+        self.now = datetime(2025, 4, 18, 8, 30)
+
+    def test_numbering(self):
+        """Nodes are numbered 0..n-1 with a mapping both ways and every edge kept."""
+        layout = ArrayGraph(self.graph)
+        self.assertEqual(sorted(layout.osm_ids), sorted(self.ids))
+        self.assertEqual([layout.index[node_id] for node_id in layout.osm_ids], list(range(36)))
+        for i, node_id in enumerate(layout.osm_ids):
+            targets = layout.targets[layout.offsets[i]:layout.offsets[i + 1]]
+            self.assertEqual({layout.osm_ids[j] for j in targets}, set(self.graph.nodes[node_id].adjacent))
+        # Neighbouring nodes along the curve are close on the map
+        first, second = (self.graph.nodes[node_id] for node_id in layout.osm_ids[:2])
+        self.assertLess(haversine_distance(first.lat, first.lon, second.lat, second.lon), 0.3)
+
+    def test_same_routes_as_dict_graph(self):
+        """Searches give the dict graph's costs and return OSM ids."""
+        layout = ArrayGraph(self.graph)
+        preferences = UserPreferences(preferred_ways={203: 0.5}, avoided_ways={102: 4.0})
+        for start, goal in ((0, 35), (35, 0), (5, 30), (12, 17), (3, 3)):
+            other_start = self.ids[(start + 1) % 36]
+            for kwargs in ({}, {'mode': 'walking'}, {'user_preferences': preferences},
+                           {'start_costs': {other_start: 0.001}}):
+                path, cost = layout.astar(self.ids[start], self.ids[goal], current_time=self.now, **kwargs)
+                _, expected_cost = self.graph.astar(self.ids[start], self.ids[goal], current_time=self.now, **kwargs)
+                self.assertAlmostEqual(cost, expected_cost, places=12)
+                self.assertIn(path[0], (self.ids[start], other_start))
+                self.assertEqual(path[-1], self.ids[goal])
+        self.assertEqual(layout.astar(self.ids[0], 123), ([], 0))
+
+    def test_restrictions_and_overlay(self):
+        """Turn restrictions are translated to the numbering and overlays still match OSM ids."""
+        a, b, c = self.ids[0], self.ids[1], self.ids[2]
+        self.graph.add_turn_restriction(b, a, c)
+        # Way ids in a restriction are not nodes
+        self.graph.add_turn_restriction(b, 101, c)
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        overlay = OverlayStore(os.path.join(tmp_dir.name, 'overlay.json')).apply(close_edges=[(self.ids[8], self.ids[9])])
+        layout = ArrayGraph(self.graph)
+        for kwargs in ({}, {'overlay': overlay}):
+            for goal in (c, self.ids[9]):
+                path, cost = layout.astar(a, goal, current_time=self.now, **kwargs)
+                _, expected_cost = self.graph.astar(a, goal, current_time=self.now, **kwargs)
+                self.assertAlmostEqual(cost, expected_cost, places=12)
+                self.assertNotIn([a, b, c], [path[i:i + 3] for i in range(len(path))])
+                if kwargs:
+                    self.assertNotIn([self.ids[8], self.ids[9]], [path[i:i + 2] for i in range(len(path))])
+
+    def test_layout_after_diff(self):
+        """A layout built from the previous one matches a fresh layout of the changed graph."""
+        layout = ArrayGraph(self.graph)
+        graph = self.graph.copy()
+        graph.nodes[self.ids[7]].lat += 0.001
+        graph.add_node(1, 39.895, 32.8)
+        graph.add_edge(1, self.ids[0], True, 50.0, 999)
+        updated = ArrayGraph(graph, previous=layout)
+        # Keys stay on the first layout's curve; the new node lies outside its box and is clamped to the edge
+        self.assertIs(updated.curve, layout.curve)
+        self.assertEqual(sorted(updated.osm_ids), sorted(graph.nodes))
+        self.assertNotEqual(updated.keys[self.ids[7]], layout.keys[self.ids[7]])
+        self.assertIs(updated.keys[self.ids[8]], layout.keys[self.ids[8]])
+        self.assertEqual(updated.astar(1, self.ids[35], current_time=self.now)[1],
+                         graph.astar(1, self.ids[35], current_time=self.now)[1])
+
+class TestRoadNameIndex(unittest.TestCase):
+    """Test cases for the cached road-name index over the drive graph."""
+
+    def setUp(self):
+        import networkx as nx
+        self.graph = nx.MultiDiGraph()
+        for node, (x, y) in enumerate([(32.85, 39.92), (32.851, 39.921), (32.852, 39.922), (32.86, 39.93)]):
+            self.graph.add_node(node, x=x, y=y)
+        self.graph.add_edge(0, 1, osmid=10, name='Atatürk Bulvarı', highway='primary', length=120.0)
+        self.graph.add_edge(1, 2, osmid=10, name='Atatürk Bulvarı', highway='primary', length=150.0)
+        self.graph.add_edge(2, 3, osmid="[11, 12]", name="['Kızılay Sokak', 'Bulvar Yolu']",
+                            highway="['residential', 'tertiary']", length=90.0)
+
+    def test_search(self):
+        index = RoadNameIndex(self.graph)
+        results = index.search('ataturk')
+        self.assertEqual(len(results), 1)
+        self.assertEqual((results[0]['id'], results[0]['osm_id'], results[0]['road_type']), ('1-2', 10, 'primary'))
+        self.assertEqual(results[0]['geometry'],
+                         {'type': 'LineString', 'coordinates': [[32.851, 39.921], [32.852, 39.922]]})
+        self.assertEqual(index.search('kizil')[0]['name'], 'Kızılay Sokak')
+        # Names starting with the query rank before ones merely containing it
+        self.assertEqual([r['name'] for r in index.search('bulvar')], ['Bulvar Yolu', 'Atatürk Bulvarı'])
+        self.assertEqual(index.search('xyz'), [])
+
+    def test_index_is_cached_per_graph(self):
+        index = get_road_index(self.graph)
+        self.assertIs(get_road_index(self.graph), index)
+        self.assertIsNot(get_road_index(self.graph.copy()), index)
+
+SAMPLE_OSM = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="39.900" lon="32.800"/>
+  <node id="2" lat="39.901" lon="32.801"/>
+  <node id="3" lat="39.902" lon="32.802"/>
+  <node id="4" lat="39.903" lon="32.803"/>
+  <node id="5" lat="39.950" lon="32.850"><tag k="amenity" v="cafe"/></node>
+  <way id="10">
+    <nd ref="1"/><nd ref="2"/><nd ref="3"/>
+    <tag k="highway" v="residential"/><tag k="name" v="Atatürk Caddesi"/>
+  </way>
+  <way id="11">
+    <nd ref="3"/><nd ref="4"/>
+    <tag k="highway" v="primary"/><tag k="oneway" v="yes"/><tag k="maxspeed" v="80"/>
+  </way>
+  <way id="12">
+    <nd ref="4"/><nd ref="5"/>
+    <tag k="building" v="yes"/>
+  </way>
+  <relation id="20">
+    <member type="way" ref="10" role="from"/>
+    <member type="node" ref="3" role="via"/>
+    <member type="way" ref="11" role="to"/>
+    <tag k="type" v="restriction"/><tag k="restriction" v="no_left_turn"/>
+  </relation>
+</osm>
+"""
+
+SAMPLE_OSC = """<?xml version="1.0" encoding="UTF-8"?>
+<osmChange version="0.6">
+  <modify>
+    <node id="2" lat="39.9015" lon="32.8005"/>
+  </modify>
+  <create>
+    <node id="6" lat="39.904" lon="32.804"/>
+    <node id="7" lat="39.9005" lon="32.8005">
+      <tag k="addr:street" v="Atatürk Caddesi"/><tag k="addr:housenumber" v="7"/>
+    </node>
+    <way id="13">
+      <nd ref="4"/><nd ref="6"/>
+      <tag k="highway" v="residential"/>
+    </way>
+  </create>
+  <delete>
+    <way id="11"/>
+  </delete>
+</osmChange>
+"""
+
+class TestOSMLoader(unittest.TestCase):
+    """Test cases for loading routing graphs from OSM files."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.osm_file = os.path.join(self.tmp_dir.name, 'sample.osm')
+        with open(self.osm_file, 'w', encoding='utf-8') as f:
+            f.write(SAMPLE_OSM)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_load_osm(self):
+        """Only routable ways become edges, with their way ids and speeds."""
+        loader = OSMLoader()
+        loader.load_osm(self.osm_file)
+        graph = loader.get_graph()
+        self.assertEqual(set(graph.nodes), {1, 2, 3, 4})
+        self.assertEqual(graph.nodes[1].adjacent[2]['way_id'], 10)
+        self.assertEqual(graph.nodes[3].adjacent[4]['speed_limit'], 80.0)
+        # Oneway ways only get the forward edge
+        self.assertNotIn(3, graph.nodes[4].adjacent)
+        self.assertIn((10, 11), graph.nodes[3].turn_restrictions)
+        self.assertEqual(graph.astar(1, 4)[0], [1, 2, 3, 4])
+
+    def test_load_pbf(self):
+        """A PBF extract produces the same elements and graph as XML."""
+        pbf_file = os.path.join(self.tmp_dir.name, 'sample.osm.pbf')
+        with open(pbf_file, 'wb') as f:
+            f.write(_build_pbf())
+
+        elements = list(iter_osm_elements(pbf_file, workers=2))
+        self.assertEqual(elements, [
+            ('node', 1, 39.9, 32.8, {}),
+            ('node', 2, 39.901, 32.801, {'highway': 'residential'}),
+            ('node', 3, 39.902, 32.802, {}),
+            ('way', 10, [1, 2, 3], {'highway': 'residential'}),
+        ])
+
+        loader = OSMLoader()
+        loader.load_osm(pbf_file, workers=1)
+        self.assertEqual(loader.get_graph().astar(1, 3)[0], [1, 2, 3])
+
+    def test_shared_ingestion(self):
+        """One ingest_osm pass feeds several consumers and builds the same graph."""
+        class WayCounter(OSMConsumer):
+            def __init__(self):
+                self.ways = 0
+                self.finished = False
+
+            def way(self, way_id, refs, tags):
+                self.ways += 1
+
+            def finish(self):
+                self.finished = True
+
+        standalone = OSMLoader()
+        standalone.load_osm(self.osm_file)
+        shared = OSMLoader()
+        counter = WayCounter()
+        coords = ingest_osm(self.osm_file, [shared, counter])
+
+        self.assertEqual(len(coords), 5)
+        self.assertEqual((counter.ways, counter.finished), (3, True))
+        self.assertEqual(set(shared.get_graph().nodes), set(standalone.get_graph().nodes))
+        self.assertEqual(shared.get_graph().nodes[1].adjacent, standalone.get_graph().nodes[1].adjacent)
+
+    def test_apply_osm_change(self):
+        """A published diff updates a contracted graph and the address index in place."""
+        osc_file = os.path.join(self.tmp_dir.name, 'daily.osc')
+        with open(osc_file, 'w', encoding='utf-8') as f:
+            f.write(SAMPLE_OSC)
+        store = OverlayStore(os.path.join(self.tmp_dir.name, 'overlay.json'))
+        log = ChangeLog(os.path.join(self.tmp_dir.name, 'changes'), store)
+
+        loader = OSMLoader()
+        indexer = AddressIndexer()
+        ingest_osm(self.osm_file, [loader, indexer])
+        service = RoutingService.from_graph(loader.get_graph(), loader=loader)
+        geocoder = OSMGeocoder.from_index(indexer.address_index, indexer=indexer)
+        for target in (service, geocoder):
+            target.change_log = log
+            target.overlay_store = store
+        self.assertNotIn(2, service.graph.nodes)
+
+        self.assertEqual(log.publish(osc_file), 1)
+        self.assertEqual(store.version, 1)
+        # The index changes in place, so a diff is not applied while a lookup holds the geocoder
+        applied = []
+        with geocoder._lock:
+            syncer = threading.Thread(target=lambda: applied.append(geocoder.sync_changes()))
+            syncer.start()
+            syncer.join(0.1)
+            self.assertTrue(syncer.is_alive())
+            self.assertNotIn('ataturk:7', indexer.address_index.exact_addresses)
+        syncer.join()
+        self.assertEqual(applied, [1])
+        self.assertEqual(geocoder.sync_changes(), 0)
+        self.assertEqual(service.sync_changes(), 1)
+
+        graph = service.graph
+        self.assertEqual(set(graph.nodes), {1, 3, 4, 6})
+        path, _ = graph.astar(1, 3)
+        self.assertEqual(graph.get_route_geometry(path), [(39.9, 32.8), (39.9015, 32.8005), (39.902, 32.802)])
+        self.assertEqual(graph.astar(3, 4)[0], [])
+        self.assertEqual(graph.astar(6, 4)[0], [6, 4])
+        self.assertIn('ataturk:7', indexer.address_index.exact_addresses)
+
+        # A new way joining a contracted chain turns the folded node back into a junction
+        junction_file = os.path.join(self.tmp_dir.name, 'junction.osc')
+        with open(junction_file, 'w', encoding='utf-8') as f:
+            f.write("""<?xml version="1.0" encoding="UTF-8"?>
+<osmChange version="0.6">
+  <create>
+    <node id="9" lat="39.9015" lon="32.7995"/>
+    <way id="14"><nd ref="9"/><nd ref="2"/><tag k="highway" v="residential"/></way>
+  </create>
+</osmChange>
+""")
+        log.publish(junction_file)
+        self.assertEqual(service.sync_changes(), 1)
+        self.assertIsNot(service.graph, graph)
+        self.assertEqual(service.graph.astar(9, 1)[0], [9, 2, 1])
+        self.assertEqual(service.graph.astar(3, 9)[0], [3, 2, 9])
+        # Queries that started before the swap keep the graph they had
+        self.assertNotIn(9, graph.nodes)
+        self.assertEqual(graph.astar(1, 3)[0], [1, 3])
+
+        # Deleting the address node removes every index entry it had
+        addr_id = indexer.element_ids[('node', 7)]
+        indexer.apply_changes([('delete', ('node', 7, None, None, {}))])
+        self.assertNotIn(addr_id, indexer.address_index.addresses)
+        self.assertNotIn('ataturk:7', indexer.address_index.exact_addresses)
+        self.assertEqual(list(indexer.address_index.spatial_idx.intersection((32.8, 39.9, 32.801, 39.901))), [])
+        self.assertEqual([action for action, _ in iter_osc_changes(osc_file)],
+                         ['modify', 'create', 'create', 'create', 'delete'])
+
+    def test_coordinate_store(self):
+        """Lookups work for sorted and out-of-order node ids."""
+        store = CoordinateStore()
+        for node_id in (5, 9, 12):
+            store.add(node_id, float(node_id), -float(node_id))
+        self.assertEqual(store.get(9), (9.0, -9.0))
+        self.assertIsNone(store.get(10))
+        store.add(7, 7.0, -7.0)
+        self.assertEqual(store.get(7), (7.0, -7.0))
+        self.assertEqual(store.get(12), (12.0, -12.0))
+        self.assertNotIn(8, store)
+
+    def test_load_overpass_cache(self):
+        """Overlapping Overpass responses build one graph with osmnx speed rules."""
+        nodes = [{'type': 'node', 'id': i, 'lat': 39.9, 'lon': 32.8 + i * 0.001} for i in range(1, 6)]
+        responses = [
+            {'elements': nodes[:3] + [
+                {'type': 'way', 'id': 10, 'nodes': [1, 2, 3], 'tags': {'highway': 'primary', 'maxspeed': '50;70'}},
+                {'type': 'way', 'id': 11, 'nodes': [3, 4], 'tags': {'highway': 'primary', 'oneway': '-1'}},
+            ]},
+            {'elements': nodes[2:] + [
+                {'type': 'way', 'id': 11, 'nodes': [3, 4], 'tags': {'highway': 'primary', 'oneway': '-1'}},
+                {'type': 'way', 'id': 12, 'nodes': [4, 5], 'tags': {'highway': 'residential'}},
+            ]},
+            [{'not': 'an overpass response'}],
+        ]
+        for i, response in enumerate(responses):
+            with open(os.path.join(self.tmp_dir.name, f'{i}.json'), 'w', encoding='utf-8') as f:
+                json.dump(response, f)
+
+        graph = load_overpass_graph(self.tmp_dir.name)
+        self.assertEqual(set(graph.nodes), {1, 2, 3, 4, 5})
+        self.assertEqual(graph.nodes[1].adjacent[2]['speed_limit'], 60.0)
+        # Untagged ways take the mean of their type, or of all tagged ways
+        self.assertEqual(graph.nodes[4].adjacent[3]['speed_limit'], 60.0)
+        self.assertEqual(graph.nodes[4].adjacent[5]['speed_limit'], 60.0)
+        # oneway=-1 runs against the node order
+        self.assertNotIn(4, graph.nodes[3].adjacent)
+        self.assertEqual(graph.astar(5, 1)[0], [5, 4, 3, 2, 1])
+        self.assertEqual(graph.astar(1, 5)[0], [])
+        self.assertAlmostEqual(parse_maxspeed('30 mph'), 48.28032)
+        self.assertIsNone(parse_maxspeed('TR:urban'))
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if not value:
+            out.append(byte)
+            return bytes(out)
+        out.append(byte | 0x80)
+
+def _message(number, payload):
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+def _packed_sint(values):
+    previous = 0
+    out = b''
+    for value in values:
+        delta = value - previous
+        previous = value
+        out += _varint((delta << 1) ^ (delta >> 63))
+    return out
+
+def _build_pbf():
+    """Encode a tiny OSMData block: three dense nodes and one way."""
+    strings = b''.join(_message(1, s) for s in (b'', b'highway', b'residential'))
+    dense = (_message(1, _packed_sint([1, 2, 3]))
+             + _message(8, _packed_sint([399000000, 399010000, 399020000]))
+             + _message(9, _packed_sint([328000000, 328010000, 328020000]))
+             + _message(10, b''.join(_varint(v) for v in [0, 1, 2, 0, 0])))
+    way = _varint(1 << 3) + _varint(10) + _message(2, _varint(1)) + _message(3, _varint(2)) \
+        + _message(8, _packed_sint([1, 2, 3]))
+    block = _message(1, strings) + _message(2, _message(2, dense)) + _message(2, _message(3, way))
+    blob = _varint(2 << 3) + _varint(len(block)) + _message(3, zlib.compress(block))
+    header = _message(1, b'OSMData') + _varint(3 << 3) + _varint(len(blob))
+    return struct.pack('>I', len(header)) + header + blob
+
+@unittest.skipUnless(django.conf.settings.configured, "needs the Django settings (run through manage.py test)")
+class TestGeocodingSearchView(unittest.TestCase):
+    """Test cases for the local fallback of the geocoding search endpoint."""
+
+    def test_location_bias(self):
+        from rest_framework.test import APIRequestFactory
+        from geocoding.nominatim import NominatimUnavailable
+        from routing import views
+        calls = []
+
+        def search(query, limit=10, near=None, radius=None):
+            calls.append((near, radius))
+            return [{'full_address': 'Konur Sokak 10, Çankaya', 'name': None, 'lat': 39.9265, 'lon': 32.8530,
+                     'type': 'exact_address', 'score': 1.0}]
+
+        nominatim = types.SimpleNamespace(search=mock.Mock(side_effect=NominatimUnavailable("budget exhausted")))
+        factory = APIRequestFactory()
+        view = views.GeocodingSearchView.as_view()
+        with mock.patch.object(views, 'get_nominatim_client', return_value=nominatim), \
+                mock.patch.object(views, 'get_geocoder', return_value=types.SimpleNamespace(search=search)):
+            with self.assertLogs('routing.views', 'WARNING'):
+                response = view(factory.get('/api/routing/geocoding/search/',
+                                            {'q': 'Konur', 'lat': '39.92', 'lon': '32.85', 'radius': '800'}))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['X-Geocode-Source'], 'local')
+            self.assertEqual(calls, [((39.92, 32.85), 800.0)])
+            response = view(factory.get('/api/routing/geocoding/search/',
+                                        {'q': 'Konur', 'lat': '39.92', 'lon': '32.85', 'radius': 'far'}))
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(len(calls), 1)
+
 if __name__ == '__main__':
     unittest.main()
@@ -7,7 +7,9 @@ from .views import (
     GraphMLSearchView,  # Yeni view'ı import et
     GeocodingSearchView,  # Yeni view'ı import et
     RoadSegmentGeometryView,  # Yeni view'ı import et
-    UserAreaPreferenceViewSet # Yeni ViewSet'i import et
+    UserAreaPreferenceViewSet, # Yeni ViewSet'i import et
+    EdgeOverlayView,  # Canlı yol kapatma / hız katmanı
+    SearchMetricsView  # Prometheus arama metrikleri
 )
 
 router = DefaultRouter()
@@ -25,4 +27,8 @@ urlpatterns = [
     path('geocoding/search/', GeocodingSearchView.as_view(), name='geocoding-search'),
     # YENİ: OSM ID ile geometri getirme endpoint'i
     path('road-segments/geometry/<int:osm_id>/', RoadSegmentGeometryView.as_view(), name='roadsegment-geometry'),
+    # Canlı yol kapatma ve hız geçersiz kılma (sadece admin)
+    path('overlay/', EdgeOverlayView.as_view(), name='edge-overlay'),
+    # Arama metrikleri (Prometheus metin formatı)
+    path('metrics/', SearchMetricsView.as_view(), name='search-metrics'),
 ]
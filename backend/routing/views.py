@@ -4,16 +4,19 @@ from rest_framework.decorators import action
 from django.shortcuts import get_object_or_404
 from django.db import transaction
 import json
+import logging
 from .models import RoadSegment, UserRoadPreference, RoutePreferenceProfile, UserAreaPreference
 from .serializers import RoadSegmentSerializer, UserRoadPreferenceSerializer, RoutePreferenceProfileSerializer, UserAreaPreferenceSerializer
-import networkx as nx
 from rest_framework.views import APIView
-from django.conf import settings
-import os
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut, GeocoderServiceError
-from django.http import JsonResponse
+from geocoding.nominatim import NominatimUnavailable, get_nominatim_client
+from geocoding.local import get_geocoder, parse_near
+from django.http import JsonResponse, HttpResponse
 from django.core.exceptions import ObjectDoesNotExist
+from .overlay import overlay_store
+from .metrics import registry as metrics_registry
+from .road_index import get_road_index
+
+logger = logging.getLogger(__name__)
 
 class RoadSegmentViewSet(viewsets.ModelViewSet):
     """API endpoint for road segments."""
@@ -211,7 +214,11 @@ class RoutePreferenceProfileViewSet(viewsets.ModelViewSet):
 
 # Yeni GraphML Arama View'ı
 class GraphMLSearchView(APIView):
-    """API endpoint for searching roads within a GraphML file."""
+    """
+    API endpoint for searching roads by name in the drive graph. Uses the
+    road-name index built once from the graph loaded by DirectionsView
+    (see routing/road_index.py) instead of re-reading the GraphML file.
+    """
     permission_classes = [permissions.AllowAny] # Veya IsAuthenticated, isteğe bağlı
 
     def get(self, request):
@@ -222,69 +229,33 @@ class GraphMLSearchView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        graphml_file_path = os.path.join(settings.BASE_DIR, 'data', 'ankara_drive.graphml')
-
-        if not os.path.exists(graphml_file_path):
+        # Graf, rota hesaplamasıyla paylaşılan bellekteki kopyadan alınır
+        from directions.views import load_graph_once
+        graph = load_graph_once()
+        if graph is None:
             return Response(
                 {"error": "GraphML file not found."}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
         try:
-            G = nx.read_graphml(graphml_file_path)
-            results = []
             limit = 10 # Sonuç limiti
-            count = 0
-
-            # Kenarları (yolları) kontrol et
-            for u, v, data in G.edges(data=True):
-                road_name = data.get('name') # Yol isminin 'name' özniteliğinde olduğunu varsayıyoruz
-                # Bazen isimler liste olabilir, kontrol edelim
-                if isinstance(road_name, list):
-                    road_name = road_name[0] if road_name else None
-                
-                if road_name and query.lower() in road_name.lower():
-                    # Basit bir ID oluştur (u, v, key olabilir, şimdilik sadece isim)
-                    # Frontend'in RoadSegment interface'ine benzer bir yapı döndür
-                    results.append({
-                        'id': f"{u}-{v}", # Benzersiz ID için başlangıç-bitiş düğümü kullanabiliriz
-                        'osm_id': data.get('osmid'), # Varsa OSM ID
-                        'name': road_name,
-                        'road_type': data.get('highway'), # Yol tipi 'highway' olabilir
-                        'geometry': None # Şimdilik geometri eklemiyoruz
-                    })
-                    count += 1
-                    if count >= limit:
-                        break
-            
-            # Eğer kenarlarda 'name' yoksa düğümleri de kontrol et (daha az olası)
-            if not results:
-                 for node, data in G.nodes(data=True):
-                    node_name = data.get('name')
-                    if node_name and query.lower() in node_name.lower():
-                         results.append({
-                            'id': node,
-                            'osm_id': data.get('osmid'),
-                            'name': node_name,
-                            'road_type': 'node', # Tip olarak 'node' belirleyelim
-                            'geometry': None
-                        })
-                         count += 1
-                         if count >= limit:
-                            break
-
-            return Response(results)
+            return Response(get_road_index(graph).search(query, limit))
 
         except Exception as e:
             # Hata loglama eklenebilir
             return Response(
-                {"error": f"Error processing GraphML file: {str(e)}"}, 
+                {"error": f"Error searching road names: {str(e)}"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
 # Yeni Geocoding Arama View'ı
 class GeocodingSearchView(APIView):
-    """API endpoint for searching locations using Nominatim Geocoding service."""
+    """
+    API endpoint for searching locations using Nominatim Geocoding service,
+    rate limited across workers, with the local address index as fallback.
+    Optional lat/lon (and radius in meters) bias the fallback results.
+    """
     permission_classes = [permissions.AllowAny] # Herkesin erişimine açık
 
     def get(self, request):
@@ -297,58 +268,34 @@ class GeocodingSearchView(APIView):
                 {"error": "Search query must be at least 3 characters"},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        try:
+            near, radius = parse_near(request.query_params)
+        except ValueError as e:
+            return Response({"error": f"Invalid location: {e}"}, status=status.HTTP_400_BAD_REQUEST)
 
-        geolocator = Nominatim(user_agent="bil496_project_app")
         try:
-            # viewbox'ı doğru formata getir: [(güney_lat, batı_lon), (kuzey_lat, doğu_lon)]
-            # ankara_viewbox = [39.6, 32.5, 40.2, 33.2] # Eski hatalı format
-            ankara_viewbox = [(39.6, 32.5), (40.2, 33.2)] # YENİ DOĞRU FORMAT
-            
-            print(f"[GeocodingSearchView] Querying Nominatim for: {query} with viewbox: {ankara_viewbox}") # Log güncellendi
-            locations = geolocator.geocode(
-                query,
-                exactly_one=False,
-                limit=5,
-                country_codes='TR',
-                viewbox=ankara_viewbox, # Doğru formatı kullan
-                bounded=1,
-                timeout=10
-            )
-            print(f"[GeocodingSearchView] Nominatim raw response: {locations}")
-
-            results = []
-            if locations:
-                for loc in locations:
-                    bbox = None
-                    if loc.raw.get('boundingbox'):
-                       bbox_raw = [float(b) for b in loc.raw['boundingbox']]
-                       bbox = [bbox_raw[0], bbox_raw[1], bbox_raw[2], bbox_raw[3]]
-                       
-                    results.append({
-                        'id': loc.raw.get('place_id') or loc.raw.get('osm_id'),
-                        'name': loc.address,
-                        'lat': loc.latitude,
-                        'lon': loc.longitude,
-                        'bbox': bbox,
-                        'osm_id': loc.raw.get('osm_id'),
-                        'road_type': loc.raw.get('type') or loc.raw.get('class'),
-                        'geometry': None
-                    })
-            
-            print(f"[GeocodingSearchView] Processed results: {results}") # LOG 4: İşlenmiş sonuçlar
-            return Response(results)
-
-        except GeocoderTimedOut:
-            print("[GeocodingSearchView] Error: Geocoding service timed out") # LOG 5: Hata
-            return Response({"error": "Geocoding service timed out"}, status=status.HTTP_504_GATEWAY_TIMEOUT)
-        except GeocoderServiceError as e:
-            print(f"[GeocodingSearchView] Error: Geocoding service error: {str(e)}") # LOG 6: Hata
-            return Response({"error": f"Geocoding service error: {str(e)}"}, status=status.HTTP_502_BAD_GATEWAY)
+            results, source = get_nominatim_client().search(query)
+            logger.debug("%d results from %s for %r", len(results), source, query)
+            return Response(results, headers={'X-Geocode-Source': source})
+        except NominatimUnavailable as e:
+            # Nominatim bütçesi dolduysa ya da yanıt vermediyse yerel adres indeksine düş
+            logger.warning("Nominatim unavailable (%s), using the local index", e)
+            geocoder = get_geocoder()
+            if geocoder is None:
+                return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            results = [{
+                'id': None,
+                'name': result['full_address'] if result['type'] != 'poi' else f"{result['name']}, {result['full_address']}",
+                'lat': result['lat'],
+                'lon': result['lon'],
+                'bbox': None,
+                'osm_id': None,
+                'road_type': result['type'],
+                'geometry': None
+            } for result in geocoder.search(query, 5, near=near, radius=radius)]
+            return Response(results, headers={'X-Geocode-Source': 'local'})
         except Exception as e:
             print(f"[GeocodingSearchView] Error: An unexpected error occurred: {str(e)}") # LOG 7: Hata
-            # Hatanın tam izini görmek için traceback'i de yazdırabiliriz:
-            # import traceback
-            # print(traceback.format_exc())
             return Response({"error": f"An unexpected error occurred: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 # YENİ: OSM ID ile Geometri Getirme View'ı
@@ -413,3 +360,48 @@ class UserAreaPreferenceViewSet(viewsets.ModelViewSet):
             count, _ = UserAreaPreference.objects.filter(user=request.user).delete()
             return Response({'message': f'{count} area preferences deleted.'}, status=status.HTTP_204_NO_CONTENT)
         return Response({'error': 'Authentication required.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+
+class EdgeOverlayView(APIView):
+    """Admin endpoint for live edge closures and speed overrides on the in-memory graph."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        """Return the current overlay and its version."""
+        return Response(overlay_store.current().to_dict())
+
+    def post(self, request):
+        """
+        Publish a new overlay version.
+
+        Body fields (all optional): close_ways, reopen_ways (way ids),
+        close_edges, reopen_edges ([from_node, to_node] pairs),
+        way_speeds ({way_id: km/h or null}) and edge_speeds
+        ([from_node, to_node, km/h or null] triples).
+        """
+        data = request.data
+        try:
+            overlay = overlay_store.apply(
+                close_ways=data.get('close_ways', []),
+                reopen_ways=data.get('reopen_ways', []),
+                close_edges=[tuple(edge) for edge in data.get('close_edges', [])],
+                reopen_edges=[tuple(edge) for edge in data.get('reopen_edges', [])],
+                way_speeds=data.get('way_speeds', {}),
+                edge_speeds={(u, v): speed for u, v, speed in data.get('edge_speeds', [])},
+            )
+        except (TypeError, ValueError) as e:
+            return Response({"error": f"Invalid overlay update: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(overlay.to_dict(), status=status.HTTP_200_OK)
+
+    def delete(self, request):
+        """Remove all closures and speed overrides."""
+        return Response(overlay_store.clear().to_dict(), status=status.HTTP_200_OK)
+
+
+class SearchMetricsView(APIView):
+    """Expose routing search metrics in the Prometheus text exposition format."""
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
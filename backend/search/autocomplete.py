@@ -0,0 +1,142 @@
+"""
+Prefix autocomplete over the street, neighborhood and POI names of an AddressIndex.
+
+Names are stored in a radix (compressed prefix) trie keyed by their
+normalized form and by every word-start suffix, so "bulv" finds
+"Atatürk Bulvarı". Every trie node keeps the k best entries below it,
+computed once at build time, so a lookup is a walk down at most
+len(prefix) characters and no subtree is ever visited.
+"""
+import math
+from typing import Dict, List, Tuple
+
+# Completions precomputed per trie node
+TOP_K = 10
+
+# Importance of each kind of name relative to its number of addresses
+KIND_WEIGHTS = {'neighborhood': 3.0, 'poi': 2.0, 'street': 1.0}
+
+class _TrieNode:
+    __slots__ = ('children', 'entries', 'top')
+
+    def __init__(self):
+        self.children: Dict[str, Tuple[str, '_TrieNode']] = {}  # first char -> (edge label, child)
+        self.entries: List[int] = []  # entries whose key ends here
+        self.top: Tuple[int, ...] = ()
+
+class CompletionTrie:
+    """
+    Radix trie from keys to entry ids with precomputed top-k entries per node.
+
+    Insert every key, then call build() with the entry scores; lookups
+    return entry ids, best first. Keys cannot be added after build().
+    """
+
+    def __init__(self):
+        self.root = _TrieNode()
+        self.k = 0
+
+    def insert(self, key: str, entry_id: int):
+        node = self.root
+        while key:
+            edge = node.children.get(key[0])
+            if edge is None:
+                child = _TrieNode()
+                node.children[key[0]] = (key, child)
+                node = child
+                break
+            label, child = edge
+            common = 0
+            while common < len(label) and common < len(key) and label[common] == key[common]:
+                common += 1
+            if common < len(label):
+                # Split the edge at the end of the shared part
+                middle = _TrieNode()
+                middle.children[label[common]] = (label[common:], child)
+                node.children[key[0]] = (label[:common], middle)
+                child = middle
+            node = child
+            key = key[common:]
+        node.entries.append(entry_id)
+
+    def build(self, scores: List[float], k: int = TOP_K):
+        """Compute the k best entry ids (highest score, then lowest id) under every node."""
+        self.k = k
+        rank = lambda entry_id: (-scores[entry_id], entry_id)
+        # Iterative post-order walk; deep tries would hit the recursion limit
+        stack = [(self.root, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if not children_done:
+                stack.append((node, True))
+                stack.extend((child, False) for _, child in node.children.values())
+                continue
+            candidates = set(node.entries)
+            for _, child in node.children.values():
+                candidates.update(child.top)
+            node.top = tuple(sorted(candidates, key=rank)[:k])
+            node.entries = []
+
+    def lookup(self, prefix: str) -> Tuple[int, ...]:
+        """Best entry ids with a key starting with prefix."""
+        node = self.root
+        while prefix:
+            edge = node.children.get(prefix[0])
+            if edge is None:
+                return ()
+            label, child = edge
+            if prefix.startswith(label):
+                prefix = prefix[len(label):]
+            elif label.startswith(prefix):
+                # The prefix ends inside this edge; everything below the child matches
+                prefix = ''
+            else:
+                return ()
+            node = child
+        return node.top
+
+class Autocompleter:
+    """Top-k completions for the names in an AddressIndex."""
+
+    def __init__(self, address_index, k: int = TOP_K):
+        self.address_index = address_index
+        self.trie = CompletionTrie()
+        self.entries: List[Dict] = []
+        scores: List[float] = []
+
+        for kind, table, tag_keys in (
+                ('street', address_index.streets, ('addr:street',)),
+                ('neighborhood', address_index.neighborhoods, ('addr:suburb', 'addr:district')),
+                ('poi', address_index.pois, ('name',))):
+            for key, ids in table.items():
+                entry = self._make_entry(kind, key, ids, tag_keys)
+                entry_id = len(self.entries)
+                self.entries.append(entry)
+                # log keeps a huge street from crowding out every nearby name
+                scores.append(KIND_WEIGHTS[kind] * math.log1p(len(ids)))
+                # Street keys lack their suffix ("ataturk"), so index the displayed name
+                text = address_index._normalize_text(entry['name'])
+                self.trie.insert(text, entry_id)
+                for i, char in enumerate(text):
+                    if char == ' ' and i + 1 < len(text):
+                        self.trie.insert(text[i + 1:], entry_id)
+        self.trie.build(scores, k)
+
+    def _make_entry(self, kind: str, key: str, ids, tag_keys) -> Dict:
+        store = self.address_index.addresses
+        first_id = next(iter(ids))
+        name = next((store.tag(first_id, tag) for tag in tag_keys if store.tag(first_id, tag)), key)
+        coords = [store.coords(addr_id) for addr_id in ids]
+        return {
+            'type': kind,
+            'name': name,
+            'lat': sum(lat for lat, _ in coords) / len(coords),
+            'lon': sum(lon for _, lon in coords) / len(coords),
+            'count': len(coords),
+        }
+
+    def complete(self, prefix: str, limit: int = TOP_K) -> List[Dict]:
+        normalized = self.address_index._normalize_text(prefix)
+        if not normalized:
+            return []
+        return [self.entries[entry_id] for entry_id in self.trie.lookup(normalized)[:limit]]
@@ -0,0 +1,110 @@
+from typing import Dict, Iterable, List, Set, Tuple
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Damerau-Levenshtein (optimal string alignment) distance between a and b,
+    or max_distance + 1 as soon as it is certain to exceed max_distance.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            # Adjacent transposition, e.g. "atatruk" -> "ataturk"
+            if (i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+class SymSpell:
+    """
+    Symmetric delete spelling dictionary.
+
+    Every term is stored under all strings obtained by deleting up to
+    max_distance characters from its prefix. A lookup generates the same
+    deletes for the query, so candidate terms are found with dictionary hits
+    instead of comparing the query against every term; only those candidates
+    get a real edit distance check.
+    """
+
+    def __init__(self, terms: Iterable[str] = (), max_distance: int = 2, prefix_length: int = 7):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.terms: Set[str] = set()
+        self.deletes: Dict[str, List[str]] = {}  # delete -> terms it came from
+        for term in terms:
+            self.add(term)
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def __contains__(self, term: str) -> bool:
+        return term in self.terms
+
+    def _term_deletes(self, term: str) -> Set[str]:
+        prefix = term[:self.prefix_length]
+        found = {prefix}
+        frontier = [prefix]
+        for _ in range(self.max_distance):
+            next_frontier = []
+            for word in frontier:
+                for i in range(len(word)):
+                    delete = word[:i] + word[i + 1:]
+                    if delete not in found:
+                        found.add(delete)
+                        next_frontier.append(delete)
+            frontier = next_frontier
+        return found
+
+    def add(self, term: str):
+        if term in self.terms:
+            return
+        self.terms.add(term)
+        for delete in self._term_deletes(term):
+            self.deletes.setdefault(delete, []).append(term)
+
+    def remove(self, term: str):
+        if term not in self.terms:
+            return
+        self.terms.discard(term)
+        for delete in self._term_deletes(term):
+            terms = self.deletes.get(delete)
+            if terms is not None:
+                terms.remove(term)
+                if not terms:
+                    del self.deletes[delete]
+
+    def lookup(self, query: str, max_distance: int = None) -> List[Tuple[str, int]]:
+        """Terms within max_distance edits of the query as (term, distance), closest first."""
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+
+        query_prefix = query[:self.prefix_length]
+        results: Dict[str, int] = {}
+        seen_deletes = {query_prefix}
+        seen_terms: Set[str] = set()
+        frontier = [query_prefix]
+        for depth in range(max_distance + 1):
+            next_frontier = []
+            for candidate in frontier:
+                for term in self.deletes.get(candidate, ()):
+                    if term in seen_terms:
+                        continue
+                    seen_terms.add(term)
+                    distance = edit_distance(query, term, max_distance)
+                    if distance <= max_distance:
+                        results[term] = distance
+                if depth < max_distance:
+                    for i in range(len(candidate)):
+                        delete = candidate[:i] + candidate[i + 1:]
+                        if delete not in seen_deletes:
+                            seen_deletes.add(delete)
+                            next_frontier.append(delete)
+            frontier = next_frontier
+        return sorted(results.items(), key=lambda item: (item[1], item[0]))
@@ -1,20 +1,113 @@
-from typing import Dict, List, Tuple, Set
-import xml.etree.ElementTree as ET
+import logging
+import threading
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Set
+from collections.abc import Mapping
+from itertools import islice
+from bisect import bisect_left, insort
+from math import cos, hypot, radians
 from rtree import index
 import re
 from difflib import SequenceMatcher
 from unidecode import unidecode
+from search.ngram import TrigramIndex
+from search.fuzzy import SymSpell
+from search.autocomplete import Autocompleter
+from search.store import AddressStore
+from routing.ingest import CoordinateStore, OSMConsumer, ingest_osm
+from routing.osc import change_log, iter_osc_changes
+from routing.overlay import overlay_store
+from routing.astar import haversine_distance
+
+logger = logging.getLogger(__name__)
+
+# Kilometers per degree of latitude, for turning a search radius into a bounding box
+KM_PER_DEGREE = 111.32
+
+# Location-biased search: share of the final score that comes from proximity,
+# and the distance (meters) at which the proximity score halves
+DISTANCE_WEIGHT = 0.3
+DISTANCE_SCALE = 2000.0
+
+# House numbers within this distance of a queried one are offered as nearby addresses
+NEARBY_NUMBERS = 5
+
+# addr:interpolation values and their number steps, and the longest run filled in
+INTERPOLATION_STEPS = {'odd': 2, 'even': 2, 'all': 1}
+MAX_INTERPOLATED = 100
+
+_HOUSE_NUMBER = re.compile(r'^\s*(\d+)\s*(.*?)\s*$')
+
+def parse_house_number(text: str) -> Optional[Tuple[int, str]]:
+    """
+    Split a house number into its numeric part and a normalized suffix:
+    "12" -> (12, ''), "12 A" -> (12, 'a'), "12/3" -> (12, '/3').
+    Returns None when it does not start with a number.
+    """
+    match = _HOUSE_NUMBER.match(text or '')
+    if match is None:
+        return None
+    return int(match.group(1)), match.group(2).replace(' ', '').lower()
+
+def _point_along(points: List[Tuple[float, float]], fraction: float) -> Tuple[float, float]:
+    """The (lat, lon) at a fraction of a polyline's length (planar, fine at street scale)."""
+    lengths = [hypot(b[0] - a[0], b[1] - a[1]) for a, b in zip(points, points[1:])]
+    remaining = fraction * sum(lengths)
+    for (a, b), length in zip(zip(points, points[1:]), lengths):
+        if remaining <= length and length > 0:
+            t = remaining / length
+            return a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t
+        remaining -= length
+    return points[-1]
+
+class ExactAddresses(Mapping):
+    """
+    "street_name:number" -> set of address ids, read from house_numbers
+    rather than stored a second time. Only numbers parse_house_number()
+    understands are found.
+    """
+
+    def __init__(self, address_index: 'AddressIndex'):
+        self.address_index = address_index
+
+    def __getitem__(self, key: str) -> Set[int]:
+        street, _, number = key.rpartition(':')
+        parsed = parse_house_number(number)
+        ids = set()
+        if parsed:
+            ids = {addr_id for _, suffix, addr_id in self.address_index._find_house_numbers(street, parsed[0])
+                   if suffix == parsed[1] and self.address_index.addresses.tag(addr_id, 'addr:housenumber') == number}
+        if not ids:
+            raise KeyError(key)
+        return ids
+
+    def __iter__(self) -> Iterator[str]:
+        for street, entries in self.address_index.house_numbers.items():
+            yield from dict.fromkeys(f"{street}:{self.address_index.addresses.tag(addr_id, 'addr:housenumber')}"
+                                     for _, _, addr_id in entries)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
 
 class AddressIndex:
     def __init__(self):
         self.spatial_idx = index.Index()
-        self.addresses: Dict[int, Dict] = {}  # id -> address data
         self.streets: Dict[str, Set[int]] = {}  # street name -> set of address ids
         self.neighborhoods: Dict[str, Set[int]] = {}  # neighborhood -> set of address ids
         self.pois: Dict[str, Set[int]] = {}  # POI name -> set of address ids
         self.poi_types: Dict[str, Set[int]] = {}  # POI type -> set of address ids
-        self.exact_addresses: Dict[str, Set[int]] = {}  # "street_name:number" -> set of address ids
+        # street name -> (number, suffix, address id) sorted, for bisect range lookups
+        self.house_numbers: Dict[str, List[Tuple[int, str, int]]] = {}
+        # Trigram indexes over the normalized names, so lookups never scan every name
+        self.street_grams = TrigramIndex()
+        self.neighborhood_grams = TrigramIndex()
+        self.poi_grams = TrigramIndex()
+        # Typo dictionaries (edit distance <= 2) over the same normalized names
+        self.street_spell = SymSpell()
+        self.poi_spell = SymSpell()
         self.current_id = 0
+        # "street_name:number" -> set of address ids, derived from house_numbers
+        self.exact_addresses = ExactAddresses(self)
 
         # Common POI types in Turkish and English
         self.poi_categories = {
@@ -25,19 +118,13 @@ class AddressIndex:
             'tourism': {'hotel', 'museum', 'otel', 'müze'},
             'public_transport': {'station', 'stop', 'metro', 'bus_station', 'durak', 'istasyon'}
         }
+        # id -> address data, stored column-wise (see search.store)
+        self.addresses = AddressStore(tuple(self.poi_categories))
 
-    def add_address(self, lat: float, lon: float, tags: Dict[str, str]):
-        """Add an address point to the index."""
+    def add_address(self, lat: float, lon: float, tags: Dict[str, str]) -> int:
+        """Add an address point to the index and return its id."""
         self.current_id += 1
         
-        # Store address data
-        address_data = {
-            'lat': lat,
-            'lon': lon,
-            'tags': tags,
-            'id': self.current_id
-        }
-        
         # Add to spatial index
         self.spatial_idx.insert(
             self.current_id,
@@ -45,7 +132,7 @@ class AddressIndex:
         )
         
         # Store address data
-        self.addresses[self.current_id] = address_data
+        self.addresses.add(self.current_id, lat, lon, tags)
         
         # Index street name and exact address
         street = self._get_street_name(tags)
@@ -54,15 +141,16 @@ class AddressIndex:
             normalized_street = self._normalize_street_name(street)
             if normalized_street not in self.streets:
                 self.streets[normalized_street] = set()
+                self.street_grams.add(normalized_street)
+                self.street_spell.add(normalized_street)
             self.streets[normalized_street].add(self.current_id)
             
             # Store exact address (street + number)
             house_number = tags.get('addr:housenumber')
             if house_number:
-                exact_addr_key = f"{normalized_street}:{house_number}"
-                if exact_addr_key not in self.exact_addresses:
-                    self.exact_addresses[exact_addr_key] = set()
-                self.exact_addresses[exact_addr_key].add(self.current_id)
+                parsed = parse_house_number(house_number)
+                if parsed:
+                    insort(self.house_numbers.setdefault(normalized_street, []), (*parsed, self.current_id))
         
         # Index neighborhood/district
         neighborhood = tags.get('addr:suburb') or tags.get('addr:district')
@@ -70,10 +158,53 @@ class AddressIndex:
             normalized_neighborhood = self._normalize_text(neighborhood)
             if normalized_neighborhood not in self.neighborhoods:
                 self.neighborhoods[normalized_neighborhood] = set()
+                self.neighborhood_grams.add(normalized_neighborhood)
             self.neighborhoods[normalized_neighborhood].add(self.current_id)
 
         # Index POIs
         self._index_poi(tags, self.current_id)
+        return self.current_id
+
+    def remove_address(self, addr_id: int):
+        """Remove an address point and all of its index entries."""
+        addr = self.addresses.pop(addr_id, None)
+        if addr is None:
+            return
+        self.spatial_idx.delete(addr_id, (addr['lon'], addr['lat'], addr['lon'], addr['lat']))
+
+        # Recompute the keys add_address() used for this entry
+        tags = addr['tags']
+        keys = []
+        street = self._get_street_name(tags)
+        if street:
+            normalized_street = self._normalize_street_name(street)
+            keys.append((self.streets, normalized_street, (self.street_grams, self.street_spell)))
+            if tags.get('addr:housenumber'):
+                parsed = parse_house_number(tags['addr:housenumber'])
+                entries = self.house_numbers.get(normalized_street)
+                if parsed and entries:
+                    position = bisect_left(entries, (*parsed, addr_id))
+                    if position < len(entries) and entries[position][2] == addr_id:
+                        del entries[position]
+                    if not entries:
+                        del self.house_numbers[normalized_street]
+        neighborhood = tags.get('addr:suburb') or tags.get('addr:district')
+        if neighborhood:
+            keys.append((self.neighborhoods, self._normalize_text(neighborhood), (self.neighborhood_grams,)))
+        if tags.get('name'):
+            keys.append((self.pois, self._normalize_text(tags['name']), (self.poi_grams, self.poi_spell)))
+        for category in self.poi_categories:
+            if category in tags:
+                keys.append((self.poi_types, self._normalize_text(tags[category]), ()))
+
+        for table, key, name_indexes in keys:
+            ids = table.get(key)
+            if ids is not None:
+                ids.discard(addr_id)
+                if not ids:
+                    del table[key]
+                    for name_index in name_indexes:
+                        name_index.remove(key)
 
     def _index_poi(self, tags: Dict[str, str], addr_id: int):
         """Index POI information."""
@@ -83,6 +214,8 @@ class AddressIndex:
             normalized_name = self._normalize_text(name)
             if normalized_name not in self.pois:
                 self.pois[normalized_name] = set()
+                self.poi_grams.add(normalized_name)
+                self.poi_spell.add(normalized_name)
             self.pois[normalized_name].add(addr_id)
 
         # Index POI types
@@ -114,13 +247,27 @@ class AddressIndex:
         """Calculate similarity ratio between two strings."""
         return SequenceMatcher(None, text1, text2).ratio()
 
+    @staticmethod
+    def _typo_distance(text: str) -> int:
+        """Edits tolerated for a typo match; short names only get one."""
+        return 1 if len(text) < 6 else 2
+
+    def _find_house_numbers(self, street: str, number: int, spread: int = 0) -> List[Tuple[int, str, int]]:
+        """(number, suffix, address id) entries on a street numbered within spread of number."""
+        entries = self.house_numbers.get(street)
+        if not entries:
+            return []
+        start = bisect_left(entries, (number - spread,))
+        end = bisect_left(entries, (number + spread + 1,))
+        return entries[start:end]
+
     def _parse_address_query(self, query: str) -> Tuple[str, str]:
-        """Parse a query into street name and house number."""
+        """Parse a query into street name and house number ("12", "12A", "12/3")."""
         # Remove extra spaces and normalize
         query = re.sub(r'\s+', ' ', query.strip())
         
         # Try to find a number at the end of the query
-        match = re.search(r'^(.*?)[\s/]*(\d+)\s*$', query)
+        match = re.search(r'^(.*?)[\s/]*(\d+(?:\s?[^\W\d_]|/\d+)?)\s*$', query)
         if match:
             street = match.group(1).strip()
             number = match.group(2).strip()
@@ -147,115 +294,140 @@ class AddressIndex:
         normalized_query = self._normalize_street_name(street_query)
         matching_streets = []
         
-        # Debug print
-        print(f"\nSearching for street: {street_query}")
-        print(f"Normalized query: {normalized_query}")
+        logger.debug("Searching for street: %s", street_query)
+        logger.debug("Normalized query: %s", normalized_query)
         
         # First try exact matches
-        for street in self.streets:
-            if normalized_query == street:
-                matching_streets.append(street)
-                print(f"Exact match found: {street}")
+        if normalized_query in self.streets:
+            matching_streets.append(normalized_query)
+            logger.debug("Exact match found: %s", normalized_query)
                 
-        # If no exact matches, try partial matches
+        # If no exact matches, try partial matches among the trigram candidates
         if not matching_streets:
-            for street in self.streets:
-                # Check if query is part of street name or vice versa
-                if normalized_query in street or street in normalized_query:
-                    matching_streets.append(street)
-                    print(f"Partial match found: {street}")
-                # Also check similarity for typos
-                elif self._calculate_similarity(normalized_query, street) > 0.8:
+            for street in sorted(self.street_grams.matches(normalized_query)):
+                # Query is part of street name or vice versa
+                matching_streets.append(street)
+                logger.debug("Partial match found: %s", street)
+            # Also check for typos
+            for street, distance in self.street_spell.lookup(normalized_query, self._typo_distance(normalized_query)):
+                if street not in matching_streets:
                     matching_streets.append(street)
-                    print(f"Similarity match found: {street}")
-        
-        # Debug: print building numbers for matching streets
-        for street in matching_streets:
-            print(f"\nBuilding numbers for {street}:")
-            for addr_id in self.streets[street]:
-                addr = self.addresses[addr_id]
-                if 'addr:housenumber' in addr['tags']:
-                    print(f"  Building {addr['tags']['addr:housenumber']}")
-                    
+                    logger.debug("Typo match found: %s (distance %s)", street, distance)
+
         return matching_streets
 
-    def search(self, query: str, limit: int = 10) -> List[Dict]:
-        """Search for addresses, streets, and POIs matching the query."""
+    def _ids_within(self, lat: float, lon: float, radius: float) -> Set[int]:
+        """Ids of the entries at most radius meters from a point."""
+        lat_delta = radius / 1000 / KM_PER_DEGREE
+        lon_delta = lat_delta / max(cos(radians(lat)), 0.01)
+        return {
+            addr_id for addr_id in self.spatial_idx.intersection(
+                (lon - lon_delta, lat - lat_delta, lon + lon_delta, lat + lat_delta))
+            if haversine_distance(lat, lon, *self.addresses.coords(addr_id)) * 1000 <= radius
+        }
+
+    def search(self, query: str, limit: int = 10, near: Tuple[float, float] = None,
+               radius: float = None) -> List[Dict]:
+        """
+        Search for addresses, streets, and POIs matching the query.
+
+        near=(lat, lon) biases the ranking towards that point: the score
+        blends text similarity with proximity and each result gets its
+        distance in meters. With a radius (meters) as well, only entries
+        inside it are considered, and they are picked with the R-tree before
+        any text scoring.
+        """
         # First try to parse as exact address
         street_query, number = self._parse_address_query(query)
         
-        print(f"\nSearch query: {query}")
-        print(f"Parsed as - Street: {street_query}, Number: {number}")
+        logger.debug("Search query: %s", query)
+        logger.debug("Parsed as - Street: %s, Number: %s", street_query, number)
         
         results = []
         seen_addresses = set()
+        allowed = self._ids_within(near[0], near[1], radius) if near and radius is not None else None
+
+        def finish() -> List[Dict]:
+            """Best results first; addresses are only formatted for the ones returned."""
+            results.sort(key=lambda x: x['score'], reverse=True)
+            for result in results[:limit]:
+                result['full_address'] = self._format_address(self.addresses.view(result.pop('id')))
+            return results[:limit]
+
+        def candidates(ids: Set[int]) -> Set[int]:
+            """Restrict an id set to the search radius, if there is one."""
+            if allowed is None:
+                return ids
+            return ids & allowed if len(ids) < len(allowed) else allowed & ids
 
         # Helper function to add results
         def add_result(addr_id: int, match_type: str, name: str, score: float):
             if addr_id not in seen_addresses:
-                addr = self.addresses[addr_id]
-                house_number = addr['tags'].get('addr:housenumber', '')
-                street_name = addr['tags'].get('addr:street', '')
-                print(f"Adding result: {street_name} {house_number} (type: {match_type}, score: {score})")
-                results.append({
+                lat, lon = self.addresses.coords(addr_id)
+                house_number = self.addresses.tag(addr_id, 'addr:housenumber', '')
+                result = {
                     'type': match_type,
                     'name': name,
-                    'lat': addr['lat'],
-                    'lon': addr['lon'],
-                    'full_address': self._format_address(addr['tags']),
+                    'lat': lat,
+                    'lon': lon,
+                    'full_address': None,  # filled in by finish()
                     'score': score,
-                    'house_number': house_number
-                })
+                    'house_number': house_number,
+                    'id': addr_id
+                }
+                if near:
+                    distance = haversine_distance(near[0], near[1], lat, lon) * 1000
+                    proximity = DISTANCE_SCALE / (DISTANCE_SCALE + distance)
+                    result['score'] = (1 - DISTANCE_WEIGHT) * score + DISTANCE_WEIGHT * proximity
+                    result['distance'] = round(distance, 1)
+                logger.debug("Adding result: %s (type: %s, score: %s)", name, match_type, result['score'])
+                results.append(result)
                 seen_addresses.add(addr_id)
 
         # If we have both street and number, prioritize exact building number matches
         if number:
             matching_streets = self._find_matching_streets(street_query)
-            print(f"\nFound {len(matching_streets)} matching streets")
+            logger.debug("Found %s matching streets", len(matching_streets))
             
+            target, target_suffix = parse_house_number(number)
+
             # Look for exact building number matches on matching streets
             for normalized_street in matching_streets:
-                exact_addr_key = f"{normalized_street}:{number}"
-                print(f"\nLooking for exact address: {exact_addr_key}")
-                if exact_addr_key in self.exact_addresses:
-                    print(f"Found exact match!")
-                    for addr_id in self.exact_addresses[exact_addr_key]:
+                logger.debug("Looking for exact address: %s:%s", normalized_street, number)
+                exact_ids = {addr_id for _, suffix, addr_id in self._find_house_numbers(normalized_street, target)
+                             if suffix == target_suffix}
+                if exact_ids:
+                    logger.debug("Found exact match")
+                    for addr_id in candidates(exact_ids):
                         add_result(addr_id, 'exact_address', f"{street_query} {number}", 1.0)
-                    if results:  # If we found exact matches, return them
-                        return results[:limit]
+                    # Without a location the first street's matches are as good as any;
+                    # with one, gather every street's so the closest can win
+                    if results and not near:
+                        return finish()
+            if results:
+                return finish()
 
             # If no exact matches, look for buildings on matching streets
-            print("\nLooking for buildings on matching streets...")
+            logger.debug("Looking for buildings on matching streets...")
             for normalized_street in matching_streets:
-                if normalized_street in self.streets:
-                    for addr_id in self.streets[normalized_street]:
-                        addr = self.addresses[addr_id]
-                        addr_number = addr['tags'].get('addr:housenumber')
-                        if addr_number:
-                            try:
-                                # Check if the house number matches
-                                if addr_number == number:
-                                    print(f"Found exact number match: {addr_number}")
-                                    add_result(addr_id, 'exact_address', f"{street_query} {number}", 1.0)
-                                else:
-                                    # Include nearby numbers with lower score
-                                    addr_num = int(addr_number)
-                                    target_num = int(number)
-                                    if abs(addr_num - target_num) <= 5:
-                                        print(f"Found nearby number: {addr_number}")
-                                        score = 0.9 - (abs(addr_num - target_num) * 0.1)
-                                        add_result(addr_id, 'nearby_address', f"{street_query} {addr_number}", score)
-                            except ValueError:
-                                continue
+                nearby = self._find_house_numbers(normalized_street, target, NEARBY_NUMBERS)
+                nearby_ids = candidates({addr_id for _, _, addr_id in nearby})
+                for addr_num, _, addr_id in nearby:
+                    if addr_id not in nearby_ids:
+                        continue
+                    addr_number = self.addresses.tag(addr_id, 'addr:housenumber')
+                    # Include nearby numbers (or the same number with another suffix) with lower score
+                    logger.debug("Found nearby number: %s", addr_number)
+                    score = 0.9 - (abs(addr_num - target) * 0.1)
+                    add_result(addr_id, 'nearby_address', f"{street_query} {addr_number}", score)
 
             # If still no results, show all buildings on the matching streets
             if not results:
-                print("\nNo exact or nearby matches found, showing all buildings on the street")
+                logger.debug("No exact or nearby matches found, showing all buildings on the street")
                 for normalized_street in matching_streets:
                     if normalized_street in self.streets:
-                        for addr_id in self.streets[normalized_street]:
-                            addr = self.addresses[addr_id]
-                            addr_number = addr['tags'].get('addr:housenumber')
+                        for addr_id in candidates(self.streets[normalized_street]):
+                            addr_number = self.addresses.tag(addr_id, 'addr:housenumber')
                             if addr_number:
                                 score = 0.5  # Lower score for other buildings on the street
                                 add_result(addr_id, 'street_address', f"{street_query} {addr_number}", score)
@@ -265,29 +437,101 @@ class AddressIndex:
             normalized_query = self._normalize_text(query)
             
             # Search in street names
-            for street in self.streets:
-                if normalized_query in street:
-                    score = self._calculate_similarity(normalized_query, street)
-                    for addr_id in self.streets[street]:
-                        add_result(addr_id, 'street', street, score)
+            for street in self.street_grams.containing(normalized_query):
+                score = self._calculate_similarity(normalized_query, street)
+                for addr_id in candidates(self.streets[street]):
+                    add_result(addr_id, 'street', street, score)
 
             # Search in neighborhoods
-            for neighborhood in self.neighborhoods:
-                if normalized_query in neighborhood:
-                    score = self._calculate_similarity(normalized_query, neighborhood)
-                    for addr_id in self.neighborhoods[neighborhood]:
-                        add_result(addr_id, 'neighborhood', neighborhood, score)
-
-            # Search in POIs
-            for poi_name in self.pois:
-                if normalized_query in self._normalize_text(poi_name):
-                    score = self._calculate_similarity(normalized_query, self._normalize_text(poi_name))
-                    for addr_id in self.pois[poi_name]:
+            for neighborhood in self.neighborhood_grams.containing(normalized_query):
+                score = self._calculate_similarity(normalized_query, neighborhood)
+                for addr_id in candidates(self.neighborhoods[neighborhood]):
+                    add_result(addr_id, 'neighborhood', neighborhood, score)
+
+            # Search in POIs (names are stored normalized)
+            for poi_name in self.poi_grams.containing(normalized_query):
+                score = self._calculate_similarity(normalized_query, poi_name)
+                for addr_id in candidates(self.pois[poi_name]):
+                    add_result(addr_id, 'poi', poi_name, score)
+
+            # Nothing contains the query; fall back to street and POI names within a few typos
+            if not results:
+                max_distance = self._typo_distance(normalized_query)
+                for street, _ in self.street_spell.lookup(normalized_query, max_distance):
+                    score = self._calculate_similarity(normalized_query, street)
+                    for addr_id in candidates(self.streets[street]):
+                        add_result(addr_id, 'street', street, score)
+                for poi_name, _ in self.poi_spell.lookup(normalized_query, max_distance):
+                    score = self._calculate_similarity(normalized_query, poi_name)
+                    for addr_id in candidates(self.pois[poi_name]):
                         add_result(addr_id, 'poi', poi_name, score)
 
         # Sort by score and limit results
-        results.sort(key=lambda x: x['score'], reverse=True)
-        return results[:limit]
+        return finish()
+
+    def _matches_category(self, tags, category: str) -> bool:
+        """
+        Check an entry against a reverse geocoding category: 'address' (has a
+        house number), 'poi' (named or typed place), a POI category key such
+        as 'amenity', or a POI type such as 'pharmacy'.
+        """
+        if category == 'address':
+            return 'addr:housenumber' in tags
+        if category == 'poi':
+            return 'name' in tags or any(key in tags for key in self.poi_categories)
+        if category in self.poi_categories:
+            return category in tags
+        return any(self._normalize_text(tags[key]) == category for key in self.poi_categories if key in tags)
+
+    def reverse(self, lat: float, lon: float, limit: int = 5, radius: float = None,
+                category: str = None) -> List[Dict]:
+        """
+        Find the addresses and POIs nearest to a point, closest first.
+        radius is in meters; category is one of the values accepted by
+        _matches_category().
+        """
+        point = (lon, lat, lon, lat)
+        if category:
+            category = self._normalize_text(category)
+
+        if radius is not None:
+            candidates = self._ids_within(lat, lon, radius)
+        else:
+            # rtree ranks by planar degree distance; widen the pool until enough entries pass the filter
+            wanted = limit * 4
+            while True:
+                candidates = set(self.spatial_idx.nearest(point, wanted))
+                matching = sum(1 for addr_id in candidates
+                               if not category or self._matches_category(self.addresses.view(addr_id), category))
+                if matching >= limit * 2 or len(candidates) < wanted or wanted >= len(self.addresses):
+                    break
+                wanted *= 4
+
+        nearest = []
+        for addr_id in candidates:
+            if category and not self._matches_category(self.addresses.view(addr_id), category):
+                continue
+            distance = haversine_distance(lat, lon, *self.addresses.coords(addr_id)) * 1000
+            if radius is None or distance <= radius:
+                nearest.append((distance, addr_id))
+        nearest.sort()
+
+        # Only the returned entries are formatted
+        results = []
+        for distance, addr_id in nearest[:limit]:
+            tags = self.addresses.view(addr_id)
+            addr_lat, addr_lon = self.addresses.coords(addr_id)
+            house_number = tags.get('addr:housenumber', '')
+            results.append({
+                'type': 'address' if house_number else 'poi',
+                'name': tags.get('name') or f"{tags.get('addr:street', '')} {house_number}".strip(),
+                'lat': addr_lat,
+                'lon': addr_lon,
+                'full_address': self._format_address(tags),
+                'distance': round(distance, 1),
+                'house_number': house_number
+            })
+        return results
 
     def _format_address(self, tags: Dict[str, str]) -> str:
         """Format address tags into a human-readable string."""
@@ -310,98 +554,202 @@ class AddressIndex:
         
         return ', '.join(parts)
 
+class AddressIndexer(OSMConsumer):
+    """Feeds address and POI elements from the ingest_osm() pipeline into an AddressIndex."""
+
+    def __init__(self, address_index: AddressIndex = None):
+        self.address_index = address_index or AddressIndex()
+        # (element type, OSM id) -> address id, so diffs can replace entries
+        self.element_ids: Dict[Tuple[str, int], int] = {}
+        # addr:interpolation way id -> ids of the addresses filled in along it
+        self.interpolated_ids: Dict[int, List[int]] = {}
+        # Nodes of the indexed building outlines and interpolation ways. Snapshots
+        # keep their coordinates, so diffs that only change such a way can re-index it
+        self.outline_refs = array('q')
+
+    def _address_tags(self, tags: Dict[str, str]) -> Dict[str, str]:
+        """Keep only the tags that carry address or POI information."""
+        return {
+            key: value for key, value in tags.items()
+            if (key.startswith('addr:') or 
+                key in {'name', 'place', 'building'} or 
+                key in self.address_index.poi_categories)
+        }
+
+    def node(self, node_id: int, lat: float, lon: float, node_tags: Dict[str, str]):
+        """Process nodes with address information or POIs."""
+        if not node_tags:
+            return
+        tags = self._address_tags(node_tags)
+        if tags and ('addr:housenumber' in tags or 'addr:street' in tags):
+            self.element_ids[('node', node_id)] = self.address_index.add_address(lat, lon, tags)
+
+    def way(self, way_id: int, refs: List[int], way_tags: Dict[str, str]):
+        """Process ways (buildings, etc.) at the center of their nodes."""
+        if way_tags.get('addr:interpolation'):
+            self._interpolate(way_id, refs, way_tags['addr:interpolation'])
+            return
+
+        # Get tags
+        tags = self._address_tags(way_tags)
+
+        # Check if it's a building with address information
+        is_building = (
+            tags.get('building') in {'yes', 'residential', 'apartments', 'house'} or
+            'addr:housenumber' in tags
+        )
+        if not (tags and is_building and ('addr:housenumber' in tags or 'addr:street' in tags)):
+            return
+
+        # Nodes come before ways in OSM extracts, so their coordinates are already stored
+        nodes = [coord for coord in map(self.coords.get, refs) if coord]
+        if nodes:
+            # Calculate center point
+            center_lat = sum(lat for lat, _ in nodes) / len(nodes)
+            center_lon = sum(lon for _, lon in nodes) / len(nodes)
+            self.element_ids[('way', way_id)] = self.address_index.add_address(center_lat, center_lon, tags)
+            self.outline_refs.extend(refs)
+
+    def _interpolate(self, way_id: int, refs: List[int], kind: str):
+        """
+        Add the house numbers between the numbered address nodes of an
+        addr:interpolation way, spaced evenly along the way between them.
+        """
+        step = INTERPOLATION_STEPS.get(kind)
+        if step is None:
+            return  # alphabetic and explicit number lists are not supported
+        # Numbered address nodes on the way, as (position in refs, number, tags)
+        anchors = []
+        for position, ref in enumerate(refs):
+            addr_id = self.element_ids.get(('node', ref))
+            if addr_id is None:
+                continue
+            tags = self.address_index.addresses.tags(addr_id)
+            parsed = parse_house_number(tags.get('addr:housenumber'))
+            if parsed and tags.get('addr:street'):
+                anchors.append((position, parsed[0], tags))
+
+        ids = []
+        for (start, first, tags), (end, last, _) in zip(anchors, anchors[1:]):
+            points = [self.coords.get(ref) for ref in refs[start:end + 1]]
+            if None in points or not 0 < abs(last - first) <= MAX_INTERPOLATED * step:
+                continue
+            shared = {key: value for key, value in tags.items()
+                      if key in ('addr:street', 'addr:suburb', 'addr:district', 'addr:city', 'addr:postcode')}
+            direction = step if last > first else -step
+            for number in range(first + direction, last, direction):
+                lat, lon = _point_along(points, (number - first) / (last - first))
+                ids.append(self.address_index.add_address(lat, lon, {
+                    **shared, 'addr:housenumber': str(number), 'addr:interpolation': kind}))
+        if ids:
+            self.interpolated_ids[way_id] = ids
+            self.outline_refs.extend(refs)
+
+    def apply_changes(self, changes: Iterable[Tuple[str, tuple]]) -> int:
+        """
+        Apply an osmChange stream (see routing.osc) to the index.
+
+        Changed or deleted nodes and ways lose their old entry and, unless
+        deleted, are indexed again. Building centers and interpolated house
+        numbers are only recomputed when the way itself is in the diff.
+        Returns the number of elements processed.
+        """
+        if self.coords is None:
+            self.coords = CoordinateStore()
+        ways = []
+        count = 0
+        for action, element in changes:
+            kind = element[0]
+            if kind not in ('node', 'way'):
+                continue
+            count += 1
+            addr_id = self.element_ids.pop((kind, element[1]), None)
+            if addr_id is not None:
+                self.address_index.remove_address(addr_id)
+            if kind == 'way':
+                for addr_id in self.interpolated_ids.pop(element[1], ()):
+                    self.address_index.remove_address(addr_id)
+            if action == 'delete':
+                continue
+            if kind == 'node':
+                _, node_id, lat, lon, tags = element
+                self.coords.add(node_id, lat, lon)
+                self.node(node_id, lat, lon, tags)
+            else:
+                ways.append(element)
+
+        # Index ways after all nodes, so new building outlines find their coordinates
+        for _, way_id, refs, tags in ways:
+            self.way(way_id, refs, tags)
+        return count
+
 class OSMGeocoder:
-    def __init__(self, osm_file: str):
+    def __init__(self, osm_file: str, workers: int = None):
         self.address_index = AddressIndex()
-        self._load_osm(osm_file)
-
-    def _load_osm(self, filename: str):
-        """Load OSM data and build address index."""
-        tree = ET.parse(filename)
-        root = tree.getroot()
-
-        # First pass: collect all nodes with their coordinates
-        node_coords = {}
-        for node in root.findall('.//node'):
-            node_id = node.get('id')
-            if node_id:
-                node_coords[node_id] = (
-                    float(node.get('lat')),
-                    float(node.get('lon'))
-                )
-
-        # Process nodes with address information or POIs
-        for node in root.findall('.//node'):
-            tags = {}
-            has_info = False
-            
-            for tag in node.findall('tag'):
-                key = tag.get('k')
-                value = tag.get('v')
-                if (key.startswith('addr:') or 
-                    key in {'name', 'place', 'building'} or 
-                    key in self.address_index.poi_categories):
-                    tags[key] = value
-                    has_info = True
-            
-            if has_info and ('addr:housenumber' in tags or 'addr:street' in tags):
-                self.address_index.add_address(
-                    float(node.get('lat')),
-                    float(node.get('lon')),
-                    tags
-                )
-
-        # Process ways (buildings, etc.)
-        for way in root.findall('.//way'):
-            tags = {}
-            has_info = False
-            nodes = []
-            
-            # Collect way nodes
-            for nd in way.findall('nd'):
-                ref = nd.get('ref')
-                if ref in node_coords:
-                    nodes.append(node_coords[ref])
-            
-            if nodes:
-                # Calculate center point
-                center_lat = sum(lat for lat, _ in nodes) / len(nodes)
-                center_lon = sum(lon for _, lon in nodes) / len(nodes)
-                
-                # Get tags
-                for tag in way.findall('tag'):
-                    key = tag.get('k')
-                    value = tag.get('v')
-                    if (key.startswith('addr:') or 
-                        key in {'name', 'place', 'building'} or 
-                        key in self.address_index.poi_categories):
-                        tags[key] = value
-                        has_info = True
-
-                # Check if it's a building with address information
-                is_building = (
-                    tags.get('building') in {'yes', 'residential', 'apartments', 'house'} or
-                    'addr:housenumber' in tags
-                )
-                
-                if has_info and is_building and ('addr:housenumber' in tags or 'addr:street' in tags):
-                    self.address_index.add_address(
-                        center_lat,
-                        center_lon,
-                        tags
-                    )
+        self.indexer = AddressIndexer(self.address_index)
+        self._init_changes()
+        self._load_osm(osm_file, workers)
+
+    @classmethod
+    def from_index(cls, address_index: AddressIndex, indexer: AddressIndexer = None) -> 'OSMGeocoder':
+        """
+        Create a geocoder around an index built elsewhere, e.g. by a shared
+        ingest_osm() run. Pass the indexer that built it to follow map diffs.
+        """
+        geocoder = cls.__new__(cls)
+        geocoder.address_index = address_index
+        geocoder.indexer = indexer
+        geocoder._init_changes()
+        return geocoder
+
+    def _init_changes(self):
+        # Every published diff applies on top of the extract, so start from the first one
+        self.change_log = change_log
+        self.overlay_store = overlay_store
+        self._change_sequence = 0
+        self._synced_version = None
+        # Built on the first autocomplete call and again after diffs change the names
+        self._completer = None
+        # Diffs change the index in place, so applying one and looking something up exclude each other
+        self._lock = threading.Lock()
+
+    def sync_changes(self) -> int:
+        """
+        Apply map diffs published since the last call; returns how many were
+        applied. Only a stat() of the overlay file is paid while the version
+        is unchanged. Lookups wait until the diffs are in.
+        """
+        if self.indexer is None or self.overlay_store.version == self._synced_version:
+            return 0
+        with self._lock:
+            version = self.overlay_store.version
+            if version == self._synced_version:
+                return 0
+            applied = 0
+            for sequence, path in self.change_log.pending(self._change_sequence):
+                self.indexer.apply_changes(iter_osc_changes(path))
+                self._change_sequence = sequence
+                applied += 1
+            if applied:
+                self._completer = None
+            self._synced_version = version
+        return applied
+
+    def _load_osm(self, filename: str, workers: int = None):
+        """Load OSM data (.osm or .osm.pbf) and build address index."""
+        ingest_osm(filename, [self.indexer], workers=workers)
 
         # Debug: Print some statistics
         print(f"Loaded addresses: {len(self.address_index.addresses)}")
         print(f"Streets: {len(self.address_index.streets)}")
         print(f"Exact addresses: {len(self.address_index.exact_addresses)}")
-        building_numbers = sum(1 for addr in self.address_index.addresses.values() 
-                             if 'addr:housenumber' in addr['tags'])
+        building_numbers = sum(1 for addr_id in self.address_index.addresses
+                               if self.address_index.addresses.tag(addr_id, 'addr:housenumber'))
         print(f"Addresses with building numbers: {building_numbers}")
         
         # Print some example addresses
         print("\nExample addresses:")
-        for i, addr in list(self.address_index.addresses.items())[:5]:
+        for i, addr in islice(self.address_index.addresses.items(), 5):
             print(f"Address {i}: {self.address_index._format_address(addr['tags'])}")
             if 'addr:housenumber' in addr['tags']:
                 print(f"  Building number: {addr['tags']['addr:housenumber']}")
@@ -409,6 +757,24 @@ class OSMGeocoder:
                 print(f"  Street: {addr['tags']['addr:street']}")
             print("---")
 
-    def search(self, query: str, limit: int = 10) -> List[Dict]:
-        """Search for addresses and POIs matching the query."""
-        return self.address_index.search(query, limit) 
\ No newline at end of file
+    def search(self, query: str, limit: int = 10, near: Tuple[float, float] = None,
+               radius: float = None) -> List[Dict]:
+        """Search for addresses and POIs matching the query, optionally biased towards near=(lat, lon)."""
+        self.sync_changes()
+        with self._lock:
+            return self.address_index.search(query, limit, near, radius)
+
+    def reverse(self, lat: float, lon: float, limit: int = 5, radius: float = None,
+                category: str = None) -> List[Dict]:
+        """Find the addresses and POIs nearest to a point."""
+        self.sync_changes()
+        with self._lock:
+            return self.address_index.reverse(lat, lon, limit, radius, category)
+
+    def autocomplete(self, prefix: str, limit: int = 10) -> List[Dict]:
+        """Best street, neighborhood and POI names starting with the prefix (or one of its words)."""
+        self.sync_changes()
+        with self._lock:
+            if self._completer is None:
+                self._completer = Autocompleter(self.address_index)
+            return self._completer.complete(prefix, limit)
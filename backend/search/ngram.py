@@ -0,0 +1,81 @@
+from typing import Dict, Iterable, Set
+
+def trigrams(text: str) -> Set[str]:
+    """Distinct character trigrams of a string (empty for strings shorter than 3)."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class TrigramIndex:
+    """
+    Inverted index from character trigrams to the normalized names that
+    contain them, used to narrow substring lookups down to a few candidates
+    before any string scoring runs.
+    """
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.postings: Dict[str, Set[str]] = {}
+        self.gram_counts: Dict[str, int] = {}  # name -> number of distinct trigrams
+        self.short_names: Set[str] = set()  # names too short to have a trigram
+        for name in names:
+            self.add(name)
+
+    def __len__(self) -> int:
+        return len(self.gram_counts)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.gram_counts
+
+    def add(self, name: str):
+        if name in self.gram_counts:
+            return
+        grams = trigrams(name)
+        self.gram_counts[name] = len(grams)
+        if not grams:
+            self.short_names.add(name)
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(name)
+
+    def remove(self, name: str):
+        if self.gram_counts.pop(name, None) is None:
+            return
+        self.short_names.discard(name)
+        for gram in trigrams(name):
+            names = self.postings.get(gram)
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del self.postings[gram]
+
+    def overlap(self, query: str) -> Dict[str, int]:
+        """Number of distinct trigrams each name shares with the query."""
+        counts: Dict[str, int] = {}
+        for gram in trigrams(query):
+            for name in self.postings.get(gram, ()):
+                counts[name] = counts.get(name, 0) + 1
+        return counts
+
+    def containing(self, query: str) -> Set[str]:
+        """Names that contain the query as a substring."""
+        grams = trigrams(query)
+        if not grams:
+            return {name for name in self.gram_counts if query in name}
+        # Intersect the rarest postings first so the working set stays small
+        postings = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+        candidates = set(postings[0])
+        for names in postings[1:]:
+            candidates &= names
+            if not candidates:
+                break
+        return {name for name in candidates if query in name}
+
+    def matches(self, query: str) -> Set[str]:
+        """Names that contain the query or are contained in it."""
+        query_count = len(trigrams(query))
+        if not query_count:
+            return self.containing(query) | {name for name in self.short_names if name in query}
+
+        found = {name for name in self.short_names if name in query}
+        for name, shared in self.overlap(query).items():
+            if ((shared == query_count and query in name) or
+                    (shared == self.gram_counts[name] and name in query)):
+                found.add(name)
+        return found
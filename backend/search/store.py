@@ -0,0 +1,179 @@
+"""
+Columnar storage for AddressIndex records.
+
+Instead of one dict per address holding another dict of tags, every field
+is a column indexed by address id: fixed-point coordinates in int32 arrays
+and one uint32 array per common tag, holding ids into a shared table of
+interned strings. A street name repeated on thousands of addresses is then
+stored once, and a record costs a few dozen bytes. Dict views of a record
+are only built when a caller asks for one.
+"""
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Iterator, Optional, Tuple
+
+# Coordinates are stored like OSM stores them: integers in units of 1e-7 degrees
+COORDINATE_SCALE = 10_000_000
+_DELETED = -2 ** 31
+
+# Tags that get their own column; any other tag goes to the per-record overflow
+COLUMN_TAGS = ('addr:street', 'addr:housenumber', 'addr:suburb', 'addr:district', 'addr:city',
+               'addr:postcode', 'name', 'building')
+
+class StringTable:
+    """Interned strings addressed by small integers; id 0 means no value."""
+
+    def __init__(self):
+        self.strings = [None]
+        self.ids: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.strings) - 1
+
+    def intern(self, text: str) -> int:
+        string_id = self.ids.get(text)
+        if string_id is None:
+            string_id = self.ids[text] = len(self.strings)
+            self.strings.append(text)
+        return string_id
+
+    def __getitem__(self, string_id: int) -> Optional[str]:
+        return self.strings[string_id]
+
+class TagView:
+    """Read-only, dict-like view of one record's tags that reads the columns on access."""
+    __slots__ = ('store', 'addr_id')
+
+    def __init__(self, store: 'AddressStore', addr_id: int):
+        self.store = store
+        self.addr_id = addr_id
+
+    def get(self, key: str, default: str = None) -> Optional[str]:
+        return self.store.tag(self.addr_id, key, default)
+
+    def __getitem__(self, key: str) -> str:
+        value = self.store.tag(self.addr_id, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        return self.store.tag(self.addr_id, key) is not None
+
+class AddressStore(Mapping):
+    """
+    Address id -> {'lat', 'lon', 'tags', 'id'} mapping backed by columns.
+    Ids are the AddressIndex's increasing ids; removed ids leave a hole.
+
+    The category column pair holds one POI category tag per record (key from
+    category_keys, interned value); a second one goes to the overflow.
+    """
+
+    def __init__(self, category_keys: Tuple[str, ...] = ()):
+        self.strings = StringTable()
+        self.category_keys = tuple(category_keys)
+        self.lats = array('i')
+        self.lons = array('i')
+        self.columns = {key: array('I') for key in COLUMN_TAGS}
+        self.category_key = array('B')  # 1-based index into category_keys, 0 for none
+        self.category_value = array('I')
+        self.overflow: Dict[int, Tuple[Tuple[int, int], ...]] = {}  # id -> interned (key, value) pairs
+        self.count = 0
+
+    def _slot(self, addr_id: int) -> int:
+        slot = addr_id - 1
+        if slot < 0 or slot >= len(self.lats) or self.lats[slot] == _DELETED:
+            raise KeyError(addr_id)
+        return slot
+
+    def add(self, addr_id: int, lat: float, lon: float, tags: Dict[str, str]):
+        slot = addr_id - 1
+        if slot < len(self.lats) and self.lats[slot] != _DELETED:
+            raise ValueError(f"Address id {addr_id} is already stored")
+        # Pad any ids that were never used
+        while len(self.lats) <= slot:
+            self.lats.append(_DELETED)
+            self.lons.append(0)
+            for column in self.columns.values():
+                column.append(0)
+            self.category_key.append(0)
+            self.category_value.append(0)
+
+        self.lats[slot] = round(lat * COORDINATE_SCALE)
+        self.lons[slot] = round(lon * COORDINATE_SCALE)
+        overflow = []
+        for key, value in tags.items():
+            column = self.columns.get(key)
+            if column is not None:
+                column[slot] = self.strings.intern(value)
+            elif key in self.category_keys and not self.category_key[slot]:
+                self.category_key[slot] = self.category_keys.index(key) + 1
+                self.category_value[slot] = self.strings.intern(value)
+            else:
+                overflow.append((self.strings.intern(key), self.strings.intern(value)))
+        if overflow:
+            self.overflow[addr_id] = tuple(overflow)
+        self.count += 1
+
+    def pop(self, addr_id: int, default=None):
+        """Remove a record and return its dict view, or default if it is not stored."""
+        try:
+            record = self[addr_id]
+        except KeyError:
+            return default
+        slot = addr_id - 1
+        self.lats[slot] = _DELETED
+        self.lons[slot] = 0
+        for column in self.columns.values():
+            column[slot] = 0
+        self.category_key[slot] = 0
+        self.category_value[slot] = 0
+        self.overflow.pop(addr_id, None)
+        self.count -= 1
+        return record
+
+    def coords(self, addr_id: int) -> Tuple[float, float]:
+        slot = self._slot(addr_id)
+        return self.lats[slot] / COORDINATE_SCALE, self.lons[slot] / COORDINATE_SCALE
+
+    def tag(self, addr_id: int, key: str, default: str = None) -> Optional[str]:
+        """One tag value, read straight from its column where it has one."""
+        slot = self._slot(addr_id)
+        column = self.columns.get(key)
+        if column is not None:
+            return self.strings[column[slot]] if column[slot] else default
+        if self.category_key[slot] and self.category_keys[self.category_key[slot] - 1] == key:
+            return self.strings[self.category_value[slot]]
+        for key_id, value_id in self.overflow.get(addr_id, ()):
+            if self.strings[key_id] == key:
+                return self.strings[value_id]
+        return default
+
+    def view(self, addr_id: int) -> TagView:
+        self._slot(addr_id)
+        return TagView(self, addr_id)
+
+    def tags(self, addr_id: int) -> Dict[str, str]:
+        slot = self._slot(addr_id)
+        tags = {key: self.strings[column[slot]] for key, column in self.columns.items() if column[slot]}
+        if self.category_key[slot]:
+            tags[self.category_keys[self.category_key[slot] - 1]] = self.strings[self.category_value[slot]]
+        for key_id, value_id in self.overflow.get(addr_id, ()):
+            tags[self.strings[key_id]] = self.strings[value_id]
+        return tags
+
+    def __getitem__(self, addr_id: int) -> Dict:
+        lat, lon = self.coords(addr_id)
+        return {'lat': lat, 'lon': lon, 'tags': self.tags(addr_id), 'id': addr_id}
+
+    def __contains__(self, addr_id) -> bool:
+        slot = addr_id - 1 if isinstance(addr_id, int) else -1
+        return 0 <= slot < len(self.lats) and self.lats[slot] != _DELETED
+
+    def __iter__(self) -> Iterator[int]:
+        for slot, lat in enumerate(self.lats):
+            if lat != _DELETED:
+                yield slot + 1
+
+    def __len__(self) -> int:
+        return self.count
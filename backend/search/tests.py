@@ -0,0 +1,340 @@
+import os
+import tempfile
+import unittest
+from routing.ingest import ingest_osm
+from routing.osc import iter_osc_changes
+from search.geocoder import AddressIndex, AddressIndexer, parse_house_number
+from search.ngram import TrigramIndex
+from search.fuzzy import SymSpell, edit_distance
+from search.autocomplete import Autocompleter, CompletionTrie
+from search.store import AddressStore
+from search.persist import SnapshotSpatialIndex, load_address_index, save_address_index
+
+class TestAddressSearch(unittest.TestCase):
+    """Test cases for AddressIndex lookups."""
+
+    def setUp(self):
+        self.index = AddressIndex()
+        self.ids = {}
+        for i, (street, number, extra) in enumerate([
+            ('Atatürk Bulvarı', '5', {}),
+            ('Atatürk Bulvarı', '7', {}),
+            ('Kızılay Sokak', '12', {'addr:suburb': 'Çankaya'}),
+            ('Tunalı Hilmi Caddesi', '3', {'name': 'Kuğulu Park', 'leisure': 'park'}),
+        ]):
+            tags = {'addr:street': street, 'addr:housenumber': number, **extra}
+            self.ids[(street, number)] = self.index.add_address(39.9 + i * 0.001, 32.85, tags)
+
+    def search(self, query, limit=10):
+        return self.index.search(query, limit)
+
+    def test_exact_addresses(self):
+        """Exact address keys are read from the house number table."""
+        extra = self.index.add_address(39.91, 32.85, {'addr:street': 'Atatürk Bulvarı', 'addr:housenumber': '7A'})
+        exact = self.index.exact_addresses
+        self.assertEqual(exact['ataturk:7'], {self.ids[('Atatürk Bulvarı', '7')]})
+        self.assertEqual(exact['ataturk:7A'], {extra})
+        self.assertNotIn('ataturk:9', exact)
+        self.assertEqual(len(exact), 5)
+        self.index.remove_address(extra)
+        self.assertNotIn('ataturk:7A', exact)
+
+    def test_trigram_candidates(self):
+        """The trigram index finds substrings and names contained in the query."""
+        grams = TrigramIndex(['ataturk', 'kizilay', 'tunali hilmi', 'ab'])
+        self.assertEqual(grams.containing('tali'), set())
+        self.assertEqual(grams.containing('nali'), {'tunali hilmi'})
+        self.assertEqual(grams.matches('kizilay 3'), {'kizilay'})
+        self.assertIn('ab', grams.matches('abc'))
+        grams.remove('kizilay')
+        self.assertEqual(grams.containing('kiz'), set())
+
+    def test_symspell_lookup(self):
+        """Deletion dictionary lookups find terms within the edit distance."""
+        spell = SymSpell(['ataturk', 'kizilay', 'tunali hilmi', 'esat'])
+        self.assertEqual(spell.lookup('atatruk'), [('ataturk', 1)])
+        self.assertEqual(spell.lookup('kzlay'), [('kizilay', 2)])
+        self.assertEqual(spell.lookup('tunnali hlmi'), [('tunali hilmi', 2)])
+        self.assertEqual(spell.lookup('kzlay', max_distance=1), [])
+        self.assertEqual(edit_distance('esat', 'esta', 2), 1)
+        spell.remove('esat')
+        self.assertEqual(spell.lookup('esat'), [])
+
+    def test_search(self):
+        """Exact, partial, typo and POI queries go through the trigram candidates."""
+        self.assertEqual(self.search('Atatürk Bulvarı 7')[0]['house_number'], '7')
+        self.assertEqual(self.search('ataturk 5')[0]['type'], 'exact_address')
+        self.assertEqual(self.search('Kizilai Sokak 12')[0]['house_number'], '12')
+        self.assertEqual(self.search('cankaya')[0]['type'], 'neighborhood')
+        self.assertEqual(self.search('kugulu')[0]['type'], 'poi')
+        # Typos, including dotless/dotted i and s/ş mix-ups from a Turkish keyboard
+        self.assertEqual(self.search('Kızılai Şokak 12')[0]['house_number'], '12')
+        self.assertEqual(self.search('kugulu prak')[0]['type'], 'poi')
+
+    def test_reverse(self):
+        """Reverse lookups return the nearest entries, with radius and category filters."""
+        results = self.index.reverse(39.9011, 32.85, limit=2)
+        self.assertEqual([r['house_number'] for r in results], ['7', '12'])
+        self.assertEqual(results[0]['full_address'], 'Atatürk Bulvarı 7, Ankara')
+        self.assertLess(results[0]['distance'], 15)
+        # The park is about 220 m away
+        self.assertEqual(self.index.reverse(39.9011, 32.85, radius=150, category='park'), [])
+        self.assertEqual(self.index.reverse(39.9011, 32.85, radius=300, category='park')[0]['name'], 'Kuğulu Park')
+        self.assertEqual(self.index.reverse(39.9011, 32.85, category='leisure')[0]['name'], 'Kuğulu Park')
+        self.assertEqual(len(self.index.reverse(39.9011, 32.85, radius=120)), 2)
+
+    def test_location_biased_search(self):
+        """near= ranks close matches first and radius= drops the rest before scoring."""
+        far_id = self.index.add_address(39.95, 32.85, {'addr:street': 'Atatürk Bulvarı', 'addr:housenumber': '5'})
+        results = self.index.search('Atatürk Bulvarı 5', near=(39.949, 32.85))
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0]['lat'], 39.95)
+        self.assertLess(results[0]['distance'], results[1]['distance'])
+
+        results = self.index.search('Atatürk Bulvarı 5', near=(39.9, 32.85), radius=1000)
+        self.assertEqual([r['lat'] for r in results], [39.9])
+        self.assertEqual(self.index.search('ataturk', near=(39.95, 32.85), radius=500)[0]['lat'], 39.95)
+        self.assertEqual(self.index.search('kugulu', near=(39.95, 32.85), radius=500), [])
+        self.assertEqual(self.index._ids_within(39.95, 32.85, 10), {far_id})
+
+    def test_completion_trie(self):
+        """Lookups end inside compressed edges and return the precomputed best entries."""
+        trie = CompletionTrie()
+        for entry_id, key in enumerate(['ankara', 'ankamall', 'anit', 'kizilay']):
+            trie.insert(key, entry_id)
+        trie.build([1.0, 3.0, 2.0, 5.0], k=2)
+        self.assertEqual(trie.lookup('an'), (1, 2))
+        self.assertEqual(trie.lookup('ankar'), (0,))
+        self.assertEqual(trie.lookup(''), (3, 1))
+        self.assertEqual(trie.lookup('ankaraa'), ())
+
+    def test_autocomplete(self):
+        """Names complete from their start or any word, bigger names first."""
+        self.index.add_address(39.95, 32.85, {'addr:street': 'Atatürk Bulvarı', 'addr:housenumber': '9'})
+        completer = Autocompleter(self.index)
+        self.assertEqual([(r['type'], r['name']) for r in completer.complete('ata')],
+                         [('street', 'Atatürk Bulvarı')])
+        self.assertEqual(completer.complete('BULV')[0]['count'], 3)
+        self.assertEqual([r['type'] for r in completer.complete('k')], ['poi', 'street'])
+        self.assertEqual(completer.complete('çank')[0]['name'], 'Çankaya')
+        self.assertEqual(completer.complete('park', limit=1)[0]['name'], 'Kuğulu Park')
+        self.assertEqual(completer.complete('xyz'), [])
+
+    def test_house_numbers(self):
+        """Numbers with letter and slash suffixes are found by bisect, exactly or nearby."""
+        self.assertEqual(parse_house_number('12'), (12, ''))
+        self.assertEqual(parse_house_number('12 A'), (12, 'a'))
+        self.assertEqual(parse_house_number('12/3'), (12, '/3'))
+        self.assertIsNone(parse_house_number('A blok'))
+
+        for number in ('7A', '9/3'):
+            self.ids[('Atatürk Bulvarı', number)] = self.index.add_address(
+                39.9, 32.86, {'addr:street': 'Atatürk Bulvarı', 'addr:housenumber': number})
+        self.assertEqual([n for n, _, _ in self.index.house_numbers['ataturk']], [5, 7, 7, 9])
+        self.assertEqual(self.search('Atatürk Bulvarı 7a')[0]['house_number'], '7A')
+        self.assertEqual(self.search('Atatürk Bulvarı 9/3')[0]['house_number'], '9/3')
+        # No 8 exists; 7 and 9 are one number away, 5 three
+        nearby = self.search('Atatürk Bulvarı 8')
+        self.assertEqual({r['type'] for r in nearby}, {'nearby_address'})
+        self.assertEqual(nearby[-1]['house_number'], '5')
+
+        self.index.remove_address(self.ids[('Atatürk Bulvarı', '7A')])
+        self.assertEqual([n for n, _, _ in self.index.house_numbers['ataturk']], [5, 7, 9])
+
+    def test_columnar_store(self):
+        """Records round-trip through interned columns, category pair and overflow."""
+        store = AddressStore(('shop', 'amenity'))
+        tags = {'addr:street': 'Atatürk Bulvarı', 'addr:housenumber': '5', 'amenity': 'cafe',
+                'shop': 'bakkal', 'addr:unit': '3'}
+        store.add(1, 39.9208289, 32.8540943, tags)
+        store.add(3, 39.92, 32.85, {'addr:street': 'Atatürk Bulvarı'})
+        self.assertEqual(store[1], {'lat': 39.9208289, 'lon': 32.8540943, 'tags': tags, 'id': 1})
+        self.assertEqual((store.tag(1, 'shop'), store.tag(1, 'addr:unit'), store.tag(3, 'name', '')),
+                         ('bakkal', '3', ''))
+        self.assertEqual((list(store), len(store), 2 in store), ([1, 3], 2, False))
+        # The street name is stored once
+        self.assertEqual(len(store.strings), 7)
+
+        self.assertEqual(store.pop(1)['tags']['amenity'], 'cafe')
+        self.assertIsNone(store.pop(1))
+        self.assertEqual((list(store), 1 in store), ([3], False))
+        self.assertEqual(self.index._format_address(self.index.addresses.view(self.ids[('Kızılay Sokak', '12')])),
+                         'Kızılay Sokak 12, Çankaya, Ankara')
+
+    def test_removal_updates_trigrams(self):
+        """Removing the last address of a name drops it from the trigram index."""
+        self.index.remove_address(self.ids[('Kızılay Sokak', '12')])
+        self.assertNotIn('kizilay', self.index.street_grams)
+        self.assertNotIn('cankaya', self.index.neighborhood_grams)
+        self.assertEqual(self.search('kizilay'), [])
+        self.index.remove_address(self.ids[('Atatürk Bulvarı', '5')])
+        self.assertIn('ataturk', self.index.street_grams)
+
+SAMPLE_OSM = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="39.900" lon="32.800"/>
+  <node id="2" lat="39.901" lon="32.801"/>
+  <node id="3" lat="39.902" lon="32.802"/>
+  <node id="4" lat="39.903" lon="32.803"/>
+  <node id="5" lat="39.950" lon="32.850"><tag k="amenity" v="cafe"/></node>
+  <way id="10">
+    <nd ref="1"/><nd ref="2"/><nd ref="3"/>
+    <tag k="highway" v="residential"/><tag k="name" v="Atatürk Caddesi"/>
+  </way>
+  <way id="11">
+    <nd ref="3"/><nd ref="4"/>
+    <tag k="highway" v="primary"/><tag k="oneway" v="yes"/><tag k="maxspeed" v="80"/>
+  </way>
+  <way id="12">
+    <nd ref="4"/><nd ref="5"/>
+    <tag k="building" v="yes"/>
+  </way>
+  <relation id="20">
+    <member type="way" ref="10" role="from"/>
+    <member type="node" ref="3" role="via"/>
+    <member type="way" ref="11" role="to"/>
+    <tag k="type" v="restriction"/><tag k="restriction" v="no_left_turn"/>
+  </relation>
+</osm>
+"""
+
+SAMPLE_OSC = """<?xml version="1.0" encoding="UTF-8"?>
+<osmChange version="0.6">
+  <modify>
+    <node id="2" lat="39.9015" lon="32.8005"/>
+  </modify>
+  <create>
+    <node id="6" lat="39.904" lon="32.804"/>
+    <node id="7" lat="39.9005" lon="32.8005">
+      <tag k="addr:street" v="Atatürk Caddesi"/><tag k="addr:housenumber" v="7"/>
+    </node>
+    <way id="13">
+      <nd ref="4"/><nd ref="6"/>
+      <tag k="highway" v="residential"/>
+    </way>
+  </create>
+  <delete>
+    <way id="11"/>
+  </delete>
+</osmChange>
+"""
+
+class TestAddressIndexer(unittest.TestCase):
+    """Test cases for building and persisting the address index from OSM files."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.osm_file = os.path.join(self.tmp_dir.name, 'sample.osm')
+        with open(self.osm_file, 'w', encoding='utf-8') as f:
+            f.write(SAMPLE_OSM)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_address_index_snapshot(self):
+        """A saved index loads without parsing, is rebuilt for a new extract and diffs never touch it."""
+        with open(self.osm_file, 'w', encoding='utf-8') as f:
+            f.write(SAMPLE_OSM.replace('  <way id="10">', '''  <node id="8" lat="39.9002" lon="32.8002">
+    <tag k="addr:street" v="Atatürk Caddesi"/><tag k="addr:housenumber" v="3"/>
+  </node>
+  <way id="10">''', 1))
+        cache_dir = os.path.join(self.tmp_dir.name, 'address_index')
+        self.assertIsNone(load_address_index(self.osm_file, cache_dir))
+
+        built = AddressIndexer()
+        ingest_osm(self.osm_file, [built])
+        path = save_address_index(built, self.osm_file, cache_dir)
+        snapshot_files = {name: os.path.getmtime(os.path.join(path, name)) for name in os.listdir(path)}
+
+        indexer = load_address_index(self.osm_file, cache_dir)
+        address_index = indexer.address_index
+        self.assertIsInstance(address_index.spatial_idx, SnapshotSpatialIndex)
+        self.assertEqual(indexer.element_ids, {('node', 8): 1})
+        results = address_index.search('Atatürk Caddesi 3')
+        self.assertEqual((results[0]['type'], results[0]['house_number']), ('exact_address', '3'))
+
+        # Diffs go to the in-memory layer on top of the read-only rtree
+        indexer.apply_changes(iter_osc_changes(self._write_osc()))
+        indexer.apply_changes([('delete', ('node', 8, None, None, {}))])
+        bounds = (32.8, 39.9, 32.801, 39.901)
+        self.assertEqual(list(address_index.spatial_idx.intersection(bounds)), [2])
+        self.assertEqual(address_index.spatial_idx.nearest(bounds, 1), [2])
+        self.assertEqual({name: os.path.getmtime(os.path.join(path, name)) for name in os.listdir(path)},
+                         snapshot_files)
+        self.assertIsNotNone(load_address_index(self.osm_file, cache_dir))
+
+        # A different extract misses the cache; saving it replaces the old snapshot
+        with open(self.osm_file, 'a', encoding='utf-8') as f:
+            f.write('\n')
+        self.assertIsNone(load_address_index(self.osm_file, cache_dir))
+        new_path = save_address_index(built, self.osm_file, cache_dir)
+        self.assertNotEqual(new_path, path)
+        self.assertFalse(os.path.exists(path))
+
+    def test_snapshot_way_modify(self):
+        """A snapshot-loaded index re-indexes a building whose way changes without its nodes."""
+        with open(self.osm_file, 'w', encoding='utf-8') as f:
+            f.write(SAMPLE_OSM.replace('<tag k="building" v="yes"/>', '''<tag k="building" v="yes"/>
+    <tag k="addr:street" v="Konur Sokak"/><tag k="addr:housenumber" v="10"/>''', 1))
+        cache_dir = os.path.join(self.tmp_dir.name, 'address_index')
+        built = AddressIndexer()
+        ingest_osm(self.osm_file, [built])
+        save_address_index(built, self.osm_file, cache_dir)
+
+        indexer = load_address_index(self.osm_file, cache_dir)
+        self.assertEqual(indexer.address_index.search('Konur Sokak 10')[0]['type'], 'exact_address')
+        osc_file = os.path.join(self.tmp_dir.name, 'tags.osc')
+        with open(osc_file, 'w', encoding='utf-8') as f:
+            f.write("""<?xml version="1.0" encoding="UTF-8"?>
+<osmChange version="0.6">
+  <modify>
+    <way id="12">
+      <nd ref="4"/><nd ref="5"/>
+      <tag k="building" v="yes"/><tag k="name" v="Konur Apartmanı"/>
+      <tag k="addr:street" v="Konur Sokak"/><tag k="addr:housenumber" v="10"/>
+    </way>
+  </modify>
+</osmChange>
+""")
+        indexer.apply_changes(iter_osc_changes(osc_file))
+        results = indexer.address_index.search('Konur Sokak 10')
+        self.assertEqual(results[0]['type'], 'exact_address')
+        self.assertAlmostEqual(results[0]['lat'], 39.9265)
+
+    def _write_osc(self) -> str:
+        osc_file = os.path.join(self.tmp_dir.name, 'daily.osc')
+        with open(osc_file, 'w', encoding='utf-8') as f:
+            f.write(SAMPLE_OSC)
+        return osc_file
+
+    def test_address_interpolation(self):
+        """addr:interpolation ways fill in the numbers between their address nodes."""
+        with open(self.osm_file, 'w', encoding='utf-8') as f:
+            f.write("""<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="39.900" lon="32.800">
+    <tag k="addr:street" v="Mithatpaşa Caddesi"/><tag k="addr:housenumber" v="2"/>
+  </node>
+  <node id="2" lat="39.900" lon="32.802"/>
+  <node id="3" lat="39.902" lon="32.802">
+    <tag k="addr:street" v="Mithatpaşa Caddesi"/><tag k="addr:housenumber" v="10"/>
+  </node>
+  <way id="10">
+    <nd ref="1"/><nd ref="2"/><nd ref="3"/>
+    <tag k="addr:interpolation" v="even"/>
+  </way>
+</osm>
+""")
+        indexer = AddressIndexer()
+        ingest_osm(self.osm_file, [indexer])
+        address_index = indexer.address_index
+        self.assertEqual([n for n, _, _ in address_index.house_numbers['mithatpasa']], [2, 4, 6, 8, 10])
+        six = address_index.addresses[address_index.house_numbers['mithatpasa'][2][2]]
+        self.assertEqual((round(six['lat'], 6), round(six['lon'], 6)), (39.9, 32.802))
+        self.assertEqual(six['tags']['addr:interpolation'], 'even')
+
+        indexer.apply_changes([('delete', ('way', 10, None, None))])
+        self.assertEqual([n for n, _, _ in address_index.house_numbers['mithatpasa']], [2, 10])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,13 +2,45 @@ from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 import json
+import os
 from datetime import datetime
 from .routing.service import RoutingService
-from .search.geocoder import OSMGeocoder
+from .routing.osm_loader import OSMLoader
+from .routing.overpass import OVERPASS_CACHE_DIR, load_overpass_graph
+from .routing.ingest import ingest_osm
+from .search.geocoder import OSMGeocoder, AddressIndexer
+from .search.persist import load_address_index, save_address_index
+from .routing.geometry import GEOMETRY_FORMATS, format_geometry
 
-# Initialize services
-router = RoutingService("data/ankara.osm")
-geocoder = OSMGeocoder("data/ankara.osm")
+# Initialize services from a single read of the OSM extract. The address
+# index comes from its on-disk snapshot unless the extract has changed.
+OSM_FILE = "data/ankara.osm"
+# Where the routing graph comes from: 'osm' (the extract) or 'overpass', the
+# cached Overpass responses of the osmnx drive network, which route with
+# osmnx's one-way and speed rules like DirectionsView does
+ROUTING_GRAPH_SOURCE = os.environ.get('ROUTING_GRAPH_SOURCE', 'osm')
+OVERPASS_CACHE = os.environ.get('OVERPASS_CACHE', OVERPASS_CACHE_DIR)
+
+if ROUTING_GRAPH_SOURCE not in ('osm', 'overpass'):
+    raise ValueError(f"Unknown ROUTING_GRAPH_SOURCE: {ROUTING_GRAPH_SOURCE}")
+# The Overpass graph is built separately; the extract then only feeds the address index
+_graph_loader = OSMLoader() if ROUTING_GRAPH_SOURCE == 'osm' else None
+_graph_targets = [_graph_loader] if _graph_loader else []
+
+_address_indexer = load_address_index(OSM_FILE)
+if _address_indexer is None:
+    _address_indexer = AddressIndexer()
+    ingest_osm(OSM_FILE, _graph_targets + [_address_indexer])
+    save_address_index(_address_indexer, OSM_FILE)
+else:
+    # Diffs that add building outlines need the coordinates of existing nodes
+    _address_indexer.coords = ingest_osm(OSM_FILE, _graph_targets)
+if _graph_loader is not None:
+    router = RoutingService.from_graph(_graph_loader.get_graph(), loader=_graph_loader)
+else:
+    # Diffs are not filtered to the drive network like the Overpass query was, so this graph does not follow them
+    router = RoutingService.from_graph(load_overpass_graph(OVERPASS_CACHE))
+geocoder = OSMGeocoder.from_index(_address_indexer.address_index, indexer=_address_indexer)
 
 @csrf_exempt
 @require_http_methods(["GET"])
@@ -28,7 +60,13 @@ def search_address(request):
                 'error': 'Query must be at least 3 characters long'
             }, status=400)
         
-        results = geocoder.search(query, limit)
+        # Optional map center (and radius in meters) to bias results towards
+        near = None
+        if request.GET.get('lat') and request.GET.get('lon'):
+            near = (float(request.GET['lat']), float(request.GET['lon']))
+        radius = float(request.GET['radius']) if near and request.GET.get('radius') else None
+
+        results = geocoder.search(query, limit, near=near, radius=radius)
         
         return JsonResponse({
             'results': results
@@ -54,6 +92,15 @@ def calculate_route(request):
         start_lon = float(data['start_lon'])
         end_lat = float(data['end_lat'])
         end_lon = float(data['end_lon'])
+        geometry_format = data.get('geometry_format')
+        if geometry_format is not None and geometry_format not in GEOMETRY_FORMATS:
+            raise ValueError(f"Invalid geometry_format: {geometry_format}")
+        zoom = data.get('zoom')
+        if zoom is not None:
+            try:
+                zoom = float(zoom)
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid zoom level: {zoom!r}")
         
         # Get current time for traffic calculation
         current_time = datetime.now()
@@ -76,7 +123,8 @@ def calculate_route(request):
         # Format response
         response = {
             'route': {
-                'geometry': route_geometry,
+                'geometry': (format_geometry(route_geometry, geometry_format, zoom=zoom)
+                             if geometry_format else route_geometry),
                 'duration': time_minutes,
                 'distance': calculate_total_distance(route_geometry)
             },